@@ -0,0 +1,96 @@
+"""Benchmark the raw REPL installer against the original rshell installer, using a fake board on a pseudo-terminal.
+
+Run with ``hatch run bench-install`` or ``python -m benchmarks.install``. The rshell installer is only benchmarked if
+rshell is installed.
+"""
+
+from pathlib import Path
+from shutil import which
+from subprocess import run
+from tempfile import TemporaryDirectory
+from time import monotonic
+
+from rich import print as console
+from rich.progress import Progress
+from rich.table import Table
+
+from mqtt_house.lib.fake_board import FakeBoard
+from mqtt_house.lib.install import install
+from mqtt_house.lib.ota import prepare_update
+from mqtt_house.lib.repl import RawREPL
+from mqtt_house.settings import ConfigModel
+
+#: The time in seconds that the fake board needs to handle each execution.
+LATENCY = 0.005
+
+CONFIG = ConfigModel(
+    device={"name": "Benchmark", "domain": "local"},
+    mqtt={"server": "mqtt.local", "user": "user", "password": "password"},
+    wifi={"ssid": "ssid", "password": "password"},
+    entities=[],
+)
+
+
+def rshell(port: str, *args: str) -> bytes:
+    """Run a single rshell command against the board, returning its output."""
+    result = run(["rshell", "--quiet", "--port", port, *args], capture_output=True, check=False)  # noqa: S603,S607
+    return result.stdout
+
+
+def rshell_install(port: str, files: list[dict]) -> None:
+    """The call pattern of the original installer, which runs one rshell process per operation."""
+    rshell(port, "boards")
+    for line in rshell(port, "ls", "-l", "/pyboard").decode().split("\n"):
+        parts = line.strip().split(" ")
+        if len(parts) == 5 or len(parts) == 7:  # noqa: PLR2004
+            rshell(port, "rm", "-rf", f"/pyboard/{parts[-1]}")
+    with TemporaryDirectory() as tmp_dir:
+        source = Path(tmp_dir) / "file"
+        for file in files:
+            source.write_bytes(file["data"])
+            if "/" in file["filename"]:
+                rshell(port, "mkdir", f"/pyboard/{'/'.join(file['filename'].split('/')[:-1])}")
+            rshell(port, "cp", str(source), f"/pyboard/{file['filename']}")
+
+
+def session_per_operation_install(port: str, files: list[dict]) -> None:
+    """The call pattern of the original installer, opening a new raw REPL session for every operation."""
+    with RawREPL(port) as repl:
+        repl.clear()
+    for file in files:
+        with RawREPL(port) as repl:
+            repl.write_file(file["filename"], file["data"])
+
+
+def single_session_install(port: str, files: list[dict]) -> None:  # noqa: ARG001
+    """The raw REPL installer, which uses a single session for all operations."""
+    with Progress(disable=True) as progress:
+        install(CONFIG, progress, port)
+
+
+def main() -> None:
+    """Run the benchmark for each installer."""
+    _, files = prepare_update(CONFIG)
+    size = sum(len(file["data"]) for file in files)
+    installers = [("One raw REPL session per operation", session_per_operation_install)]
+    if which("rshell") is not None:
+        installers.insert(0, ("rshell (one process per operation)", rshell_install))
+    else:
+        console("rshell is not installed, skipping the rshell installer")
+    installers.append(("Single raw REPL session", single_session_install))
+    table = Table("Installer", "Duration", "Executions", "Throughput")
+    for name, installer in installers:
+        with TemporaryDirectory() as tmp_dir, FakeBoard(Path(tmp_dir), latency=LATENCY) as board:
+            start = monotonic()
+            installer(board.port, files)
+            duration = monotonic() - start
+            if board.files() != {file["filename"]: file["data"] for file in files}:
+                table.add_row(name, "Failed: the files on the board do not match", "", "")
+                continue
+            table.add_row(name, f"{duration:.2f}s", f"{board.executions}", f"{size / duration / 1024:.1f} KiB/s")
+    console(f"Installing {len(files)} files ({size:,} bytes) with {LATENCY * 1000:.0f}ms per board execution")
+    console(table)
+
+
+if __name__ == "__main__":
+    main()
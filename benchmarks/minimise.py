@@ -0,0 +1,64 @@
+"""Benchmark the tokenizer-based minimiser against the original regular expression minimiser.
+
+Run with ``hatch run bench-minimise`` or ``python -m benchmarks.minimise``.
+"""
+
+import re
+import zlib
+from importlib import resources
+from timeit import timeit
+
+from rich import print as console
+from rich.table import Table
+
+from mqtt_house.lib.minimise import minimise_file
+
+REPEATS = 20
+
+
+def regex_minimise_file(data: bytes) -> bytes:
+    """The original line-based minimiser, which strips comment lines, empty lines, and docstring lines."""
+    result = []
+    in_comment = False
+    for line in data.decode("utf-8").split("\n"):
+        if re.match(r"\s*#.*", line):
+            continue
+        elif line.strip() == "":
+            continue
+        elif re.match(r"\s*'''.*'''\s*", line) or re.match(r'\s*""".*"""\s*', line):
+            continue
+        elif not in_comment and (re.match(r"\s*'''.*", line) or re.match(r'\s*""".*', line)):
+            in_comment = True
+            continue
+        elif in_comment and (re.match(r".*'''\s*", line) or re.match(r'.*"""\s*', line)):
+            in_comment = False
+            continue
+        elif in_comment:
+            continue
+        result.append(f"{line}\n")
+    return "".join(result).encode("utf-8")
+
+
+def main() -> None:
+    """Run the benchmark on all files in the mqtt_house.micro tree."""
+    base_path = resources.files("mqtt_house.micro")
+    sources = [path.read_bytes() for path in sorted(base_path.rglob("*.py"))]
+    source_size = sum(len(source) for source in sources)
+    table = Table("Minimiser", "Throughput", "Output size", "Reduction", "Compressed size")
+    table.add_row("None", "", f"{source_size:,}", "", f"{len(zlib.compress(b''.join(sources), 9)):,}")
+    for name, minimiser in (("Regular expressions", regex_minimise_file), ("Tokenizer", minimise_file)):
+        duration = timeit(lambda minimiser=minimiser: [minimiser(source) for source in sources], number=REPEATS)
+        output = b"".join(minimiser(source) for source in sources)
+        table.add_row(
+            name,
+            f"{source_size * REPEATS / duration / 1024 / 1024:.2f} MiB/s",
+            f"{len(output):,}",
+            f"{1 - len(output) / source_size:.1%}",
+            f"{len(zlib.compress(output, 9)):,}",
+        )
+    console(f"Minimising {len(sources)} files ({source_size:,} bytes), {REPEATS} repeats")
+    console(table)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,17 +5,26 @@ from typer import Typer
 
 from mqtt_house.__about__ import __version__
 from mqtt_house.cli.device import group as device_group
-from mqtt_house.lib.install import get_boards
+from mqtt_house.cli.fleet import group as fleet_group
+from mqtt_house.lib.install import get_board_name, get_boards
 
 app = Typer(help="MQTT House CLI Application")
 app.add_typer(device_group)
+app.add_typer(fleet_group)
 
 
 @app.command()
-def connected_boards() -> None:
-    """List connected boards."""
-    for name, device in get_boards():
-        console(f"{name} ({device})")
+def connected_boards(names: bool = False) -> None:  # noqa:FBT001,FBT002
+    """List the serial ports of connected boards.
+
+    Use --names to also show the name of the device installed on each board. This briefly interrupts the boards.
+    """
+    for port in get_boards():
+        if names:
+            name = get_board_name(port)
+            console(f"{port} ({name if name is not None else '[red]not responding[/red]'})")
+        else:
+            console(port)
 
 
 @app.command()
@@ -1,24 +1,30 @@
 """CLI commands for a single device"""
 
-from typing import Optional
+import asyncio
+from typing import Annotated, Optional
 
-from httpx import Client
 from rich import print as console
 from rich.progress import Progress
-from typer import FileBinaryRead, Typer
+from rich.table import Table
+from typer import Exit, FileBinaryRead, Option, Typer
 from yaml import safe_load
 
+from mqtt_house.lib.install import get_boards, install_boards
 from mqtt_house.lib.install import install as install_device
 from mqtt_house.lib.ota import (
+    MAX_UPLOAD_STREAMS,
     OTAError,
-    commit_update,
+    TransferStats,
+    create_client,
     get_device_host,
+    get_device_stats,
     get_device_version,
-    prepare_device,
-    prepare_update,
-    upload_files,
+    module_sources,
+    update_device,
 )
 from mqtt_house.lib.ota import reset as reset_device
+from mqtt_house.lib.plan import plan_device, plan_table
+from mqtt_house.lib.prune import prune_report as build_prune_report
 from mqtt_house.settings import ConfigModel
 from mqtt_house.util import slugify
 
@@ -26,40 +32,146 @@ group = Typer(name="device", help="Commands for a single device")
 
 
 @group.command()
-def install(config_file: FileBinaryRead, board: Optional[str] = None) -> None:
-    """Install to a locally connected board."""
+def install(  # noqa: PLR0917
+    config_file: FileBinaryRead,
+    board: Optional[str] = None,
+    mpy_version: Optional[str] = None,
+    all_boards: bool = False,  # noqa:FBT001,FBT002
+    full: bool = False,  # noqa:FBT001,FBT002
+    prune: bool = False,  # noqa:FBT001,FBT002
+) -> None:
+    """Install to a locally connected board.
+
+    Use --board to select the serial port of the board (see connected-boards), otherwise the first board found is
+    used. Use --all-boards to install to all connected boards at the same time. Only new and changed files are
+    copied, use --full to clear the board and copy all files. Use --mpy-version to install precompiled .mpy modules
+    for the board's bytecode version (for example 6.3). Use --prune to remove the code in the vendored libraries that
+    cannot run on the board (see prune-report).
+    """
     config = ConfigModel(**safe_load(config_file))
-    with Progress() as progress:
-        install_device(config, progress, board)
+    if all_boards:
+        boards = get_boards()
+        if not boards:
+            console(":x: [red bold]No board found")
+            raise Exit(code=1)
+        with Progress() as progress:
+            failures = install_boards(
+                [(config, board) for board in boards], progress, mpy_version=mpy_version, full=full, prune=prune
+            )
+        for port, error in failures.items():
+            console(f":x: [logging.level.error]{port}: {error}")
+        if failures:
+            console(f"[red bold]{len(failures)} of {len(boards)} boards failed to install.")
+            raise Exit(code=1)
+        console(f":heavy_check_mark: [green]Installed to all {len(boards)} boards.")
+    else:
+        with Progress() as progress:
+            install_device(config, progress, board, mpy_version=mpy_version, full=full, prune=prune)
+
+
+@group.command()
+def prune_report(config_file: FileBinaryRead, mpy_version: str = "6.3") -> None:
+    """Report how much --prune shrinks the vendored libraries shipped to a device.
+
+    The RAM saved when importing a module is estimated from the reduction in the size of its .mpy bytecode for the
+    --mpy-version, which needs mpy-cross to be installed.
+    """
+    config = ConfigModel(**safe_load(config_file))
+    table = Table("Module", "Size", "Pruned size", "Removed", "Estimated RAM saved")
+    total_removed = 0
+    total_ram_saved = 0
+    for stats in build_prune_report(module_sources(config), mpy_version=mpy_version):
+        total_removed += stats.removed
+        total_ram_saved += stats.ram_saved or 0
+        table.add_row(
+            stats.filename,
+            f"{stats.size:,}",
+            f"{stats.pruned_size:,}",
+            f"{stats.removed:,} ({stats.removed / stats.size:.0%})",
+            f"{stats.ram_saved:,}" if stats.ram_saved is not None else "mpy-cross not available",
+        )
+    table.add_row("Total", "", "", f"{total_removed:,}", f"{total_ram_saved:,}")
+    console(table)
 
 
 @group.command()
 def version(config_file: FileBinaryRead, host: str | None = None):
     """Get an OTA device's version."""
     config = ConfigModel(**safe_load(config_file))
-    try:
-        with Client(timeout=30) as client:
-            version = ".".join([str(c) for c in get_device_version(config, client, host=host)])
+
+    async def run() -> None:
+        async with create_client() as client:
+            version = ".".join([str(c) for c in await get_device_version(config, client, host=host)])
             console(f"Device version: {version}")
+
+    try:
+        asyncio.run(run())
+    except OTAError as e:
+        console(f":x: [logging.level.error]{e!s}")
+
+
+@group.command()
+def stats(config_file: FileBinaryRead, host: str | None = None):
+    """Show an OTA device's runtime statistics, such as the use of its inbound MQTT queue."""
+    config = ConfigModel(**safe_load(config_file))
+
+    async def run() -> None:
+        async with create_client() as client:
+            device_stats = await get_device_stats(config, client, host=host)
+            for name, values in device_stats.items():
+                table = Table("Statistic", "Value", title=name.capitalize())
+                for key, value in values.items():
+                    table.add_row(key.replace("_", " ").capitalize(), str(value))
+                console(table)
+
+    try:
+        asyncio.run(run())
     except OTAError as e:
         console(f":x: [logging.level.error]{e!s}")
 
 
 @group.command()
-def ota_update(
+def ota_update(  # noqa: PLR0917
     config_file: FileBinaryRead,
     host: str | None = None,
     upgrade_major_version: bool = False,  # noqa:FBT001,FBT002
+    full: bool = False,  # noqa:FBT001,FBT002
+    compress: bool = True,  # noqa:FBT001,FBT002
+    mpy: bool = False,  # noqa:FBT001,FBT002
+    bundle: bool = True,  # noqa:FBT001,FBT002
+    prune: bool = False,  # noqa:FBT001,FBT002
+    streams: Annotated[int, Option(min=1, max=MAX_UPLOAD_STREAMS)] = 1,
 ):
-    """Update a device via an OTA update."""
+    """Update a device via an OTA update.
+
+    Use --prune to remove the code in the vendored libraries that cannot run on the device (see prune-report). If the
+    files are not uploaded as a single bundle, use --streams to upload up to 4 files at the same time.
+    """
     config = ConfigModel(**safe_load(config_file))
-    try:
-        with Client(timeout=30) as client:
+
+    async def run() -> TransferStats:
+        async with create_client() as client:
             with Progress() as progress:
-                prepare_device(config, client, progress, host=host, upgrade_major_version=upgrade_major_version)
-                upload_files(*prepare_update(config), config, client, progress, host=host)
-                commit_update(config, client, progress, host=host)
-                reset_device(config, client, progress, host=host)
+                return await update_device(
+                    config,
+                    client,
+                    progress,
+                    host=host,
+                    upgrade_major_version=upgrade_major_version,
+                    full=full,
+                    compress=compress,
+                    mpy=mpy,
+                    bundle=bundle,
+                    prune=prune,
+                    streams=streams,
+                )
+
+    try:
+        stats = asyncio.run(run())
+        if stats.up_to_date:
+            console(f":heavy_check_mark: [green]The device {get_device_host(config, host=host)} is already up to date.")
+        else:
+            console(f"{stats.summary()}.")
             console(
                 f":heavy_check_mark: [green]The device {get_device_host(config, host=host)}"
                 " has been updated with the new configuration."
@@ -68,17 +180,48 @@ def ota_update(
         console(f":x: [logging.level.error]{e!s}")
 
 
+@group.command()
+def plan(  # noqa: PLR0917
+    config_file: FileBinaryRead,
+    host: str | None = None,
+    full: bool = False,  # noqa:FBT001,FBT002
+    compress: bool = True,  # noqa:FBT001,FBT002
+    mpy: bool = False,  # noqa:FBT001,FBT002
+    prune: bool = False,  # noqa:FBT001,FBT002
+):
+    """Plan an OTA update without running it.
+
+    Reports the files and bytes that the update would upload, the time it is predicted to take based on the
+    throughput measured in previous updates, and the flash and heap that the device will need. Takes the same options
+    as ota-update. Exits with an error if the device is expected to run out of flash or memory.
+    """
+    config = ConfigModel(**safe_load(config_file))
+
+    async def run():
+        async with create_client() as client:
+            return await plan_device(config, client, host=host, full=full, compress=compress, mpy=mpy, prune=prune)
+
+    result = asyncio.run(run())
+    console(plan_table([result]))
+    if result.warnings:
+        raise Exit(code=1)
+
+
 @group.command()
 def reset(config_file: FileBinaryRead, host: str | None = None):
     """Reset an OTA device."""
     config = ConfigModel(**safe_load(config_file))
-    try:
-        with Client(timeout=30) as client:
+
+    async def run() -> None:
+        async with create_client() as client:
             with Progress() as progress:
-                reset_device(config, client, progress, host=host)
-            console(
-                f":heavy_check_mark: [green]The device http://{slugify(config.device.name)}.{config.device.domain}"
-                " has been reset."
-            )
+                await reset_device(config, client, progress, host=host)
+
+    try:
+        asyncio.run(run())
+        console(
+            f":heavy_check_mark: [green]The device http://{slugify(config.device.name)}.{config.device.domain}"
+            " has been reset."
+        )
     except OTAError as e:
         console(f":x: [logging.level.error]{e!s}")
@@ -0,0 +1,153 @@
+"""CLI commands for a fleet of devices"""
+
+import asyncio
+from pathlib import Path
+from typing import Annotated, Optional
+
+from rich import print as console
+from rich.progress import Progress
+from typer import Argument, Exit, Option, Typer
+
+from mqtt_house.lib.fleet import load_configs, reset_fleet, update_fleet
+from mqtt_house.lib.install import install_boards
+from mqtt_house.lib.ota import MAX_UPLOAD_STREAMS, create_client
+from mqtt_house.lib.plan import plan_fleet, plan_table
+
+group = Typer(name="fleet", help="Commands for many devices at once")
+
+#: The configurations of the devices, given as files or directories of files.
+ConfigFiles = Annotated[
+    list[Path], Argument(help="Configuration files or directories of configuration files of the devices.")
+]
+
+#: The number of devices that are handled at the same time.
+Concurrency = Annotated[int, Option(min=1, help="The number of devices to handle at the same time.")]
+
+
+@group.command()
+def ota_update(
+    config_files: ConfigFiles,
+    *,
+    concurrency: Concurrency = 8,
+    upgrade_major_version: bool = False,
+    full: bool = False,
+    compress: bool = True,
+    mpy: bool = False,
+    bundle: bool = True,
+    prune: bool = False,
+    streams: Annotated[int, Option(min=1, max=MAX_UPLOAD_STREAMS)] = 1,
+):
+    """Update many devices via OTA updates.
+
+    Use --prune to remove the code in the vendored libraries that cannot run on the devices. If the files are not
+    uploaded as a single bundle, use --streams to upload up to 4 files to each device at the same time.
+    """
+    configs = load_configs(config_files)
+
+    async def run() -> dict[str, str]:
+        async with create_client() as client:
+            with Progress() as progress:
+                return await update_fleet(
+                    configs,
+                    client,
+                    progress,
+                    concurrency=concurrency,
+                    upgrade_major_version=upgrade_major_version,
+                    full=full,
+                    compress=compress,
+                    mpy=mpy,
+                    bundle=bundle,
+                    prune=prune,
+                    streams=streams,
+                )
+
+    failures = asyncio.run(run())
+    for name, error in failures.items():
+        console(f":x: [logging.level.error]{name}: {error}")
+    if failures:
+        console(f"[red bold]{len(failures)} of {len(configs)} devices failed to update.")
+        raise Exit(code=1)
+    console(f":heavy_check_mark: [green]All {len(configs)} devices have been updated.")
+
+
+@group.command()
+def plan(
+    config_files: ConfigFiles,
+    *,
+    concurrency: Concurrency = 8,
+    full: bool = False,
+    compress: bool = True,
+    mpy: bool = False,
+    prune: bool = False,
+):
+    """Plan the OTA updates of many devices without running them.
+
+    Takes the same options as ota-update. Exits with an error if any device is expected to run out of flash or memory.
+    """
+    configs = load_configs(config_files)
+
+    async def run():
+        async with create_client() as client:
+            return await plan_fleet(
+                configs, client, concurrency=concurrency, full=full, compress=compress, mpy=mpy, prune=prune
+            )
+
+    plans = asyncio.run(run())
+    console(plan_table(plans))
+    failures = [plan for plan in plans if plan.warnings]
+    if failures:
+        console(f"[red bold]{len(failures)} of {len(configs)} devices are expected to run out of flash or memory.")
+        raise Exit(code=1)
+    console(f":heavy_check_mark: [green]All {len(configs)} devices fit within their flash and memory.")
+
+
+@group.command()
+def install(
+    config_files: ConfigFiles,
+    *,
+    board: Annotated[list[str], Option(help="A DEVICE=PORT mapping of a device name to the serial port of its board.")],
+    mpy_version: Optional[str] = None,
+    full: bool = False,
+    prune: bool = False,
+):
+    """Install many devices to their locally connected boards at the same time.
+
+    Each device that is installed needs a --board mapping from its name to the serial port of its board (see
+    connected-boards). Only new and changed files are copied, use --full to clear the boards and copy all files. Use
+    --prune to remove the code in the vendored libraries that cannot run on the devices.
+    """
+    configs = {config.device.name: config for config in load_configs(config_files)}
+    targets = []
+    for mapping in board:
+        name, _, port = mapping.rpartition("=")
+        if name not in configs:
+            console(f":x: [red bold]No configuration found for the device {name}")
+            raise Exit(code=1)
+        targets.append((configs[name], port))
+    with Progress() as progress:
+        failures = install_boards(targets, progress, mpy_version=mpy_version, full=full, prune=prune)
+    for port, error in failures.items():
+        console(f":x: [logging.level.error]{port}: {error}")
+    if failures:
+        console(f"[red bold]{len(failures)} of {len(targets)} boards failed to install.")
+        raise Exit(code=1)
+    console(f":heavy_check_mark: [green]Installed to all {len(targets)} boards.")
+
+
+@group.command()
+def reset(config_files: ConfigFiles, *, concurrency: Concurrency = 8):
+    """Reset many devices and wait for them to come back."""
+    configs = load_configs(config_files)
+
+    async def run() -> dict[str, str]:
+        async with create_client() as client:
+            with Progress() as progress:
+                return await reset_fleet(configs, client, progress, concurrency=concurrency)
+
+    failures = asyncio.run(run())
+    for name, error in failures.items():
+        console(f":x: [logging.level.error]{name}: {error}")
+    if failures:
+        console(f"[red bold]{len(failures)} of {len(configs)} devices failed to reset.")
+        raise Exit(code=1)
+    console(f":heavy_check_mark: [green]All {len(configs)} devices have been reset.")
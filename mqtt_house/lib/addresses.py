@@ -0,0 +1,132 @@
+"""Remember the addresses of the devices, so that their names do not need to be resolved for every request."""
+
+import asyncio
+import json
+import socket
+from ipaddress import ip_address
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from time import time
+
+from httpx import AsyncBaseTransport, ConnectError, ConnectTimeout, Request, Response
+
+from mqtt_house.util import get_cache_dir
+
+#: The number of seconds for which a device's address is used, before its name is resolved again.
+ADDRESS_TTL = 3600
+
+
+class AddressBook:
+    """Maps device host names to their IP addresses, persisted in the file `path`.
+
+    Addresses are either resolved from a host name or announced by a device for its host name. Each address expires
+    after `ttl` seconds.
+    """
+
+    def __init__(self, path: Path, ttl: float = ADDRESS_TTL) -> None:
+        self._path = path
+        self._ttl = ttl
+        try:
+            with open(path) as in_f:
+                self._entries = json.load(in_f)
+        except (OSError, ValueError):
+            self._entries = {}
+
+    def _save(self) -> None:
+        with NamedTemporaryFile("w", dir=self._path.parent, delete=False) as out_f:
+            json.dump(self._entries, out_f)
+        Path(out_f.name).replace(self._path)
+
+    def get(self, host: str) -> str | None:
+        """Return the address of the host, or None if it is not known or has expired."""
+        entry = self._entries.get(host)
+        if entry is not None and entry[1] > time():
+            return entry[0]
+        return None
+
+    def put(self, host: str, address: str) -> None:
+        """Store the address for the host name."""
+        self._entries[host] = [address, time() + self._ttl]
+        self._save()
+
+    def forget(self, host: str) -> None:
+        """Forget the address of the host, so that it is resolved again."""
+        if self._entries.pop(host, None) is not None:
+            self._save()
+
+
+_books = {}
+
+
+def get_address_book() -> AddressBook:
+    """Return the shared address book for the current cache directory."""
+    path = get_cache_dir() / "addresses.json"
+    if path not in _books:
+        _books[path] = AddressBook(path)
+    return _books[path]
+
+
+def is_address(host: str) -> bool:
+    """Check whether the host is an IP address, rather than a name."""
+    try:
+        ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+
+async def resolve_address(host: str, port: int) -> str | None:
+    """Resolve the host name to its IPv4 address, returning None if it cannot be resolved."""
+    try:
+        addresses = await asyncio.get_running_loop().getaddrinfo(
+            host, port, family=socket.AF_INET, type=socket.SOCK_STREAM
+        )
+    except OSError:
+        return None
+    return addresses[0][4][0] if addresses else None
+
+
+class AddressBookTransport(AsyncBaseTransport):
+    """Sends requests to the address of their host that is stored in the address book.
+
+    Host names that are not in the address book are resolved and stored. The request keeps its Host header, only the
+    connection is made to the address. If the connection to an address fails, the address is forgotten. If the
+    address came from the address book, it may be out of date, so the host name is resolved again and the request
+    is retried once.
+    """
+
+    def __init__(self, transport: AsyncBaseTransport) -> None:
+        self._transport = transport
+
+    async def _resolve(self, request: Request, host: str) -> bool:
+        """Resolve the host name and store its address, returning whether it could be resolved."""
+        address = await resolve_address(host, request.url.port or 80)
+        if address is None:
+            return False
+        get_address_book().put(host, address)
+        request.url = request.url.copy_with(host=address)
+        return True
+
+    async def handle_async_request(self, request: Request) -> Response:
+        host = request.url.host
+        if is_address(host):
+            return await self._transport.handle_async_request(request)
+        url = request.url
+        address = get_address_book().get(host)
+        if address is not None:
+            request.url = url.copy_with(host=address)
+            try:
+                return await self._transport.handle_async_request(request)
+            except (ConnectError, ConnectTimeout):
+                get_address_book().forget(host)
+                request.url = url
+        if not await self._resolve(request, host):
+            return await self._transport.handle_async_request(request)
+        try:
+            return await self._transport.handle_async_request(request)
+        except (ConnectError, ConnectTimeout):
+            get_address_book().forget(host)
+            raise
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
@@ -0,0 +1,127 @@
+"""Watch the boot announcements that devices publish on MQTT."""
+
+import asyncio
+import ssl
+from collections.abc import Iterable
+from json import loads
+from time import monotonic
+
+from mqtt_house.lib.addresses import get_address_book
+from mqtt_house.settings import MQTTModel
+
+try:
+    import aiomqtt
+except ImportError:
+    aiomqtt = None
+
+#: The MQTT topic that a device publishes its boot announcement to.
+BOOTED_TOPIC = "mqtt-house/{identifier}/booted"
+
+#: The number of seconds to wait for the broker to respond, before the watcher is treated as unavailable.
+BROKER_TIMEOUT = 5
+
+
+class BootWatcher:
+    """Receives the retained boot announcements that devices publish after connecting to the MQTT broker.
+
+    Use as an async context manager. The watcher is only available if aiomqtt is installed and the broker can be
+    reached, otherwise callers need to fall back to polling the devices. The addresses that devices announce are
+    stored in the address book for their host names ``<slug>.<domain>`` in the given `domains`.
+    """
+
+    def __init__(self, mqtt: MQTTModel, domains: Iterable[str] = ()) -> None:
+        self._mqtt = mqtt
+        self._domains = set(domains)
+        self._client = None
+        self._connected = False
+        self._listener = None
+        self._announcements = {}
+        self._events = {}
+
+    @property
+    def available(self) -> bool:
+        """Whether the watcher is connected to the broker."""
+        return self._connected
+
+    async def __aenter__(self) -> "BootWatcher":
+        if aiomqtt is None:
+            return self
+        client = aiomqtt.Client(
+            self._mqtt.server,
+            port=8883 if self._mqtt.ssl else 1883,
+            username=self._mqtt.user,
+            password=self._mqtt.password,
+            tls_context=ssl.create_default_context() if self._mqtt.ssl else None,
+            timeout=BROKER_TIMEOUT,
+        )
+        try:
+            await client.__aenter__()
+        except aiomqtt.MqttError:
+            return self
+        self._client = client
+        try:
+            await client.subscribe(BOOTED_TOPIC.format(identifier="+"), qos=1)
+        except aiomqtt.MqttError:
+            await self.__aexit__()
+            return self
+        self._connected = True
+        self._listener = asyncio.create_task(self._listen())
+        return self
+
+    async def __aexit__(self, *args: object) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+        if self._client is not None:
+            try:
+                await self._client.__aexit__(None, None, None)
+            except aiomqtt.MqttError:
+                pass
+            self._client = None
+            self._connected = False
+
+    async def _listen(self) -> None:
+        try:
+            async for message in self._client.messages:
+                self.handle(str(message.topic), message.payload, retained=message.retain)
+        except aiomqtt.MqttError:
+            self._connected = False
+
+    def handle(self, topic: str, payload: bytes, *, retained: bool = False) -> None:
+        """Handle a boot announcement received on the topic, storing the announced address in the address book.
+
+        Retained announcements are replayed on subscribing and may be from any earlier boot, even if the device has
+        not reset yet, so they are ignored.
+        """
+        if retained:
+            return
+        identifier = topic.split("/")[1]
+        try:
+            announcement = loads(payload)
+        except ValueError:
+            return
+        if not isinstance(announcement, dict):
+            return
+        self._announcements[identifier] = announcement
+        if "ip" in announcement:
+            for domain in self._domains:
+                get_address_book().put(f"{identifier}.{domain}", announcement["ip"])
+        if identifier in self._events:
+            self._events.pop(identifier).set()
+
+    async def wait(self, identifier: str, previous_boot_id: str, timeout: float) -> dict | None:
+        """Wait for the device to announce a boot with a boot id that differs from `previous_boot_id`.
+
+        Returns the announcement or None if the device did not announce a new boot within `timeout` seconds.
+        """
+        deadline = monotonic() + timeout
+        while True:
+            announcement = self._announcements.get(identifier)
+            if announcement is not None and announcement.get("boot_id") != previous_boot_id:
+                return announcement
+            if identifier not in self._events:
+                self._events[identifier] = asyncio.Event()
+            try:
+                await asyncio.wait_for(self._events[identifier].wait(), max(deadline - monotonic(), 0))
+            except asyncio.TimeoutError:
+                return None
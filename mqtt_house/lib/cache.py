@@ -0,0 +1,108 @@
+"""Content-addressed cache for build artifacts."""
+
+import os
+from collections.abc import Callable
+from hashlib import sha256
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+
+from mqtt_house.util import get_cache_dir
+
+#: The default maximum size of the on-disk cache in bytes.
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+
+class BuildCache:
+    """A size-bounded, content-addressed cache for build artifacts.
+
+    Artifacts are held in memory for the lifetime of the process and stored on disk, so that they are shared between
+    devices and between invocations. When the on-disk cache grows beyond `max_size` bytes, the least recently used
+    artifacts are evicted.
+    """
+
+    def __init__(self, directory: Path, max_size: int = DEFAULT_MAX_SIZE) -> None:
+        """Initialise the cache in the given directory."""
+        self._directory = directory
+        self._max_size = max_size
+        self._memory = {}
+        self._size = None
+
+    @staticmethod
+    def key(*parts: bytes | str) -> str:
+        """Calculate the cache key for the given parts, which should include everything the artifact depends on."""
+        key = sha256()
+        for part in parts:
+            key.update(part.encode() if isinstance(part, str) else part)
+            key.update(b"\0")
+        return key.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self._directory / key[:2] / key
+
+    def get(self, key: str) -> bytes | None:
+        """Get the artifact for the key or None if it is not cached."""
+        if key in self._memory:
+            return self._memory[key]
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except OSError:
+            return None
+        self._memory[key] = data
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        """Store the artifact for the key."""
+        self._memory[key] = data
+        path = self._path(key)
+        if path.exists():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with NamedTemporaryFile("wb", dir=path.parent, delete=False) as out_f:
+            out_f.write(data)
+        Path(out_f.name).replace(path)
+        if self._size is not None:
+            self._size += len(data)
+        self.evict()
+
+    def get_or_build(self, key: str, build: Callable[[], bytes | None]) -> bytes | None:
+        """Get the artifact for the key, building and storing it if it is not cached.
+
+        If the build returns None, nothing is stored.
+        """
+        data = self.get(key)
+        if data is None:
+            data = build()
+            if data is not None:
+                self.put(key, data)
+        return data
+
+    def evict(self) -> None:
+        """Evict the least recently used artifacts until the cache fits within its maximum size."""
+        if self._size is not None and self._size <= self._max_size:
+            return
+        entries = []
+        for path in self._directory.glob("*/*"):
+            stat = path.stat()
+            entries.append((stat.st_mtime, stat.st_size, path))
+        self._size = sum(size for _, size, _ in entries)
+        entries.sort()
+        for _, size, path in entries:
+            if self._size <= self._max_size:
+                break
+            path.unlink(missing_ok=True)
+            self._memory.pop(path.name, None)
+            self._size -= size
+
+
+_caches = {}
+
+
+def get_build_cache() -> BuildCache:
+    """Return the shared build cache for the current cache directory."""
+    directory = get_cache_dir() / "build"
+    if directory not in _caches:
+        max_size = int(os.environ.get("MQTT_HOUSE_CACHE_SIZE", DEFAULT_MAX_SIZE))
+        _caches[directory] = BuildCache(directory, max_size=max_size)
+    return _caches[directory]
@@ -0,0 +1,210 @@
+"""A fake MicroPython board that provides a raw REPL on a pseudo-terminal, for testing and benchmarking installs."""
+
+import binascii
+import builtins
+import os
+import pty
+import select
+import threading
+import time
+import traceback
+import tty
+from pathlib import Path
+from types import SimpleNamespace
+
+#: The prompt that the board prints on entering the raw REPL.
+RAW_REPL_PROMPT = b"raw REPL; CTRL-B to exit\r\n>"
+
+
+class FakeBoard:
+    """Emulates the raw REPL of a MicroPython board, running the code it receives with CPython.
+
+    The board's filesystem is the `root` directory. Each code execution takes at least `latency` seconds, to account
+    for the time a real board needs to receive, compile, and run the code. If `raw_paste` is not set, the board only
+    supports the standard raw REPL.
+    """
+
+    def __init__(self, root: Path, *, latency: float = 0, raw_paste: bool = True, window_size: int = 128) -> None:
+        self.root = root
+        self.latency = latency
+        self.raw_paste = raw_paste
+        self.window_size = window_size
+        self.executions = 0
+        self.soft_resets = 0
+        self._master, self._slave = pty.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._running = True
+        self._namespace = {}
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self) -> "FakeBoard":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self._running = False
+        self._thread.join()
+        os.close(self._master)
+        os.close(self._slave)
+
+    def _read(self) -> bytes:
+        """Read a single byte from the host, returning an empty byte string if the board is stopped."""
+        while self._running:
+            ready, _, _ = select.select([self._master], [], [], 0.05)
+            if ready:
+                return os.read(self._master, 1)
+        return b""
+
+    def _write(self, data: bytes) -> None:
+        os.write(self._master, data)
+
+    def _run(self) -> None:
+        raw = False
+        code = b""
+        while self._running:
+            char = self._read()
+            if char == b"\x01":
+                raw = True
+                code = b""
+                self._write(RAW_REPL_PROMPT)
+            elif char == b"\x02":
+                raw = False
+                self._write(b"\r\nMicroPython fake board\r\n>>> ")
+            elif char == b"\x03" or (not raw and char == b"\r"):
+                code = b""
+                if not raw:
+                    self._write(b"\r\n>>> ")
+            elif raw and char == b"\x05":
+                if self._read() + self._read() != b"A\x01":
+                    continue
+                if self.raw_paste:
+                    self._write(b"R\x01" + self.window_size.to_bytes(2, "little"))
+                    self._execute(self._receive_paste())
+                else:
+                    self._write(b"R\x00")
+            elif not raw and char == b"\x04":
+                self.soft_resets += 1
+                self._namespace = {}
+                self._write(b"MPY: soft reboot\r\nMicroPython fake board\r\n>>> ")
+            elif raw and char == b"\x04" and code.strip() == b"":
+                # Soft reset
+                self.soft_resets += 1
+                self._namespace = {}
+                self._write(b"OK\r\nMPY: soft reboot\r\n" + RAW_REPL_PROMPT)
+                code = b""
+            elif raw and char == b"\x04":
+                self._write(b"OK")
+                self._execute(code)
+                code = b""
+            elif raw:
+                code += char
+
+    def _receive_paste(self) -> bytes:
+        """Receive code in raw-paste mode, granting the host a new window whenever one has been used up."""
+        code = bytearray()
+        received = 0
+        while True:
+            char = self._read()
+            if char in (b"\x04", b""):
+                self._write(b"\x04")
+                return bytes(code)
+            code += char
+            received += 1
+            if received == self.window_size:
+                received = 0
+                self._write(b"\x01")
+
+    def _execute(self, code: bytes) -> None:
+        """Run the code against the board's filesystem, streaming its output to the host, and send its error back."""
+        start = time.monotonic()
+        self.executions += 1
+        error = ""
+        namespace = self._namespace
+        namespace.update({"__builtins__": self._builtins(), "os": self._os()})
+        try:
+            exec(compile(code, "<stdin>", "exec"), namespace)  # noqa: S102
+        except Exception:
+            error = traceback.format_exc().replace("\n", "\r\n")
+        time.sleep(max(self.latency - (time.monotonic() - start), 0))
+        self._write(b"\x04" + error.encode() + b"\x04>")
+
+    def _path(self, path: str) -> Path:
+        return self.root / path.lstrip("/")
+
+    def _builtins(self) -> dict:
+        """Return the builtins, with the board's modules, open, and print mapped to the board's filesystem and serial
+        port."""
+        modules = {"os": self._os(), "sys": self._sys(), "binascii": binascii, "time": self._time()}
+        modules.update({f"u{name}": module for name, module in modules.items()})
+        stdout = modules["sys"].stdout
+
+        def board_import(name: str, *args: object, **kwargs: object) -> object:
+            if name in modules:
+                return modules[name]
+            return builtins.__import__(name, *args, **kwargs)
+
+        def board_open(path: str, mode: str = "r", *args: object, **kwargs: object) -> object:
+            return open(self._path(path), mode, *args, **kwargs)
+
+        def board_print(*args: object, sep: str = " ", end: str = "\n", file: object = None) -> None:  # noqa: ARG001
+            stdout.write(sep.join(str(arg) for arg in args) + end)
+
+        return {**vars(builtins), "__import__": board_import, "open": board_open, "print": board_print}
+
+    def _sys(self) -> SimpleNamespace:
+        """Return the subset of the sys module used on the board, with stdin and stdout connected to the host.
+
+        As on a real board, output is sent to the host as it is written, with newlines translated to CR LF.
+        """
+
+        def readinto(buffer: bytearray, size: int | None = None) -> int:
+            size = len(buffer) if size is None else size
+            for idx in range(size):
+                buffer[idx : idx + 1] = self._read()
+            return size
+
+        def write(data: str) -> int:
+            self._write(data.replace("\n", "\r\n").encode())
+            return len(data)
+
+        return SimpleNamespace(
+            platform="rp2",
+            implementation=SimpleNamespace(name="micropython"),
+            stdin=SimpleNamespace(buffer=SimpleNamespace(readinto=readinto), readinto=readinto),
+            stdout=SimpleNamespace(buffer=SimpleNamespace(write=self._write), write=write),
+        )
+
+    def _time(self) -> SimpleNamespace:
+        """Return the subset of the time module used on the board, which represents times as plain tuples."""
+        return SimpleNamespace(
+            gmtime=lambda secs=None: tuple(time.gmtime(secs))[:8],
+            localtime=lambda secs=None: tuple(time.localtime(secs))[:8],
+            sleep=time.sleep,
+            sleep_ms=lambda ms: time.sleep(ms / 1000),
+            ticks_ms=lambda: int(time.monotonic() * 1000),
+            time=lambda: int(time.time()),
+        )
+
+    def _os(self) -> SimpleNamespace:
+        """Return the subset of the os module used on the board, mapped to the board's filesystem."""
+
+        def remove(path: str) -> None:
+            if self._path(path).is_dir():
+                raise OSError(21, "Is a directory")
+            os.remove(self._path(path))
+
+        return SimpleNamespace(
+            listdir=lambda path="": sorted(os.listdir(self._path(path))),
+            mkdir=lambda path: os.mkdir(self._path(path)),
+            remove=remove,
+            rmdir=lambda path: os.rmdir(self._path(path)),
+            stat=lambda path: tuple(os.stat(self._path(path)))[:10],
+            uname=lambda: SimpleNamespace(sysname="rp2", machine="Fake board with RP2040"),
+        )
+
+    def files(self) -> dict[str, bytes]:
+        """Return the contents of all files on the board."""
+        return {
+            path.relative_to(self.root).as_posix(): path.read_bytes() for path in self.root.rglob("*") if path.is_file()
+        }
@@ -0,0 +1,165 @@
+"""Commands for handling many devices concurrently."""
+
+import asyncio
+from contextlib import AsyncExitStack
+from pathlib import Path
+
+from httpx import AsyncClient
+from rich.progress import Progress, TaskID
+from yaml import safe_load
+
+from mqtt_house.lib.announce import BootWatcher
+from mqtt_house.lib.ota import OTAError, reset, update_device
+from mqtt_house.settings import ConfigModel
+
+
+class DeviceProgress:
+    """Collapses the per-step progress tasks of a single device into one progress row.
+
+    Provides the subset of the :class:`~rich.progress.Progress` interface used by the OTA commands, so that they
+    can be run unchanged for many devices at the same time.
+    """
+
+    def __init__(self, progress: Progress, label: str) -> None:
+        """Add the progress row for the device."""
+        self._progress = progress
+        self._label = label
+        self._task = progress.add_task(f"{label}: Waiting", total=None, start=False)
+
+    def add_task(self, description: str, total: float | None = None, start: bool = True, **kwargs) -> TaskID:  # noqa: FBT001,FBT002
+        """Switch the device's row to the next step."""
+        self._progress.reset(
+            self._task, description=f"{self._label}: {description}", total=total, start=start, **kwargs
+        )
+        return self._task
+
+    def start_task(self, task: TaskID) -> None:  # noqa: ARG002
+        """Start the device's row."""
+        self._progress.start_task(self._task)
+
+    def update(self, task: TaskID, **kwargs) -> None:  # noqa: ARG002
+        """Update the device's row."""
+        self._progress.update(self._task, **kwargs)
+
+    def finish(self, message: str) -> None:
+        """Mark the device's row as finished with the given message."""
+        self._progress.update(self._task, description=f"{self._label}: {message}", total=1, completed=1)
+
+
+def load_configs(paths: list[Path]) -> list[ConfigModel]:
+    """Load the configurations from the given files or directories of YAML files."""
+    configs = []
+    for path in paths:
+        if path.is_dir():
+            filenames = sorted([*path.glob("*.yaml"), *path.glob("*.yml")])
+        else:
+            filenames = [path]
+        for filename in filenames:
+            with open(filename) as in_f:
+                configs.append(ConfigModel(**safe_load(in_f)))
+    return configs
+
+
+async def watch_fleet(stack: AsyncExitStack, configs: list[ConfigModel]) -> dict[str, BootWatcher]:
+    """Start watching the boot announcements of all devices, returning the watcher for each device name.
+
+    Devices that share an MQTT broker share a single watcher. The watchers are closed when the `stack` closes.
+    """
+    domains = {}
+    for config in configs:
+        domains.setdefault(tuple(config.mqtt.model_dump().values()), set()).add(config.device.domain)
+    brokers = {}
+    watchers = {}
+    for config in configs:
+        broker = tuple(config.mqtt.model_dump().values())
+        if broker not in brokers:
+            brokers[broker] = await stack.enter_async_context(BootWatcher(config.mqtt, domains[broker]))
+        watchers[config.device.name] = brokers[broker]
+    return watchers
+
+
+async def update_fleet(
+    configs: list[ConfigModel],
+    client: AsyncClient,
+    progress: Progress,
+    concurrency: int = 8,
+    *,
+    upgrade_major_version: bool = False,
+    full: bool = False,
+    compress: bool = True,
+    mpy: bool = False,
+    bundle: bool = True,
+    prune: bool = False,
+    streams: int = 1,
+) -> dict[str, str]:
+    """Run the OTA update for all devices, updating at most `concurrency` devices at the same time.
+
+    Returns the error message for each device that failed to update. A failing device never stops the other
+    devices from being updated.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    failures = {}
+
+    async def update(config: ConfigModel, watcher: BootWatcher) -> None:
+        device_progress = DeviceProgress(progress, config.device.name)
+        async with semaphore:
+            try:
+                stats = await update_device(
+                    config,
+                    client,
+                    device_progress,
+                    upgrade_major_version=upgrade_major_version,
+                    full=full,
+                    compress=compress,
+                    mpy=mpy,
+                    bundle=bundle,
+                    prune=prune,
+                    streams=streams,
+                    watcher=watcher,
+                )
+                if stats.up_to_date:
+                    device_progress.finish("[green]Up to date")
+                else:
+                    device_progress.finish(f"[green]Updated[/green] - {stats.summary()}")
+            except OTAError as e:
+                failures[config.device.name] = str(e)
+                device_progress.finish("[red]Failed")
+            except Exception as e:
+                # Any other error only fails this device, so that it cannot stop the rest of the fleet
+                failures[config.device.name] = f"Unexpected error: {e!r}"
+                device_progress.finish("[red]Failed")
+
+    async with AsyncExitStack() as stack:
+        watchers = await watch_fleet(stack, configs)
+        await asyncio.gather(*[update(config, watchers[config.device.name]) for config in configs])
+    return failures
+
+
+async def reset_fleet(
+    configs: list[ConfigModel], client: AsyncClient, progress: Progress, concurrency: int = 8
+) -> dict[str, str]:
+    """Reset all devices, resetting at most `concurrency` devices at the same time.
+
+    Each device is done as soon as it has come back. Returns the error message for each device that failed to reset.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    failures = {}
+
+    async def reset_device(config: ConfigModel, watcher: BootWatcher) -> None:
+        device_progress = DeviceProgress(progress, config.device.name)
+        async with semaphore:
+            try:
+                await reset(config, client, device_progress, watcher=watcher)
+                device_progress.finish("[green]Reset")
+            except OTAError as e:
+                failures[config.device.name] = str(e)
+                device_progress.finish("[red]Failed")
+            except Exception as e:
+                # Any other error only fails this device, so that it cannot stop the rest of the fleet
+                failures[config.device.name] = f"Unexpected error: {e!r}"
+                device_progress.finish("[red]Failed")
+
+    async with AsyncExitStack() as stack:
+        watchers = await watch_fleet(stack, configs)
+        await asyncio.gather(*[reset_device(config, watchers[config.device.name]) for config in configs])
+    return failures
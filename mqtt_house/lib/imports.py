@@ -0,0 +1,163 @@
+"""Resolve the modules that the code running on the device imports."""
+
+import ast
+from dataclasses import dataclass, field
+from functools import cache
+from importlib import resources
+
+
+@dataclass
+class Import:
+    """A single import of a module."""
+
+    module: str
+    """The absolute name of the imported module."""
+    names: set[str] | None
+    """The names imported from the module, or None if the whole module is imported."""
+
+
+@dataclass
+class ModuleImports:
+    """The imports of a module, split by whether they are always needed."""
+
+    imports: list[Import] = field(default_factory=list)
+    """The imports that are needed whenever the module is imported."""
+    functions: dict[str, tuple[list[Import], set[str]]] = field(default_factory=dict)
+    """The imports and referenced names of each top-level function, which are only needed if the function is."""
+    references: set[str] = field(default_factory=set)
+    """The names referenced by the code that runs whenever the module is imported."""
+
+
+@cache
+def read_resource(package: str, filename: str) -> bytes | None:
+    """Read a resource file, which does not change while the process runs. Returns None if it does not exist."""
+    item_file = resources.files(package)
+    for part in filename.split("/"):
+        item_file = item_file / part
+    if not item_file.is_file():
+        return None
+    return item_file.read_bytes()
+
+
+def module_filename(package: str, module: str) -> str | None:
+    """Return the filename of the module within the package, or None if it is not part of the package."""
+    path = module.replace(".", "/")
+    for filename in (f"{path}.py", f"{path}/__init__.py"):
+        if read_resource(package, filename) is not None:
+            return filename
+    return None
+
+
+def _referenced_names(node: ast.AST) -> set[str]:
+    """Return the names that are read within the node."""
+    return {child.id for child in ast.walk(node) if isinstance(child, ast.Name) and isinstance(child.ctx, ast.Load)}
+
+
+def _imports(node: ast.Import | ast.ImportFrom, module: str, is_package: bool) -> tuple[list[Import], set[str]]:  # noqa: FBT001
+    """Return the imports of the import statement within the module and the local names that they bind."""
+    if isinstance(node, ast.Import):
+        return (
+            [Import(alias.name, None) for alias in node.names],
+            {alias.asname or alias.name.split(".")[0] for alias in node.names},
+        )
+    base = node.module or ""
+    if node.level > 0:
+        parts = module.split(".")
+        parent = parts if is_package else parts[:-1]
+        parent = parent[: len(parent) - node.level + 1]
+        base = ".".join([*parent, base] if base else parent)
+    names = {alias.name for alias in node.names}
+    return [Import(base, None if "*" in names else names)], {alias.asname or alias.name for alias in node.names}
+
+
+def _function_imports(node: ast.AST, module: str, is_package: bool) -> list[Import]:  # noqa: FBT001
+    """Return the imports within the function whose bound names the function actually uses."""
+    references = _referenced_names(node)
+    result = []
+    for child in ast.walk(node):
+        if isinstance(child, (ast.Import, ast.ImportFrom)):
+            imports, bound = _imports(child, module, is_package)
+            if bound & references:
+                result.extend(imports)
+    return result
+
+
+@cache
+def parse_imports(package: str, module: str) -> ModuleImports:
+    """Parse the imports of the module within the package.
+
+    Module-level imports are always needed, except for imports within ``if`` statements, which depend on the runtime
+    configuration and need to be requested explicitly. Imports within functions are only followed if the function
+    uses the names that they bind. The imports of a top-level function are only needed if the function is.
+    """
+    filename = module_filename(package, module)
+    is_package = filename.endswith("/__init__.py")
+    tree = ast.parse(read_resource(package, filename), filename)
+    result = ModuleImports()
+
+    def visit(statements: list[ast.stmt]) -> None:
+        for node in statements:
+            if isinstance(node, (ast.Import, ast.ImportFrom)):
+                result.imports.extend(_imports(node, module, is_package)[0])
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                result.functions[node.name] = (_function_imports(node, module, is_package), _referenced_names(node))
+            elif isinstance(node, ast.ClassDef):
+                result.references.update(_referenced_names(node))
+                for child in ast.walk(node):
+                    if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                        result.imports.extend(_function_imports(child, module, is_package))
+            elif isinstance(node, ast.If):
+                result.references.update(_referenced_names(node))
+            else:
+                result.references.update(_referenced_names(node))
+                for name in ("body", "handlers", "orelse", "finalbody"):
+                    visit(getattr(node, name, []))
+
+    visit(tree.body)
+    return result
+
+
+def resolve_imports(package: str, roots: dict[str, set[str] | None]) -> list[str]:
+    """Return the filenames of all modules within the package that the `roots` need, sorted by filename.
+
+    The `roots` map module names to the names needed from them, or to None if the whole module is needed. Imports of
+    modules that are not part of the package, such as the firmware's built-in modules, are ignored.
+    """
+    needed = {}
+    pending = []
+
+    def request(module: str, names: set[str] | None) -> None:
+        if module_filename(package, module) is None:
+            return
+        parts = module.split(".")
+        for idx in range(1, len(parts)):
+            request(".".join(parts[:idx]), set())
+        if names is not None:
+            submodules = {name for name in names if module_filename(package, f"{module}.{name}") is not None}
+            for name in submodules:
+                request(f"{module}.{name}", None)
+        current = needed.get(module, set())
+        if module in needed and (current is None or (names is not None and names <= current)):
+            return
+        needed[module] = None if names is None or current is None else current | names
+        pending.append(module)
+
+    for module, names in roots.items():
+        request(module, names)
+    while pending:
+        module = pending.pop()
+        imports = parse_imports(package, module)
+        wanted = needed[module]
+        functions = set(imports.functions) if wanted is None else set()
+        queue = list(imports.references | (wanted or set()))
+        while queue:
+            name = queue.pop()
+            if name in imports.functions and name not in functions:
+                functions.add(name)
+                queue.extend(imports.functions[name][1])
+        for item in imports.imports:
+            request(item.module, item.names)
+        for name in functions:
+            for item in imports.functions[name][0]:
+                request(item.module, item.names)
+    return sorted(module_filename(package, module) for module in needed)
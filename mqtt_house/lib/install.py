@@ -1,80 +1,154 @@
 """Local installation commands."""
 
-import re
-from subprocess import run
-from tempfile import NamedTemporaryFile
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
 from typing import Optional
 
 from rich import print as console
 from rich.progress import Progress
+from serial.tools.list_ports import comports
 
+from mqtt_house.lib.fleet import DeviceProgress
 from mqtt_house.lib.ota import prepare_update
+from mqtt_house.lib.repl import RawREPL, RawREPLError
 from mqtt_house.settings import ConfigModel
 
+#: The USB vendor and product ids of boards running MicroPython (the RP2040 MicroPython port).
+MICROPYTHON_USB_IDS = {(0x2E8A, 0x0005)}
 
-def get_boards() -> list[tuple[str, str]]:
-    """Return a list of boards identified by rshell."""
-    boards = []
-    result = run(["rshell", "--quiet", "boards"], capture_output=True, check=False)  # noqa: S607
-    for line in result.stdout.decode("utf-8").split("\n"):
-        match = re.search(r"^([a-zA-Z0-9\-]+)\s*@\s*([a-zA-Z0-9\-/]+)", line)
-        if match:
-            boards.append((match.group(1), match.group(2)))
-    return boards
+#: The names of the boards that have been probed, by serial port.
+_board_names = {}
 
 
-def install(config: ConfigModel, progress: Progress, board: Optional[str] = None) -> None:
-    """Install to a given board."""
+def get_boards() -> list[str]:
+    """Return the serial ports of all connected boards running MicroPython.
+
+    Boards are identified by the USB vendor and product ids of their serial port, so nothing is sent to the boards.
+    """
+    return sorted(port.device for port in comports() if (port.vid, port.pid) in MICROPYTHON_USB_IDS)
+
+
+def get_board_name(board: str, timeout: float = 1) -> str | None:
+    """Return the name of the board connected to the serial port `board`, or None if it does not respond in time.
+
+    The name is the name of the device installed on the board or, if no device is installed, the board's machine name.
+    Probing interrupts the program running on the board, which is soft reset afterwards. Names are cached, so each
+    board is only probed once per session.
+    """
+    if board not in _board_names:
+        try:
+            with RawREPL(board, timeout=timeout, soft_reset=True) as repl:
+                output = repl.exec(
+                    "import os,json\n"
+                    "if 'config.json' in os.listdir():\n"
+                    " print(json.load(open('config.json'))['device']['name'])\n"
+                    "else:\n"
+                    " print(os.uname().machine)\n"
+                )
+            _board_names[board] = output.decode().strip()
+        except (OSError, RawREPLError):
+            return None
+    return _board_names[board]
+
+
+def install(
+    config: ConfigModel,
+    progress: Progress,
+    board: Optional[str] = None,
+    mpy_version: Optional[str] = None,
+    *,
+    full: bool = False,
+    prune: bool = False,
+) -> None:
+    """Install to the board connected to the serial port `board` or to the first board found.
+
+    The serial port is opened once and only the files that differ from the files on the board are written, from
+    memory via the board's raw REPL. If `full` is set, the board is cleared and all files are written. If `prune`
+    is set, the code in the vendored libraries that cannot run on the board is removed. If an `mpy_version` is given,
+    modules are installed as .mpy bytecode compiled for that bytecode version.
+    """
     task = progress.add_task("Checking for boards", total=None)
     progress.start_task(task)
-    target_board = None
-    for name, _ in get_boards():
-        if not board or board == name:
-            target_board = name
-            break
+    if board is None:
+        boards = get_boards()
+        board = boards[0] if boards else None
     progress.update(task, total=1, completed=1)
-    if target_board:
-        task = progress.add_task("Clearing old files", total=None)
-        result = run(  # noqa:S603
-            ["rshell", "--quiet", "ls", "-l", f"/{target_board}"],  # noqa:S607
-            capture_output=True,
-            check=False,
-        )
-        files = result.stdout.decode("utf-8").split("\n")
-        progress.update(task, total=len(files))
-        for line in files:
-            parts = line.strip().split(" ")
-            if len(parts) == 5 or len(parts) == 7:  # noqa: PLR2004
-                result = run(  # noqa: S603
-                    ["rshell", "--quiet", "rm", "-rf", f"/{target_board}/{parts[-1]}"],  # noqa: S607
-                    capture_output=True,
-                    check=False,
-                )
-            progress.update(task, advance=1)
-        _, files = prepare_update(config)
-        task = progress.add_task("Copying files", total=len(files))
-        for file in files:
-            with NamedTemporaryFile("bw", delete_on_close=False) as fp:
-                fp.write(file["data"])
-                fp.close()
-                if "/" in file["filename"]:
-                    run(  # noqa:S603
-                        [  # noqa:S607
-                            "rshell",
-                            "--quiet",
-                            "mkdir",
-                            f"/{target_board}/{'/'.join(file['filename'].split('/')[:-1])}",
-                        ],
-                        capture_output=True,
-                        check=False,
-                    )
-                run(  # noqa: S603
-                    ["rshell", "--quiet", "cp", fp.name, f"/{target_board}/{file['filename']}"],  # noqa:S607
-                    capture_output=True,
-                    check=False,
-                )
-            progress.update(task, advance=1)
-    elif board:
-        console(f":x: [red bold]Board {board} not found")
-    else:
+    if board is None:
         console(":x: [red bold]No board found")
+        return
+    _, files = prepare_update(config, mpy_version=mpy_version, prune=prune)
+    try:
+        write_files(files, progress, board, full=full)
+    except (OSError, RawREPLError) as e:
+        console(f":x: [red bold]Installing to the board at {board} failed: {e}")
+
+
+def write_files(files: list[dict], progress: Progress | DeviceProgress, board: str, *, full: bool = False) -> None:
+    """Write the files to the board connected to the serial port `board` in a single session.
+
+    The hashes of the files on the board are fetched in one execution, then stale files are removed and only new or
+    changed files are written. If `full` is set, the board is cleared and all files are written instead.
+    """
+    with RawREPL(board) as repl:
+        if full:
+            task = progress.add_task("Clearing old files", total=1)
+            repl.clear()
+            progress.update(task, completed=1)
+        else:
+            task = progress.add_task("Comparing files", total=1)
+            existing = repl.file_hashes()
+            hashes = {file["filename"]: sha256(file["data"]).hexdigest() for file in files}
+            directories = {
+                "/".join(filename.split("/")[:idx]) for filename in hashes for idx in range(1, filename.count("/") + 1)
+            }
+            stale = []
+            for path, filehash in sorted(existing.items()):
+                if any(path.startswith(f"{parent}/") for parent in stale):
+                    continue
+                if (filehash is None and path not in directories) or (filehash is not None and path not in hashes):
+                    stale.append(path)
+            files = [file for file in files if existing.get(file["filename"]) != hashes[file["filename"]]]
+            progress.update(task, completed=1)
+            task = progress.add_task("Removing stale files", total=1)
+            repl.remove(stale)
+            progress.update(task, completed=1)
+        task = progress.add_task("Copying files", total=sum(len(file["data"]) for file in files))
+        for file in files:
+            repl.write_file(file["filename"], file["data"])
+            progress.update(task, advance=len(file["data"]))
+
+
+def install_boards(
+    targets: list[tuple[ConfigModel, str]],
+    progress: Progress,
+    mpy_version: Optional[str] = None,
+    *,
+    full: bool = False,
+    prune: bool = False,
+) -> dict[str, str]:
+    """Install each configuration to the board connected to its serial port, installing to all boards concurrently.
+
+    The files are prepared once per distinct configuration, so that installing the same configuration to many boards
+    only builds it once. Each board gets its own serial session, in its own thread, and its own progress row. Returns
+    the error message for each board that failed.
+    """
+    builds = {}
+    for config, _ in targets:
+        key = config.model_dump_json()
+        if key not in builds:
+            builds[key] = prepare_update(config, mpy_version=mpy_version, prune=prune)[1]
+    failures = {}
+
+    def install_board(config: ConfigModel, board: str) -> None:
+        board_progress = DeviceProgress(progress, f"{config.device.name} @ {board}")
+        try:
+            write_files(builds[config.model_dump_json()], board_progress, board, full=full)
+            board_progress.finish("[green]Installed")
+        except (OSError, RawREPLError) as e:
+            failures[board] = str(e)
+            board_progress.finish("[red]Failed")
+
+    with ThreadPoolExecutor(max_workers=max(len(targets), 1)) as executor:
+        for future in [executor.submit(install_board, config, board) for config, board in targets]:
+            future.result()
+    return failures
@@ -0,0 +1,113 @@
+"""Minimise Python source files for the microcontroller."""
+
+import token
+import tokenize
+from io import BytesIO
+
+#: The version of the minimiser, which must be increased whenever the minimised output changes.
+MINIMISER_VERSION = "2"
+
+#: Token types that are dropped from the output.
+SKIPPED_TOKENS = (token.ENCODING, token.ENDMARKER, token.COMMENT, token.NL)
+
+#: The token types that start and end f-strings, which only exist on Python 3.12 and later.
+FSTRING_START = getattr(token, "FSTRING_START", None)
+FSTRING_END = getattr(token, "FSTRING_END", None)
+
+
+def _is_word_character(char: str) -> bool:
+    """Check whether the character can be part of a name or number."""
+    return char.isalnum() or char == "_"
+
+
+def _needs_space(previous: tokenize.TokenInfo, current: tokenize.TokenInfo) -> bool:
+    """Check whether two adjacent tokens on the same line must be separated by a space."""
+    if _is_word_character(previous.string[-1]) and (
+        _is_word_character(current.string[0]) or current.string[0] in "'\""
+    ):
+        return True
+    if previous.type in (token.STRING, FSTRING_END) and _is_word_character(current.string[0]):
+        return True
+    return previous.type == token.NUMBER and current.string.startswith(".")
+
+
+def _is_string_statement(line: list) -> bool:
+    """Check whether the logical line only consists of string literals, such as a docstring."""
+    return all(
+        tok.type == token.STRING and "f" not in tok.string[: tok.string.index(tok.string[-1])].lower() for tok in line
+    )
+
+
+def _join_line(source_lines: list[str], line: list[tokenize.TokenInfo]) -> str:
+    """Join the tokens of a logical line into the minimal source text."""
+    result = []
+    previous = None
+    fstring_depth = 0
+    fstring_start = None
+    for tok in line:
+        if fstring_depth > 0 or tok.type == FSTRING_START:
+            # f-strings are copied verbatim, as their contents are split into many tokens
+            if tok.type == FSTRING_START:
+                if fstring_depth == 0:
+                    fstring_start = tok
+                fstring_depth += 1
+            elif tok.type == FSTRING_END:
+                fstring_depth -= 1
+                if fstring_depth == 0:
+                    if previous is not None and _needs_space(previous, fstring_start):
+                        result.append(" ")
+                    result.append(_source_slice(source_lines, fstring_start.start, tok.end))
+                    previous = tok
+            continue
+        if previous is not None and _needs_space(previous, tok):
+            result.append(" ")
+        result.append(tok.string)
+        previous = tok
+    return "".join(result)
+
+
+def _source_slice(source_lines: list[str], start: tuple[int, int], end: tuple[int, int]) -> str:
+    """Return the source text between the start and end positions."""
+    if start[0] == end[0]:
+        return source_lines[start[0] - 1][start[1] : end[1]]
+    return "".join(
+        [
+            source_lines[start[0] - 1][start[1] :],
+            *source_lines[start[0] : end[0] - 1],
+            source_lines[end[0] - 1][: end[1]],
+        ]
+    )
+
+
+def minimise_file(data: bytes) -> bytes:
+    """Minimise the file size, stripping comments, docstrings, and unneeded whitespace.
+
+    Blocks are indented by a single space per level and statements that span multiple lines are joined into a single
+    line. Blocks that only contained a docstring are given a ``pass`` statement.
+    """
+    source_lines = data.decode("utf-8").splitlines(keepends=True)
+    result = []
+    depth = 0
+    # Tracks for each open block whether a statement has been output
+    block_used = [True]
+    line = []
+    for tok in tokenize.tokenize(BytesIO(data).readline):
+        if tok.type in SKIPPED_TOKENS:
+            continue
+        elif tok.type == token.INDENT:
+            depth += 1
+            block_used.append(False)
+        elif tok.type == token.DEDENT:
+            if not block_used.pop():
+                result.append(f"{' ' * depth}pass")
+            depth -= 1
+        elif tok.type == token.NEWLINE:
+            if not _is_string_statement(line):
+                result.append(f"{' ' * depth}{_join_line(source_lines, line)}")
+                block_used[-1] = True
+            line = []
+        else:
+            line.append(tok)
+    if result:
+        result.append("")
+    return "\n".join(result).encode("utf-8")
@@ -0,0 +1,63 @@
+"""Compile MicroPython modules to .mpy bytecode."""
+
+from functools import cache
+from pathlib import Path
+from shutil import which
+from subprocess import run
+from tempfile import TemporaryDirectory
+
+from mqtt_house.lib.cache import get_build_cache
+
+#: Modules that the MicroPython firmware only runs as source files.
+SOURCE_ONLY_FILES = ["main.py", "boot.py"]
+
+
+def normalise_bytecode_version(version: str) -> str:
+    """Normalise the bytecode version into the form that mpy-cross expects ("6.0" becomes "6")."""
+    return version.removesuffix(".0")
+
+
+def can_compile(filename: str) -> bool:
+    """Check whether the given file can be shipped as compiled bytecode."""
+    return filename.endswith(".py") and filename not in SOURCE_ONLY_FILES
+
+
+@cache
+def mpy_cross_version(mpy_cross: str) -> str:
+    """Return the version that the mpy-cross executable reports, which includes the .mpy version that it emits."""
+    result = run([mpy_cross, "--version"], capture_output=True, check=False)  # noqa: S603
+    return result.stdout.decode(errors="replace").strip()
+
+
+def compile_module(filename: str, data: bytes, bytecode_version: str) -> bytes | None:
+    """Compile the module source to .mpy bytecode for the given bytecode version.
+
+    Compiled modules are stored in the build cache, keyed by their source, the bytecode version, and the version of
+    mpy-cross, so that upgrading mpy-cross recompiles them. Returns None if mpy-cross is not available or the module
+    could not be compiled, in which case the source file should be shipped instead.
+    """
+    mpy_cross = which("mpy-cross")
+    if mpy_cross is None:
+        return None
+    bytecode_version = normalise_bytecode_version(bytecode_version)
+    cache = get_build_cache()
+    return cache.get_or_build(
+        cache.key("mpy", mpy_cross_version(mpy_cross), bytecode_version, filename, data),
+        lambda: _run_mpy_cross(mpy_cross, filename, data, bytecode_version),
+    )
+
+
+def _run_mpy_cross(mpy_cross: str, filename: str, data: bytes, bytecode_version: str) -> bytes | None:
+    """Run mpy-cross to compile the module source."""
+    with TemporaryDirectory() as tmp_dir:
+        source_file = Path(tmp_dir) / "module.py"
+        target_file = Path(tmp_dir) / "module.mpy"
+        source_file.write_bytes(data)
+        result = run(  # noqa: S603
+            [mpy_cross, "-b", bytecode_version, "-s", filename, "-o", str(target_file), str(source_file)],
+            capture_output=True,
+            check=False,
+        )
+        if result.returncode != 0 or not target_file.exists():
+            return None
+        return target_file.read_bytes()
@@ -1,69 +1,64 @@
 """Commands for handling devices over-the-air."""
 
-import re
+import asyncio
+import zlib
+from contextlib import AsyncExitStack
+from dataclasses import dataclass
 from hashlib import sha256
-from importlib import resources
 from json import dumps
-from time import sleep
+from time import monotonic
 
-from httpx import Client, TransportError, codes
+from httpx import URL, AsyncClient, AsyncHTTPTransport, Limits, Request, TransportError, codes
 from rich.progress import Progress
 
 from mqtt_house.__about__ import __version__
+from mqtt_house.lib.addresses import AddressBookTransport
+from mqtt_house.lib.announce import BootWatcher
+from mqtt_house.lib.cache import get_build_cache
+from mqtt_house.lib.imports import read_resource, resolve_imports
+from mqtt_house.lib.minimise import MINIMISER_VERSION, minimise_file
+from mqtt_house.lib.mpy import can_compile, compile_module
+from mqtt_house.lib.prune import prune_modules
+from mqtt_house.lib.throughput import record_throughput
 from mqtt_house.settings import ConfigModel
 from mqtt_house.util import slugify
 
-ENTITY_FILES = {
-    "mqtt_house.entity.light.singlepinsimple.Light": [
-        ("mqtt_house.micro", "mqtt_house/entity/light/__init__.py"),
-        ("mqtt_house.micro", "mqtt_house/entity/light/singlepinsimple.py"),
-    ],
-    "mqtt_house.entity.light.threepinrgb.Light": [
-        ("mqtt_house.micro", "mqtt_house/entity/light/__init__.py"),
-        ("mqtt_house.micro", "mqtt_house/entity/light/threepinrgb.py"),
-    ],
-    "mqtt_house.entity.temperature.onewireds18x20.Temperature": [
-        ("mqtt_house.micro", "mqtt_house/entity/temperature/__init__.py"),
-        ("mqtt_house.micro", "mqtt_house/entity/temperature/onewireds18x20.py"),
-        ("mqtt_house.micro", "onewire.py"),
-        ("mqtt_house.micro", "ds18x20.py"),
-    ],
-    "mqtt_house.entity.display.PicoInkyDisplay": [("mqtt_house.micro", "mqtt_house/entity/display.py")],
-    "mqtt_house.entity.switch.HBridgeMomentarySwitch": [("mqtt_house.micro", "mqtt_house/entity/switch.py")],
-    "mqtt_house.entity.binary_sensor.SinglePinBinarySensor": [
-        ("mqtt_house.micro", "mqtt_house/entity/binary_sensor.py")
-    ],
-    "mqtt_house.entity.temperature.bme280.Temperature": [
-        ("mqtt_house.micro", "mqtt_house/entity/temperature/__init__.py"),
-        ("mqtt_house.micro", "mqtt_house/entity/temperature/bme280.py"),
-        ("mqtt_house.micro", "mqtt_house/sensors.py"),
-        ("mqtt_house.micro", "bme280_float.py"),
-    ],
-    "mqtt_house.entity.pressure.BME280Pressure": [
-        ("mqtt_house.micro", "mqtt_house/entity/pressure.py"),
-        ("mqtt_house.micro", "mqtt_house/sensors.py"),
-        ("mqtt_house.micro", "bme280_float.py"),
-    ],
-    "mqtt_house.entity.humidity.BME280Humidity": [
-        ("mqtt_house.micro", "mqtt_house/entity/humidity.py"),
-        ("mqtt_house.micro", "mqtt_house/sensors.py"),
-        ("mqtt_house.micro", "bme280_float.py"),
-    ],
-    "mqtt_house.entity.luminosity.ltr559.Illuminance": [
-        ("mqtt_house.micro", "mqtt_house/entity/luminosity/__init__.py"),
-        ("mqtt_house.micro", "mqtt_house/entity/luminosity/ltr559.py"),
-        ("mqtt_house.micro", "mqtt_house/sensors.py"),
-        ("mqtt_house.micro", "bme280_float.py"),
-    ],
-    "mqtt_house.entity.sensor.adc.ADCSensor": [
-        ("mqtt_house.micro", "mqtt_house/entity/sensor/__init__.py"),
-        ("mqtt_house.micro", "mqtt_house/entity/sensor/adc.py"),
-    ],
-    "mqtt_house.entity.sensor.multipinenum.Sensor": [
-        ("mqtt_house.micro", "mqtt_house/entity/sensor/__init__.py"),
-        ("mqtt_house.micro", "mqtt_house/entity/sensor/multipinenum.py"),
-    ],
-}
+#: The deflate window size used for compressed uploads. The device needs a 2**COMPRESSION_WBITS byte window to
+#: decompress, so this is kept small.
+COMPRESSION_WBITS = 10
+
+#: The size of the chunks in which bundles are streamed to the device.
+BUNDLE_CHUNK_SIZE = 4096
+
+#: The maximum number of files uploaded to a single device at the same time. Every concurrent upload needs its own
+#: connection on the device. The OTA server streams all bodies larger than 1 KB in 1 KB chunks, so each upload holds
+#: at most that much of its body in memory.
+MAX_UPLOAD_STREAMS = 4
+
+#: The number of times an interrupted upload is resumed, before the update fails.
+UPLOAD_RETRIES = 5
+
+#: The delay in seconds before an interrupted upload is first resumed. The delay doubles with every further retry.
+UPLOAD_BACKOFF = 1
+
+#: The number of seconds to wait for a device to come back after a reset.
+RESET_TIMEOUT = 60
+
+#: The number of seconds to only wait for a reset device's boot announcement on MQTT, before the device is also
+#: polled, in case it is reachable but cannot reach the MQTT broker.
+RESET_WATCH_TIMEOUT = 10
+
+#: The delay in seconds before a reset device is first polled. The delay doubles with every further poll, up to
+#: RESET_POLL_MAX_DELAY.
+RESET_POLL_DELAY = 0.5
+RESET_POLL_MAX_DELAY = 8
+
+#: The timeout in seconds for a single poll of a reset device.
+RESET_POLL_TIMEOUT = 2
+
+#: The number of seconds an idle connection to a device is kept for reuse. This must be shorter than the device's
+#: keep-alive timeout, so that the client never reuses a connection that the device is about to close.
+KEEPALIVE_EXPIRY = 4
 
 
 class OTAError(Exception):
@@ -72,6 +67,85 @@ class OTAError(Exception):
     pass
 
 
+@dataclass
+class TransferStats:
+    """Statistics about the data uploaded to a device."""
+
+    size: int = 0
+    """The uncompressed size of the uploaded files."""
+    transferred: int = 0
+    """The number of bytes actually sent to the device."""
+    duration: float = 0
+    """The time in seconds spent uploading."""
+    connections: int | None = None
+    """The number of connections opened to the device during the update, if known."""
+    up_to_date: bool = False
+    """Whether the update was skipped, because the device already runs the build."""
+
+    @property
+    def saved(self) -> int:
+        """The number of bytes saved by compressing the uploads."""
+        return self.size - self.transferred
+
+    @property
+    def time_saved(self) -> float:
+        """The estimated time in seconds saved by compressing the uploads, based on the measured throughput."""
+        if self.transferred == 0:
+            return 0
+        return self.saved * self.duration / self.transferred
+
+    def summary(self) -> str:
+        """Return a human-readable summary of the transfer."""
+        if self.up_to_date:
+            summary = "Already up to date"
+        elif self.size == 0:
+            summary = "No files needed uploading"
+        else:
+            summary = (
+                f"Uploaded {self.transferred:,} of {self.size:,} bytes in {self.duration:.1f}s "
+                f"(saved {self.saved / self.size:.0%}, about {self.time_saved:.1f}s)"
+            )
+        if self.connections is not None:
+            summary = f"{summary} using {self.connections} connection{'' if self.connections == 1 else 's'}"
+        return summary
+
+
+class ConnectionCounter:
+    """Counts the connections that a client opens to a single host, while used as a context manager."""
+
+    def __init__(self, client: AsyncClient, host: str) -> None:
+        self._client = client
+        self._host = URL(host).host
+        self.count = 0
+
+    async def _trace(self, event: str, info: dict) -> None:  # noqa: ARG002
+        if event == "connection.connect_tcp.complete":
+            self.count += 1
+
+    async def _hook(self, request: Request) -> None:
+        if request.url.host == self._host:
+            request.extensions["trace"] = self._trace
+
+    def __enter__(self) -> "ConnectionCounter":
+        self._client.event_hooks["request"].append(self._hook)
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self._client.event_hooks["request"].remove(self._hook)
+
+
+def create_client(timeout: float = 30) -> AsyncClient:
+    """Create the client for talking to devices, which reuses one persistent connection per device.
+
+    The devices are contacted at the addresses stored in the address book, so that their names are only resolved
+    when their addresses are not known.
+    """
+    return AsyncClient(
+        timeout=timeout,
+        transport=AddressBookTransport(AsyncHTTPTransport(limits=Limits(keepalive_expiry=KEEPALIVE_EXPIRY))),
+    )
+
+
 def get_device_host(config: ConfigModel, host: str | None = None) -> str:
     """Get the device hostname."""
     if host is not None:
@@ -79,33 +153,58 @@ def get_device_host(config: ConfigModel, host: str | None = None) -> str:
     return f"http://{slugify(config.device.name)}.{config.device.domain}"
 
 
-def get_device_version(config: ConfigModel, client: Client, host: str | None = None) -> list[int]:
-    """Retrieves the device's version or None if the device could not be contacted."""
+async def get_device_about(config: ConfigModel, client: AsyncClient, host: str | None = None) -> dict:
+    """Retrieves the device's information, including its version and supported features."""
     try:
-        response = client.get(f"{get_device_host(config, host=host)}/ota/about")
+        response = await client.get(f"{get_device_host(config, host=host)}/ota/about")
         if response.status_code == codes.OK:
-            return [int(c) for c in response.json()["version"].split(".")]
-        msg = f"Failed to get the device version from {get_device_host(config, host=host)} ({{response.status_code}})."
+            return response.json()
+        msg = f"Failed to get the device version from {get_device_host(config, host=host)} ({response.status_code})."
         raise OTAError(msg)
     except TransportError as err:
         msg = f"The device could not be reached at {get_device_host(config, host=host)}."
         raise OTAError(msg) from err
-    except KeyError as err:
+
+
+async def get_device_stats(config: ConfigModel, client: AsyncClient, host: str | None = None) -> dict:
+    """Retrieves the device's runtime statistics, such as the use of its inbound MQTT queue."""
+    try:
+        response = await client.get(f"{get_device_host(config, host=host)}/ota/stats")
+        if response.status_code == codes.OK:
+            return response.json()
+        msg = f"Failed to get the device statistics from {get_device_host(config, host=host)} ({response.status_code})."
+        raise OTAError(msg)
+    except TransportError as err:
+        msg = f"The device could not be reached at {get_device_host(config, host=host)}."
+        raise OTAError(msg) from err
+
+
+def parse_device_version(config: ConfigModel, about: dict, host: str | None = None) -> list[int]:
+    """Parse the version from the device's information."""
+    try:
+        return [int(c) for c in about["version"].split(".")]
+    except (KeyError, ValueError) as err:
         msg = f"Failed to get a valid device version from {get_device_host(config, host=host)}."
         raise OTAError(msg) from err
 
 
-def prepare_device(
+async def get_device_version(config: ConfigModel, client: AsyncClient, host: str | None = None) -> list[int]:
+    """Retrieves the device's version."""
+    return parse_device_version(config, await get_device_about(config, client, host=host), host=host)
+
+
+async def prepare_device(
     config: ConfigModel,
-    client: Client,
+    client: AsyncClient,
     progress: Progress,
     host: str | None = None,
     upgrade_major_version: bool = False,  # noqa:FBT001,FBT002
-) -> None:
-    """Prepare the device for the OTA update."""
+) -> dict:
+    """Prepare the device for the OTA update, returning the device's information."""
     task = progress.add_task("Preparing the device", total=2)
     # Check the device version allows an upgrade
-    version = get_device_version(config, client, host=host)
+    about = await get_device_about(config, client, host=host)
+    version = parse_device_version(config, about, host=host)
     if version[0] != int(__version__.split(".")[0]) and not upgrade_major_version:
         msg = (
             f"The device at {get_device_host(config, host=host)} "
@@ -114,9 +213,13 @@ def prepare_device(
         )
         raise OTAError(msg)
     progress.update(task, advance=1)
+    if "resume" in about.get("features", []):
+        # Keep any existing uploads, so that an interrupted update can be resumed
+        progress.update(task, advance=1)
+        return about
     # Rollback any existing upgrade
     try:
-        response = client.post(f"{get_device_host(config, host=host)}/ota/rollback")
+        response = await client.post(f"{get_device_host(config, host=host)}/ota/rollback")
         if response.status_code != codes.NO_CONTENT:
             msg = (
                 f"Preparing the device at {get_device_host(config, host=host)} "
@@ -127,124 +230,194 @@ def prepare_device(
         msg = f"The device could not be reached at {get_device_host(config, host=host)}."
         raise OTAError(msg) from err
     progress.update(task, advance=1)
+    return about
 
 
-def minimise_file(data: bytes):
-    """Minimise the file size, stripping comments and empty lines"""
-    result = []
-    in_comment = False
-    for line in data.decode("utf-8").split("\n"):
-        if re.match(r"\s*#.*", line):
-            continue
-        elif line.strip() == "":
-            continue
-        elif re.match(r"\s*'''.*'''\s*", line) or re.match(r'\s*""".*"""\s*', line):
-            continue
-        elif not in_comment and (re.match(r"\s*'''.*", line) or re.match(r'\s*""".*', line)):
-            in_comment = True
-            continue
-        elif in_comment and (re.match(r".*'''\s*", line) or re.match(r'.*"""\s*', line)):
-            in_comment = False
-            continue
-        elif in_comment:
-            continue
-        result.append(f"{line}\n")
-    return "".join(result).encode("utf-8")
+async def get_device_manifest(config: ConfigModel, client: AsyncClient, host: str | None = None) -> dict | None:
+    """Retrieve the hashes of the files installed on the device.
 
+    Returns None if the device does not support reporting its installed files.
+    """
+    try:
+        response = await client.get(f"{get_device_host(config, host=host)}/ota/manifest")
+        if response.status_code == codes.OK:
+            return response.json()
+        elif response.status_code == codes.NOT_FOUND:
+            return None
+        msg = f"Failed to get the installed files from {get_device_host(config, host=host)} ({response.status_code})."
+        raise OTAError(msg)
+    except TransportError as err:
+        msg = f"The device could not be reached at {get_device_host(config, host=host)}."
+        raise OTAError(msg) from err
 
-def prepare_update(config: ConfigModel) -> tuple[list, list]:
-    """Prepare the inventory and files for upload."""
-    inventory = []
-    files = []
-    # Add the config files
-    inventory.append(
-        {
-            "fileid": "1",
-            "filename": "config.json",
-        }
-    )
-    files.append(
-        {
-            "fileid": "1",
-            "filename": "config.json",
-            "data": dumps(
-                {
-                    "debug": config.debug,
-                    "device": config.device.model_dump(),
-                    "mqtt": config.mqtt.model_dump(),
-                    "wifi": config.wifi.model_dump(),
-                }
-            ).encode(),
-        }
-    )
-    inventory.append({"fileid": "2", "filename": "entities.json"})
-    files.append(
-        {
-            "fileid": "2",
-            "filename": "entities.json",
-            "data": dumps([entity.model_dump() for entity in config.entities]).encode(),
-        }
+
+async def get_device_uploads(config: ConfigModel, client: AsyncClient, host: str | None = None) -> dict:
+    """Retrieve the state of the uploads that the device has received so far, keyed by their fileid."""
+    try:
+        response = await client.get(f"{get_device_host(config, host=host)}/ota/uploads")
+        if response.status_code == codes.OK:
+            return response.json()
+        msg = f"Failed to get the received uploads from {get_device_host(config, host=host)} ({response.status_code})."
+        raise OTAError(msg)
+    except TransportError as err:
+        msg = f"The device could not be reached at {get_device_host(config, host=host)}."
+        raise OTAError(msg) from err
+
+
+def filter_changed_files(inventory: list, files: list, manifest: dict) -> tuple[list, list]:
+    """Filter the inventory and files down to those that differ from the files listed in the manifest."""
+    changed = set()
+    for item in files:
+        if manifest.get(item["filename"]) != item["hash"]:
+            changed.add(item["fileid"])
+    return (
+        [entry for entry in inventory if entry["fileid"] in changed],
+        [item for item in files if item["fileid"] in changed],
     )
-    # Add the core files
-    base_files = [
-        "main.py",
-        "microdot.py",
-        "mqtt_as.py",
-        "mqtt_house/__init__.py",
-        "mqtt_house/__about__.py",
-        "mqtt_house/device/__init__.py",
-        "mqtt_house/device/generic.py",
-        "mqtt_house/entity/__init__.py",
-        "mqtt_house/entity/base.py",
-        "mqtt_house/util.py",
-        "ota_server.py",
-        "status_led.py",
-    ]
-    if config.device.type == "enviro":
-        base_files.append("mqtt_house/device/enviro.py")
-    base_path = resources.files("mqtt_house.micro")
-    for idx, filename in enumerate(base_files):
-        item_file = base_path
-        for part in filename.split("/"):
-            item_file = item_file / part
-        inventory.append({"fileid": str(idx + 3), "filename": filename})
-        files.append({"fileid": str(idx + 3), "filename": filename, "data": minimise_file(item_file.read_bytes())})
-    # Add the files required for the configured device and entities
+
+
+def build_module(filename: str, data: bytes, mpy_version: str | None = None) -> tuple[str, bytes]:
+    """Build the module file to ship, returning its filename and data.
+
+    If an `mpy_version` is given, the module is compiled to .mpy bytecode for that version, falling back to the
+    minimised source if it cannot be compiled.
+    """
+    cache = get_build_cache()
+    data = cache.get_or_build(cache.key("minimise", MINIMISER_VERSION, data), lambda: minimise_file(data))
+    if mpy_version is not None and can_compile(filename):
+        compiled = compile_module(filename, data, mpy_version)
+        if compiled is not None:
+            return f"{filename[:-3]}.mpy", compiled
+    return filename, data
+
+
+def file_id(filename: str) -> str:
+    """Return the fileid of the file, which is derived from its filename and so is the same in every build."""
+    return sha256(filename.encode()).hexdigest()[:8]
+
+
+def module_sources(config: ConfigModel) -> dict[str, bytes]:
+    """Return the source of each module that the device needs, keyed by filename.
+
+    The modules are the closure of the imports of main.py, the configured device type, and the configured entity
+    classes, so that each device only gets the modules it actually needs.
+    """
+    roots = {"main": None, f"mqtt_house.device.{config.device.type}": None}
     for entity in config.entities:
-        if entity.cls in ENTITY_FILES:
-            core_count = len(inventory) + 1
-            for idx, (base_pkg, filename) in enumerate(ENTITY_FILES[entity.cls]):
-                # Filter duplicates
-                uploaded = False
-                for inv in inventory:
-                    if inv["filename"] == filename:
-                        uploaded = True
-                if uploaded:
-                    continue
-                item_file = resources.files(base_pkg)
-                for part in filename.split("/"):
-                    item_file = item_file / part
-                inventory.append({"fileid": str(idx + core_count), "filename": filename})
-                files.append(
-                    {
-                        "fileid": str(idx + core_count),
-                        "filename": filename,
-                        "data": minimise_file(item_file.read_bytes()),
-                    }
-                )
-    return inventory, files
+        module, _, cls = entity.cls.rpartition(".")
+        if roots.get(module, set()) is not None:
+            roots[module] = {*roots.get(module, set()), cls}
+    return {
+        filename: read_resource("mqtt_house.micro", filename) for filename in resolve_imports("mqtt_house.micro", roots)
+    }
 
 
-def upload_file(
-    item: dict, config: ConfigModel, client: Client, endpoint: str = "/file", host: str | None = None
-) -> None:
-    """Upload a single file to the device."""
-    sha256_hash = sha256(item["data"])
+def prepare_update(config: ConfigModel, mpy_version: str | None = None, *, prune: bool = False) -> tuple[list, list]:
+    """Prepare the inventory and files for upload.
+
+    If `prune` is set, the code in the vendored libraries that cannot run on the device is removed. If an
+    `mpy_version` is given, modules are shipped as .mpy bytecode compiled for that bytecode version.
+    """
+    files = {}
+
+    def add_file(filename: str, data: bytes) -> None:
+        fileid = file_id(filename)
+        if fileid in files:
+            msg = f"The files {files[fileid]['filename']} and {filename} have the same fileid."
+            raise OTAError(msg)
+        files[fileid] = {"fileid": fileid, "filename": filename, "data": data, "hash": sha256(data).hexdigest()}
+
+    # Add the config files
+    add_file(
+        "config.json",
+        dumps(
+            {
+                "debug": config.debug,
+                "device": config.device.model_dump(),
+                "mqtt": config.mqtt.model_dump(),
+                "wifi": config.wifi.model_dump(),
+            }
+        ).encode(),
+    )
+    add_file("entities.json", dumps([entity.model_dump() for entity in config.entities]).encode())
+    # Add the modules required for the configured device and entities
+    sources = module_sources(config)
+    if prune:
+        sources = prune_modules(sources)
+    for filename, data in sources.items():
+        add_file(*build_module(filename, data, mpy_version))
+    # Add the fingerprint last, so that the device only stores it once all other files have been committed
+    add_file("fingerprint.txt", build_fingerprint(list(files.values())).encode())
+    files = list(files.values())
+    return [{"fileid": item["fileid"], "filename": item["filename"]} for item in files], files
+
+
+def build_fingerprint(files: list) -> str:
+    """Return the fingerprint of the build, which changes whenever the name or content of any of its files changes."""
+    return sha256(dumps(sorted([item["filename"], item["hash"]] for item in files)).encode()).hexdigest()
+
+
+def compress_data(data: bytes) -> bytes:
+    """Compress the data using a deflate window that the device can handle."""
+    compressor = zlib.compressobj(9, zlib.DEFLATED, COMPRESSION_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def encode_data(data: bytes, compress: bool) -> tuple[bytes, str]:  # noqa: FBT001
+    """Encode the data for the upload, returning the encoded data and the encoding used.
+
+    Data is only compressed if `compress` is set and compressing actually reduces its size.
+    """
+    if compress:
+        cache = get_build_cache()
+        compressed = cache.get_or_build(cache.key("deflate", str(COMPRESSION_WBITS), data), lambda: compress_data(data))
+        if len(compressed) < len(data):
+            return compressed, "deflate"
+    return data, "identity"
+
+
+def inventory_item(inventory: list) -> dict:
+    """Create the upload item for the inventory."""
+    data = dumps(inventory).encode()
+    return {"fileid": "-1", "filename": "inventory.json", "data": data, "hash": sha256(data).hexdigest()}
+
+
+def build_bundle(inventory: list, files: list, compress: bool = False) -> tuple[bytes, int]:  # noqa: FBT001,FBT002
+    """Build a single bundle containing the inventory and all files.
+
+    Each member consists of a header line with the fileid, size, sha256 hash, and encoding of the member, followed
+    by the member's data. Returns the bundle and the uncompressed size of its members.
+    """
+    bundle = []
+    size = 0
+    for item in [inventory_item(inventory), *files]:
+        content, encoding = encode_data(item["data"], compress)
+        bundle.append(f"{item['fileid']} {len(content)} {item['hash']} {encoding}\n".encode())
+        bundle.append(content)
+        size += len(item["data"])
+    return b"".join(bundle), size
+
+
+async def upload_file(
+    item: dict,
+    config: ConfigModel,
+    client: AsyncClient,
+    endpoint: str = "/file",
+    host: str | None = None,
+    *,
+    compress: bool = False,
+) -> int:
+    """Upload a single file to the device, returning the number of bytes sent.
+
+    If `compress` is set, the file is sent deflate-compressed, unless that would not reduce its size.
+    """
+    headers = {"X-Fileid": item["fileid"], "X-Filehash": item["hash"]}
+    content, encoding = encode_data(item["data"], compress)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
     try:
-        response = client.put(
-            f"{get_device_host(config, host=host)}/ota{endpoint}",
-            content=item["data"],
-            headers={"X-Fileid": item["fileid"], "X-Filehash": sha256_hash.hexdigest()},
+        response = await client.put(
+            f"{get_device_host(config, host=host)}/ota{endpoint}", content=content, headers=headers
         )
         if response.status_code != codes.NO_CONTENT:
             msg = (
@@ -254,25 +427,182 @@ def upload_file(
     except TransportError as err:
         msg = f"The device could not be reached at {get_device_host(config, host=host)}."
         raise OTAError(msg) from err
+    return len(content)
 
 
-def upload_files(
-    inventory: list, files: list, config: ConfigModel, client: Client, progress: Progress, host: str | None = None
-) -> None:
-    """Upload all files to the device."""
+def resume_offset(item: dict, content: bytes, encoding: str, uploads: dict) -> int | None:
+    """Return the offset from which the upload of the item continues, or None if the device already has the item."""
+    state = uploads.get(item["fileid"])
+    if state is None or state["hash"] != item["hash"]:
+        return 0
+    elif state.get("complete"):
+        return None
+    elif state["encoding"] == encoding and state["size"] < len(content):
+        return state["size"]
+    return 0
+
+
+async def upload_resumable_file(
+    item: dict,
+    config: ConfigModel,
+    client: AsyncClient,
+    uploads: dict,
+    host: str | None = None,
+    *,
+    compress: bool = False,
+) -> int:
+    """Upload a single file to the device, resuming the upload if it is interrupted, returning the number of bytes sent.
+
+    The file is sent as a byte range, starting at the end of the data that the device already holds for it. If the
+    upload is interrupted, the device keeps the data received so far. After a delay, which doubles with every retry,
+    the received uploads in `uploads` are refreshed and the upload continues from where the device's data ends.
+    """
+    content, encoding = encode_data(item["data"], compress)
+    if len(content) == 0:
+        return await upload_file(item, config, client, host=host, compress=compress)
+    headers = {"X-Fileid": item["fileid"], "X-Filehash": item["hash"]}
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    for retry in range(UPLOAD_RETRIES + 1):
+        if retry > 0:
+            await asyncio.sleep(UPLOAD_BACKOFF * 2 ** (retry - 1))
+            try:
+                received = await get_device_uploads(config, client, host=host)
+            except OTAError:
+                continue
+            uploads.clear()
+            uploads.update(received)
+        offset = resume_offset(item, content, encoding, uploads)
+        if offset is None:
+            return 0
+        headers["Content-Range"] = f"bytes {offset}-{len(content) - 1}/{len(content)}"
+        try:
+            response = await client.put(
+                f"{get_device_host(config, host=host)}/ota/file", content=content[offset:], headers=headers
+            )
+        except TransportError:
+            continue
+        if response.status_code == codes.NO_CONTENT:
+            uploads[item["fileid"]] = {"size": len(item["data"]), "hash": item["hash"], "complete": True}
+            return len(content) - offset
+        elif response.status_code not in (codes.CONFLICT, codes.REQUESTED_RANGE_NOT_SATISFIABLE):
+            msg = (
+                f"Failed to upload {item['filename']} to {get_device_host(config, host=host)} ({response.status_code})."
+            )
+            raise OTAError(msg)
+    msg = (
+        f"The upload of {item['filename']} to {get_device_host(config, host=host)} was interrupted "
+        f"{UPLOAD_RETRIES + 1} times. Run the update again to resume it."
+    )
+    raise OTAError(msg)
+
+
+async def upload_files(
+    inventory: list,
+    files: list,
+    config: ConfigModel,
+    client: AsyncClient,
+    progress: Progress,
+    *,
+    host: str | None = None,
+    compress: bool = False,
+    resume: bool = False,
+    streams: int = 1,
+) -> TransferStats:
+    """Upload all files to the device.
+
+    If `resume` is set, the files that the device has already received are skipped and interrupted uploads are
+    resumed. The inventory is uploaded first, then the files are uploaded over up to `streams` concurrent connections,
+    which is limited to MAX_UPLOAD_STREAMS.
+    """
     task = progress.add_task("Uploading the new files", total=len(files) + 1)
-    upload_file({"fileid": "-1", "data": dumps(inventory).encode()}, config, client, endpoint="/inventory", host=host)
-    progress.update(task, advance=1)
-    for item in files:
-        upload_file(item, config, client, host=host)
+    stats = TransferStats()
+    start = monotonic()
+    uploads = await get_device_uploads(config, client, host=host) if resume else None
+    semaphore = asyncio.Semaphore(min(max(streams, 1), MAX_UPLOAD_STREAMS))
+    failed = asyncio.Event()
+
+    async def upload(item: dict) -> None:
+        async with semaphore:
+            if failed.is_set():
+                return
+            try:
+                if resume:
+                    transferred = await upload_resumable_file(
+                        item, config, client, uploads, host=host, compress=compress
+                    )
+                else:
+                    transferred = await upload_file(
+                        item,
+                        config,
+                        client,
+                        endpoint="/inventory" if item["fileid"] == "-1" else "/file",
+                        host=host,
+                        compress=compress,
+                    )
+            except OTAError:
+                # Do not start any further uploads
+                failed.set()
+                raise
+        stats.size += len(item["data"])
+        stats.transferred += transferred
         progress.update(task, advance=1)
 
+    await upload(inventory_item(inventory))
+    tasks = [asyncio.create_task(upload(item)) for item in files]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        # Stop the uploads that are still running if one of them failed
+        for upload_task in tasks:
+            upload_task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    stats.duration = monotonic() - start
+    return stats
+
 
-def commit_update(config: ConfigModel, client: Client, progress: Progress, host: str | None = None) -> None:
+async def upload_bundle(
+    inventory: list,
+    files: list,
+    config: ConfigModel,
+    client: AsyncClient,
+    progress: Progress,
+    *,
+    host: str | None = None,
+    compress: bool = False,
+) -> TransferStats:
+    """Upload the inventory and all files to the device as a single bundle."""
+    bundle, size = build_bundle(inventory, files, compress)
+    task = progress.add_task("Uploading the new files", total=len(bundle))
+
+    async def content():
+        for offset in range(0, len(bundle), BUNDLE_CHUNK_SIZE):
+            yield bundle[offset : offset + BUNDLE_CHUNK_SIZE]
+            progress.update(task, completed=min(offset + BUNDLE_CHUNK_SIZE, len(bundle)))
+
+    start = monotonic()
+    try:
+        response = await client.put(
+            f"{get_device_host(config, host=host)}/ota/bundle",
+            content=content(),
+            headers={"Content-Length": str(len(bundle))},
+        )
+        if response.status_code != codes.NO_CONTENT:
+            msg = (
+                f"Failed to upload the update bundle to {get_device_host(config, host=host)} ({response.status_code})."
+            )
+            raise OTAError(msg)
+    except TransportError as err:
+        msg = f"The device could not be reached at {get_device_host(config, host=host)}."
+        raise OTAError(msg) from err
+    return TransferStats(size=size, transferred=len(bundle), duration=monotonic() - start)
+
+
+async def commit_update(config: ConfigModel, client: AsyncClient, progress: Progress, host: str | None = None) -> None:
     """Commit all uploaded changes."""
     task = progress.add_task("Committing the changes", total=1, start=False)
     try:
-        response = client.post(f"{get_device_host(config, host=host)}/ota/commit")
+        response = await client.post(f"{get_device_host(config, host=host)}/ota/commit")
         progress.start_task(task)
         if response.status_code == codes.NO_CONTENT:
             progress.update(task, completed=1)
@@ -287,44 +617,158 @@ def commit_update(config: ConfigModel, client: Client, progress: Progress, host:
         raise OTAError(msg) from err
 
 
-def reset(config: ConfigModel, client: Client, progress: Progress, host: str | None = None) -> None:
-    """Reset the device and wait for it to reappear."""
-    task = progress.add_task("Resetting the device", total=60, start=False)
-    response = client.post(f"{get_device_host(config, host=host)}/ota/reset")
-    progress.start_task(task)
-    if response.status_code == codes.ACCEPTED:
-        countdown = 60
-        success = False
-        while countdown > 0:
-            sleep(1)
+async def poll_device_about(config: ConfigModel, client: AsyncClient, host: str | None = None) -> dict | None:
+    """Poll the device's information with a short timeout, returning None if the device does not respond."""
+    try:
+        response = await client.get(f"{get_device_host(config, host=host)}/ota/about", timeout=RESET_POLL_TIMEOUT)
+        if response.status_code == codes.OK:
+            return response.json()
+    except TransportError:
+        pass
+    return None
+
+
+async def reset(
+    config: ConfigModel,
+    client: AsyncClient,
+    progress: Progress,
+    host: str | None = None,
+    *,
+    watcher: BootWatcher | None = None,
+) -> None:
+    """Reset the device and wait for it to reappear.
+
+    The device announces each boot on MQTT with a new boot id. If the announcements can be watched, either via the
+    given `watcher` or by connecting to the device's MQTT broker, the wait ends as soon as the device has announced
+    its new boot. If the device has not announced its boot after RESET_WATCH_TIMEOUT seconds, or the announcements
+    cannot be watched, the device is also polled, with the delay between polls doubling each time.
+    """
+    task = progress.add_task("Resetting the device", total=RESET_TIMEOUT, start=False)
+    about = await get_device_about(config, client, host=host)
+    previous_boot_id = about.get("boot_id")
+    async with AsyncExitStack() as stack:
+        connecting = None
+        if watcher is None and previous_boot_id is not None:
+            watcher = BootWatcher(config.mqtt, [config.device.domain])
+            # Connect to the broker while the device resets, rather than delaying the reset until connected. Until the
+            # watcher is available, the device is polled.
+            connecting = asyncio.create_task(stack.enter_async_context(watcher))
+        try:
             try:
-                response = client.get(f"{get_device_host(config, host=host)}/ota/about")
-                if response.status_code == codes.OK:
-                    device_version = response.json()["version"]
-                    if device_version == __version__:
-                        success = True
-                        break
-                    else:
-                        msg = (
-                            f"The device at {get_device_host(config, host=host)} reported running version "
-                            f"{device_version} after the update, but was expected to be running {__version__}."
-                        )
-                        raise OTAError(msg)
-            except TransportError:
-                pass
-            finally:
-                countdown = countdown - 1
-                progress.update(task, advance=1)
-        progress.update(task, completed=60)
-        if not success:
-            msg = (
-                f"The device at {get_device_host(config, host=host)}"
-                " did not reappear within one minute after resetting."
-            )
-            raise OTAError(msg)
-    else:
+                response = await client.post(f"{get_device_host(config, host=host)}/ota/reset")
+            except TransportError as err:
+                msg = f"The device could not be reached at {get_device_host(config, host=host)}."
+                raise OTAError(msg) from err
+            progress.start_task(task)
+            if response.status_code != codes.ACCEPTED:
+                msg = (
+                    f"Received error {response.status_code} when trying to reset the device at"
+                    f" {get_device_host(config, host=host)}."
+                )
+                raise OTAError(msg)
+            start = monotonic()
+            delay = RESET_POLL_DELAY
+            while monotonic() - start < RESET_TIMEOUT:
+                watching = previous_boot_id is not None and watcher is not None and watcher.available
+                polling = not watching or monotonic() - start >= RESET_WATCH_TIMEOUT
+                if watching:
+                    # Keep listening for the announcement while waiting between the polls
+                    about = await watcher.wait(
+                        slugify(config.device.name), previous_boot_id, timeout=delay if polling else 1
+                    )
+                else:
+                    await asyncio.sleep(delay)
+                    about = None
+                if about is None and polling:
+                    delay = min(delay * 2, RESET_POLL_MAX_DELAY)
+                    about = await poll_device_about(config, client, host=host)
+                    if about is not None and previous_boot_id is not None and about.get("boot_id") == previous_boot_id:
+                        # The device has not reset yet
+                        about = None
+                progress.update(task, completed=min(monotonic() - start, RESET_TIMEOUT))
+                if about is not None:
+                    break
+        finally:
+            if connecting is not None:
+                await connecting
+    progress.update(task, completed=RESET_TIMEOUT)
+    if about is None:
+        msg = (
+            f"The device at {get_device_host(config, host=host)}"
+            f" did not reappear within {RESET_TIMEOUT} seconds after resetting."
+        )
+        raise OTAError(msg)
+    elif about["version"] != __version__:
         msg = (
-            f"Received error {response.status_code} when trying to reset the device at"
-            f" {get_device_host(config, host=host)}."
+            f"The device at {get_device_host(config, host=host)} reported running version "
+            f"{about['version']} after the update, but was expected to be running {__version__}."
         )
         raise OTAError(msg)
+
+
+async def update_device(
+    config: ConfigModel,
+    client: AsyncClient,
+    progress: Progress,
+    host: str | None = None,
+    *,
+    upgrade_major_version: bool = False,
+    full: bool = False,
+    compress: bool = True,
+    mpy: bool = False,
+    bundle: bool = True,
+    prune: bool = False,
+    streams: int = 1,
+    watcher: BootWatcher | None = None,
+) -> TransferStats:
+    """Run the full OTA update cycle for a single device.
+
+    Unless `full` is set, the update is skipped if the device reports the fingerprint of the build, and otherwise only
+    the files that differ from those installed on the device are uploaded. If `compress` is set and the device
+    supports it, the files are uploaded deflate-compressed. If `mpy` is set and the device reports its bytecode
+    version, the modules are uploaded as precompiled .mpy files. If `prune` is set, the code in the vendored
+    libraries that cannot run on the device is removed. If `bundle` is set and the device supports it, all files are
+    uploaded in a single request, otherwise they are uploaded over up to `streams` concurrent connections. If the
+    device supports resuming uploads, interrupted uploads are resumed, both during the update and when the update is
+    run again. The `watcher` is used to wait for the device to come back after the reset. The measured upload
+    throughput is recorded, so that later updates can be planned.
+    """
+    with ConnectionCounter(client, get_device_host(config, host=host)) as connections:
+        about = await prepare_device(config, client, progress, host=host, upgrade_major_version=upgrade_major_version)
+        inventory, files = prepare_update(config, mpy_version=about.get("mpy") if mpy else None, prune=prune)
+        if not full and about.get("fingerprint") == files[-1]["data"].decode():
+            return TransferStats(up_to_date=True, connections=connections.count)
+        if not full:
+            manifest = await get_device_manifest(config, client, host=host)
+            if manifest is not None:
+                inventory, files = filter_changed_files(inventory, files, manifest)
+        features = about.get("features", [])
+        compress = compress and "deflate" in features
+        resume = "resume" in features
+        if bundle and "bundle" in features:
+            try:
+                stats = await upload_bundle(inventory, files, config, client, progress, host=host, compress=compress)
+            except OTAError as err:
+                if not resume or not isinstance(err.__cause__, TransportError):
+                    raise
+                # Continue with individual uploads, which skip the files that the device received completely
+                stats = await upload_files(
+                    inventory,
+                    files,
+                    config,
+                    client,
+                    progress,
+                    host=host,
+                    compress=compress,
+                    resume=True,
+                    streams=streams,
+                )
+        else:
+            stats = await upload_files(
+                inventory, files, config, client, progress, host=host, compress=compress, resume=resume, streams=streams
+            )
+        record_throughput(config.device.name, stats.transferred, stats.duration)
+        await commit_update(config, client, progress, host=host)
+        await reset(config, client, progress, host=host, watcher=watcher)
+    stats.connections = connections.count
+    return stats
@@ -0,0 +1,207 @@
+"""Plan OTA updates before running them."""
+
+import asyncio
+from dataclasses import dataclass, field
+
+from httpx import AsyncClient
+from rich.table import Table
+
+from mqtt_house.lib.mpy import compile_module
+from mqtt_house.lib.ota import (
+    MAX_UPLOAD_STREAMS,
+    OTAError,
+    encode_data,
+    filter_changed_files,
+    get_device_about,
+    get_device_manifest,
+    inventory_item,
+    prepare_update,
+)
+from mqtt_house.lib.throughput import get_throughput
+from mqtt_house.settings import ConfigModel
+
+#: The size in bytes of the flash filesystem of a Raspberry Pi Pico (W) running MicroPython.
+FLASH_SIZE = 848 * 1024
+
+#: The size in bytes of the blocks of the flash filesystem. Every file takes up at least one block.
+FLASH_BLOCK_SIZE = 4096
+
+#: The heap in bytes that is free on a Raspberry Pi Pico W, once the firmware has started and connected to the WiFi.
+HEAP_SIZE = 160 * 1024
+
+#: The share of the heap that the imported modules may use, leaving the rest for the buffers needed at runtime.
+HEAP_BUDGET = 0.5
+
+#: The bytecode version that modules shipped as source are compiled for, to estimate the heap needed to import them.
+ESTIMATE_MPY_VERSION = "6.3"
+
+
+def flash_usage(size: int) -> int:
+    """Return the number of bytes of flash that a file of the given size takes up."""
+    return max(-(-size // FLASH_BLOCK_SIZE), 1) * FLASH_BLOCK_SIZE
+
+
+def heap_usage(files: list) -> int:
+    """Estimate the heap needed to import all modules among the `files`.
+
+    Importing a module loads its bytecode into RAM, so the heap is estimated from the size of the compiled modules.
+    Modules shipped as source are compiled with mpy-cross to estimate their size, falling back to the size of their
+    source if mpy-cross is not available.
+    """
+    heap = 0
+    for item in files:
+        if item["filename"].endswith(".mpy"):
+            heap += len(item["data"])
+        elif item["filename"].endswith(".py"):
+            compiled = compile_module(item["filename"], item["data"], ESTIMATE_MPY_VERSION)
+            heap += len(compiled if compiled is not None else item["data"])
+    return heap
+
+
+@dataclass
+class UpdatePlan:
+    """The predicted effect of an OTA update on a single device."""
+
+    device: str
+    """The name of the device."""
+    files: int = 0
+    """The number of files to upload."""
+    size: int = 0
+    """The uncompressed size of the files to upload."""
+    transferred: int = 0
+    """The number of bytes to send to the device."""
+    throughput: float | None = None
+    """The throughput in bytes per second measured during previous updates, if any."""
+    measured: bool = False
+    """Whether the throughput was measured for this device, rather than across all devices."""
+    flash: int = 0
+    """The flash needed while the update is staged, before the uploaded files replace the installed ones."""
+    heap: int = 0
+    """The estimated heap needed to import the device's modules."""
+    reachable: bool = True
+    """Whether the device could be reached. If not, all files are planned to be uploaded."""
+    up_to_date: bool = False
+    """Whether the device already runs the build."""
+    warnings: list[str] = field(default_factory=list)
+    """The problems that are expected to make the update fail or the device run out of memory."""
+
+    @property
+    def duration(self) -> float | None:
+        """The predicted time in seconds to upload the files, or None if the throughput is unknown."""
+        if self.throughput is None:
+            return None
+        return self.transferred / self.throughput
+
+
+async def plan_device(
+    config: ConfigModel,
+    client: AsyncClient,
+    host: str | None = None,
+    *,
+    full: bool = False,
+    compress: bool = True,
+    mpy: bool = False,
+    prune: bool = False,
+) -> UpdatePlan:
+    """Plan the OTA update of a single device, with the same options as :func:`~mqtt_house.lib.ota.update_device`.
+
+    The device is asked for its installed build, so that only the files that actually change are planned. If the
+    device cannot be reached, all files are planned to be uploaded.
+    """
+    plan = UpdatePlan(config.device.name, throughput=get_throughput(config.device.name), measured=True)
+    if plan.throughput is None:
+        plan.throughput = get_throughput()
+        plan.measured = False
+    try:
+        about = await get_device_about(config, client, host=host)
+    except OTAError:
+        about = None
+        plan.reachable = False
+    inventory, files = prepare_update(
+        config, mpy_version=about.get("mpy") if mpy and about is not None else None, prune=prune
+    )
+    installed = sum(flash_usage(len(item["data"])) for item in files)
+    plan.heap = heap_usage(files)
+    if about is not None and not full:
+        if about.get("fingerprint") == files[-1]["data"].decode():
+            plan.up_to_date = True
+            plan.flash = installed
+            return plan
+        try:
+            manifest = await get_device_manifest(config, client, host=host)
+        except OTAError:
+            manifest = None
+        if manifest is not None:
+            inventory, files = filter_changed_files(inventory, files, manifest)
+    compress = compress and (about is None or "deflate" in about.get("features", []))
+    resume = about is None or "resume" in about.get("features", [])
+    plan.files = len(files)
+    staged = []
+    for item in [inventory_item(inventory), *files]:
+        plan.size += len(item["data"])
+        data, encoding = encode_data(item["data"], compress)
+        plan.transferred += len(data)
+        if resume and encoding == "deflate":
+            staged.append(flash_usage(len(data)))
+    # Resumable uploads keep the compressed data on the flash until it is complete and then decompress it, so each
+    # concurrent upload may need space for a compressed copy of its file as well
+    plan.flash = (
+        installed
+        + sum(flash_usage(len(item["data"])) for item in files)
+        + sum(sorted(staged, reverse=True)[:MAX_UPLOAD_STREAMS])
+    )
+    if plan.flash > FLASH_SIZE:
+        plan.warnings.append(f"needs {plan.flash:,} of {FLASH_SIZE:,} bytes of flash")
+    if plan.heap > HEAP_SIZE * HEAP_BUDGET:
+        plan.warnings.append(f"imports need {plan.heap:,} of {HEAP_SIZE:,} bytes of heap")
+    return plan
+
+
+async def plan_fleet(
+    configs: list[ConfigModel],
+    client: AsyncClient,
+    concurrency: int = 8,
+    *,
+    full: bool = False,
+    compress: bool = True,
+    mpy: bool = False,
+    prune: bool = False,
+) -> list[UpdatePlan]:
+    """Plan the OTA updates of all devices, contacting at most `concurrency` devices at the same time."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def plan(config: ConfigModel) -> UpdatePlan:
+        async with semaphore:
+            return await plan_device(config, client, full=full, compress=compress, mpy=mpy, prune=prune)
+
+    return list(await asyncio.gather(*[plan(config) for config in configs]))
+
+
+def plan_table(plans: list[UpdatePlan]) -> Table:
+    """Create the table that shows the plans."""
+    table = Table("Device", "Files", "Bytes to send", "Predicted time", "Flash", "Heap (imports)", "Status")
+    for plan in plans:
+        if plan.duration is None:
+            duration = "unknown"
+        elif plan.measured:
+            duration = f"{plan.duration:.1f}s"
+        else:
+            duration = f"~{plan.duration:.1f}s (fleet average)"
+        if plan.warnings:
+            status = f"[red]{', '.join(plan.warnings)}"
+        elif not plan.reachable:
+            status = "[yellow]Not reachable, planned a full update"
+        elif plan.up_to_date:
+            status = "[green]Already up to date"
+        else:
+            status = "[green]OK"
+        table.add_row(
+            plan.device,
+            str(plan.files),
+            f"{plan.transferred:,} ({plan.size:,} uncompressed)",
+            duration,
+            f"{plan.flash:,} / {FLASH_SIZE:,}",
+            f"{plan.heap:,} / {HEAP_SIZE:,}",
+            status,
+        )
+    return table
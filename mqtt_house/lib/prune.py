@@ -0,0 +1,256 @@
+"""Remove the code from the vendored libraries that cannot run on the target device."""
+
+import ast
+from dataclasses import dataclass
+
+from mqtt_house.lib.minimise import minimise_file
+from mqtt_house.lib.mpy import compile_module
+
+#: The vendored modules that are pruned.
+PRUNED_MODULES = ["microdot.py", "mqtt_as.py"]
+
+#: The conditions that are constant on the target (an RP2040 board talking MQTT 3.1.1), by module. Conditions are
+#: matched against the unparsed source of names, attributes, and subscripts.
+TARGET_CONSTANTS = {
+    "mqtt_as.py": {
+        "ESP32": False,
+        "ESP8266": False,
+        "PYBOARD": False,
+        "RP2": True,
+        "mqttv5": False,
+        "self.mqttv5": False,
+        "config['gateway']": False,
+    },
+}
+
+#: The method decorators that do not have side effects, so that methods decorated with them can be removed.
+REMOVABLE_DECORATORS = {"property", "staticmethod", "classmethod"}
+
+
+def _used_names(node: ast.AST) -> set[str]:
+    """Return every name, attribute, imported name, and string constant used within the node.
+
+    String constants are included, so that names that are looked up dynamically via hasattr or getattr are kept.
+    """
+    names = set()
+    for child in ast.walk(node):
+        if isinstance(child, ast.Name):
+            names.add(child.id)
+        elif isinstance(child, ast.Attribute):
+            names.add(child.attr)
+        elif isinstance(child, ast.alias):
+            names.add(child.name.split(".")[0])
+        elif isinstance(child, ast.Constant) and isinstance(child.value, str):
+            names.add(child.value)
+    return names
+
+
+class _ConstantFolder(ast.NodeTransformer):
+    """Replaces conditional statements and expressions whose condition is constant with the branch that runs."""
+
+    def __init__(self, constants: dict[str, bool]) -> None:
+        self._constants = constants
+
+    def evaluate(self, node: ast.expr) -> bool | None:
+        """Evaluate the condition, returning None if it is not constant."""
+        if isinstance(node, (ast.Name, ast.Attribute, ast.Subscript)):
+            return self._constants.get(ast.unparse(node))
+        elif isinstance(node, ast.Constant):
+            return bool(node.value)
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            value = self.evaluate(node.operand)
+            return None if value is None else not value
+        elif isinstance(node, ast.BoolOp):
+            values = [self.evaluate(value) for value in node.values]
+            short_circuit = isinstance(node.op, ast.Or)
+            if short_circuit in values:
+                return short_circuit
+            if all(value is not None for value in values):
+                return not short_circuit
+        return None
+
+    def simplify(self, node: ast.expr) -> ast.expr:
+        """Remove the constant operands of the condition that do not affect its truth value."""
+        if not isinstance(node, ast.BoolOp):
+            return node
+        neutral = isinstance(node.op, ast.And)
+        values = [self.simplify(value) for value in node.values]
+        values = [value for value in values if self.evaluate(value) is not neutral]
+        if not values:
+            return ast.Constant(neutral)
+        elif len(values) == 1:
+            return values[0]
+        return ast.BoolOp(node.op, values)
+
+    def visit_If(self, node: ast.If) -> ast.AST | list[ast.stmt]:
+        self.generic_visit(node)
+        node.test = self.simplify(node.test)
+        value = self.evaluate(node.test)
+        if value is None:
+            return node
+        return node.body if value else node.orelse
+
+    def visit_IfExp(self, node: ast.IfExp) -> ast.expr:
+        self.generic_visit(node)
+        node.test = self.simplify(node.test)
+        value = self.evaluate(node.test)
+        if value is None:
+            return node
+        return node.body if value else node.orelse
+
+
+def _is_removable(node: ast.stmt) -> bool:
+    """Check whether the module-level statement can be removed if the names it defines are not used."""
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+        return not node.decorator_list
+    if isinstance(node, ast.Assign):
+        return all(isinstance(target, ast.Name) for target in node.targets) and not any(
+            isinstance(child, (ast.Call, ast.Await, ast.Yield, ast.NamedExpr)) for child in ast.walk(node.value)
+        )
+    return False
+
+
+def _defined_names(node: ast.stmt) -> set[str]:
+    """Return the names that the removable statement defines."""
+    if isinstance(node, ast.Assign):
+        return {target.id for target in node.targets}
+    return {node.name}
+
+
+def _is_removable_method(node: ast.stmt) -> bool:
+    """Check whether the method can be removed if its name is not used."""
+    return (
+        isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))
+        and not (node.name.startswith("__") and node.name.endswith("__"))
+        and all(
+            isinstance(decorator, ast.Name) and decorator.id in REMOVABLE_DECORATORS
+            for decorator in node.decorator_list
+        )
+    )
+
+
+def _fill_empty_bodies(tree: ast.AST) -> None:
+    """Add a pass statement to all blocks that the pruning has emptied."""
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Module) and isinstance(getattr(node, "body", None), list) and not node.body:
+            node.body = [ast.Pass()]
+
+
+def prune_module(filename: str, source: bytes, external_names: set[str]) -> bytes:
+    """Prune the module, returning its pruned source.
+
+    The branches that cannot run on the target are removed first. Then the module-level functions, classes, and
+    constants, and the methods of the remaining classes, that are not used by the module's remaining code or by the
+    `external_names` used in the other modules are removed, until only used code remains.
+    """
+    tree = _ConstantFolder(TARGET_CONSTANTS.get(filename, {})).visit(ast.parse(source, filename))
+    used = set(external_names)
+    live = set()
+    methods = {}
+    while True:
+        changed = False
+        for node in tree.body:
+            if id(node) in live or (_is_removable(node) and not _defined_names(node) & used):
+                continue
+            live.add(id(node))
+            changed = True
+            if isinstance(node, ast.ClassDef):
+                methods[id(node)] = set()
+                for child in [*node.bases, *node.keywords]:
+                    used.update(_used_names(child))
+                for child in node.body:
+                    if not _is_removable_method(child):
+                        used.update(_used_names(child))
+            else:
+                used.update(_used_names(node))
+        for node in tree.body:
+            if id(node) not in methods:
+                continue
+            for child in node.body:
+                if _is_removable_method(child) and id(child) not in methods[id(node)] and child.name in used:
+                    methods[id(node)].add(id(child))
+                    used.update(_used_names(child))
+                    changed = True
+        if not changed:
+            break
+    tree.body = [node for node in tree.body if id(node) in live]
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef):
+            node.body = [
+                child for child in node.body if not _is_removable_method(child) or id(child) in methods[id(node)]
+            ]
+    _fill_empty_bodies(tree)
+    return f"{ast.unparse(tree)}\n".encode()
+
+
+def prune_modules(sources: dict[str, bytes]) -> dict[str, bytes]:
+    """Prune the vendored modules among the `sources`, which map the filenames of all shipped modules to their source.
+
+    The names used by all other modules are kept in the pruned modules. Returns the sources with the pruned modules
+    replaced.
+    """
+    trees = {filename: ast.parse(source, filename) for filename, source in sources.items()}
+    result = dict(sources)
+    for filename in PRUNED_MODULES:
+        if filename not in sources:
+            continue
+        external_names = set()
+        for other, tree in trees.items():
+            if other != filename:
+                external_names.update(_used_names(tree))
+        result[filename] = prune_module(filename, sources[filename], external_names)
+    return result
+
+
+@dataclass
+class PruneStats:
+    """The effect of pruning on the size of a single module."""
+
+    filename: str
+    """The filename of the module."""
+    size: int
+    """The size of the minimised module."""
+    pruned_size: int
+    """The size of the minimised, pruned module."""
+    mpy_size: int | None = None
+    """The size of the compiled module, if it could be compiled."""
+    pruned_mpy_size: int | None = None
+    """The size of the compiled, pruned module, if it could be compiled."""
+
+    @property
+    def removed(self) -> int:
+        """The number of bytes removed from the shipped module."""
+        return self.size - self.pruned_size
+
+    @property
+    def ram_saved(self) -> int | None:
+        """The estimated number of bytes of RAM saved when importing the module.
+
+        Importing a module loads its bytecode into RAM, so this is estimated from the reduction in its .mpy size.
+        """
+        if self.mpy_size is None or self.pruned_mpy_size is None:
+            return None
+        return self.mpy_size - self.pruned_mpy_size
+
+
+def prune_report(sources: dict[str, bytes], mpy_version: str | None = None) -> list[PruneStats]:
+    """Prune the modules among the `sources` and report the effect on each pruned module.
+
+    If an `mpy_version` is given and mpy-cross is available, the effect on the compiled modules is reported as well.
+    """
+    pruned = prune_modules(sources)
+    report = []
+    for filename in PRUNED_MODULES:
+        if filename not in sources:
+            continue
+        before = minimise_file(sources[filename])
+        after = minimise_file(pruned[filename])
+        stats = PruneStats(filename, len(before), len(after))
+        if mpy_version is not None:
+            mpy_before = compile_module(filename, before, mpy_version)
+            mpy_after = compile_module(filename, after, mpy_version)
+            if mpy_before is not None and mpy_after is not None:
+                stats.mpy_size = len(mpy_before)
+                stats.pruned_mpy_size = len(mpy_after)
+        report.append(stats)
+    return report
@@ -0,0 +1,217 @@
+"""Run code and write files on a MicroPython board via its raw REPL."""
+
+import struct
+from ast import literal_eval
+from types import TracebackType
+
+from serial import Serial
+
+#: The prompt that the board prints on entering the raw REPL.
+RAW_REPL_PROMPT = b"raw REPL; CTRL-B to exit\r\n>"
+
+#: The number of bytes of file data written per statement.
+WRITE_SIZE = 256
+
+#: The maximum size of the code that is sent to the board in a single execution. The board compiles all code it is
+#: sent in one go, so this bounds the memory needed to compile it.
+MAX_CODE_SIZE = 4096
+
+
+class RawREPLError(Exception):
+    """An exception raised when the board cannot be controlled or the code run on the board fails."""
+
+    pass
+
+
+class RawREPL:
+    """A session with the raw REPL of a MicroPython board, connected via the serial port `port`.
+
+    Use as a context manager, which opens the serial port and enters the raw REPL once for the whole session. Code is
+    sent using the raw-paste mode, if the board supports it, which lets the board compile the code while it arrives.
+    If `soft_reset` is set, the board is soft reset at the end of the session, which restarts its program.
+    """
+
+    def __init__(self, port: str, baudrate: int = 115200, timeout: float = 10, *, soft_reset: bool = False) -> None:
+        self._port = port
+        self._baudrate = baudrate
+        self._timeout = timeout
+        self._soft_reset = soft_reset
+        self._serial = None
+        self._raw_paste = True
+        self._directories = set()
+
+    def __enter__(self) -> "RawREPL":
+        self._serial = Serial(self._port, self._baudrate, timeout=self._timeout)
+        # Interrupt any running program and enter the raw REPL
+        self._serial.write(b"\r\x03\x03")
+        self._serial.reset_input_buffer()
+        self._serial.write(b"\r\x01")
+        self._read_until(RAW_REPL_PROMPT)
+        return self
+
+    def __exit__(
+        self, exc_type: type[BaseException] | None, exc: BaseException | None, traceback: TracebackType | None
+    ) -> None:
+        try:
+            # Leave the raw REPL
+            self._serial.write(b"\r\x02")
+            if self._soft_reset:
+                self._serial.write(b"\x04")
+        finally:
+            self._serial.close()
+            self._serial = None
+
+    def _read_until(self, expected: bytes) -> bytes:
+        data = self._serial.read_until(expected)
+        if not data.endswith(expected):
+            msg = f"Timed out waiting for {expected!r} from the board at {self._port} (received {data!r})."
+            raise RawREPLError(msg)
+        return data
+
+    def _paste(self, code: bytes) -> None:
+        """Send the code in raw-paste mode, following the board's flow control."""
+        window_size = struct.unpack("<H", self._serial.read(2))[0]
+        window = window_size
+        offset = 0
+        while offset < len(code):
+            while window == 0 or self._serial.in_waiting:
+                flow = self._serial.read(1)
+                if flow == b"\x01":
+                    window += window_size
+                elif flow == b"\x04":
+                    # The board aborted the paste
+                    self._serial.write(b"\x04")
+                    return
+                else:
+                    msg = f"Unexpected data {flow!r} from the board at {self._port} during raw paste."
+                    raise RawREPLError(msg)
+            chunk = code[offset : offset + window]
+            self._serial.write(chunk)
+            window -= len(chunk)
+            offset += len(chunk)
+        self._serial.write(b"\x04")
+        self._read_until(b"\x04")
+
+    def exec(self, code: str | bytes) -> bytes:
+        """Run the code on the board, returning its output.
+
+        Raises a :class:`RawREPLError` if the code raises an exception on the board.
+        """
+        if isinstance(code, str):
+            code = code.encode()
+        sent = False
+        if self._raw_paste:
+            self._serial.write(b"\x05A\x01")
+            response = self._serial.read(2)
+            if response == b"R\x01":
+                self._paste(code)
+                sent = True
+            elif response == b"R\x00":
+                self._raw_paste = False
+            else:
+                # The board does not understand the raw-paste request and answers with the raw REPL prompt
+                self._read_until(RAW_REPL_PROMPT)
+                self._raw_paste = False
+        if not sent:
+            self._serial.write(code)
+            self._serial.write(b"\x04")
+            self._read_until(b"OK")
+        output = self._read_until(b"\x04")[:-1]
+        error = self._read_until(b"\x04")[:-1]
+        self._read_until(b">")
+        if error:
+            msg = f"The code failed on the board at {self._port}: {error.decode(errors='replace').strip()}"
+            raise RawREPLError(msg)
+        return output
+
+    def eval(self, expression: str) -> str:
+        """Evaluate the expression on the board, returning its printed value."""
+        return self.exec(f"print({expression})").decode().strip()
+
+    def clear(self) -> None:
+        """Remove all files and directories from the board's filesystem."""
+        self.remove(["/"])
+
+    def remove(self, paths: list[str]) -> None:
+        """Remove the files and directories, including their contents, from the board's filesystem.
+
+        The root directory itself is never removed, only its contents.
+        """
+        if not paths:
+            return
+        self.exec(
+            "import os\n"
+            "def rm(p):\n"
+            " try:\n"
+            "  os.remove(p)\n"
+            " except OSError:\n"
+            "  for n in os.listdir(p):\n"
+            "   rm(p.rstrip('/')+'/'+n)\n"
+            "  if p!='/':\n"
+            "   os.rmdir(p)\n"
+            f"for p in {paths!r}:\n"
+            " rm(p)\n"
+            "del rm\n"
+        )
+        self._directories = {
+            directory
+            for directory in self._directories
+            if not any(path in ("/", directory) or directory.startswith(f"{path}/") for path in paths)
+        }
+
+    def file_hashes(self) -> dict[str, str | None]:
+        """Return the hex-encoded SHA256 hash of every file on the board, in a single execution.
+
+        Directories are included with a hash of None. Paths are relative to the root directory.
+        """
+        hashes = literal_eval(
+            self.exec(
+                "import os,hashlib,binascii\n"
+                "def walk(p,r):\n"
+                " for n in os.listdir(p or '/'):\n"
+                "  q=p+'/'+n if p else n\n"
+                "  if os.stat(q)[0]&0x4000:\n"
+                "   r[q]=None\n"
+                "   walk(q,r)\n"
+                "  else:\n"
+                "   h=hashlib.sha256()\n"
+                "   f=open(q,'rb')\n"
+                "   b=f.read(512)\n"
+                "   while b:\n"
+                "    h.update(b)\n"
+                "    b=f.read(512)\n"
+                "   f.close()\n"
+                "   r[q]=binascii.hexlify(h.digest()).decode()\n"
+                "r={}\n"
+                "walk('',r)\n"
+                "print(repr(r))\n"
+                "del walk,r\n"
+            ).decode()
+        )
+        self._directories = {path for path, filehash in hashes.items() if filehash is None}
+        return hashes
+
+    def write_file(self, filename: str, data: bytes) -> None:
+        """Write the data to the file on the board, creating its parent directories as needed.
+
+        The data is sent as a sequence of write statements, in as few executions as the code size limit allows.
+        """
+        code = ["import os\n"]
+        parts = filename.split("/")[:-1]
+        for idx in range(len(parts)):
+            directory = "/".join(parts[: idx + 1])
+            if directory not in self._directories:
+                code.append(f"try:\n os.mkdir({directory!r})\nexcept OSError:\n pass\n")
+                self._directories.add(directory)
+        code.append(f"f=open({filename!r},'wb')\nw=f.write\n")
+        size = sum(len(line) for line in code)
+        for offset in range(0, len(data), WRITE_SIZE):
+            line = f"w({data[offset : offset + WRITE_SIZE]!r})\n"
+            if size + len(line) > MAX_CODE_SIZE:
+                self.exec("".join(code))
+                code = []
+                size = 0
+            code.append(line)
+            size += len(line)
+        code.append("f.close()\n")
+        self.exec("".join(code))
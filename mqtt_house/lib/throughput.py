@@ -0,0 +1,60 @@
+"""Record the upload throughput measured for each device."""
+
+import json
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+
+from mqtt_house.util import get_cache_dir, slugify
+
+#: The number of most recent uploads that are kept per device.
+HISTORY_SIZE = 10
+
+
+def _history_file() -> Path:
+    return get_cache_dir() / "throughput.json"
+
+
+def load_history() -> dict[str, list[list[float]]]:
+    """Load the measured uploads, as lists of [bytes transferred, duration in seconds] keyed by device slug."""
+    try:
+        with open(_history_file()) as in_f:
+            history = json.load(in_f)
+        if isinstance(history, dict):
+            return history
+    except (OSError, ValueError):
+        pass
+    return {}
+
+
+def record_throughput(device: str, transferred: int, duration: float) -> None:
+    """Record an upload of `transferred` bytes to the device that took `duration` seconds.
+
+    Uploads without any data are not recorded, as they do not tell anything about the device's throughput.
+    """
+    if transferred <= 0 or duration <= 0:
+        return
+    history = load_history()
+    uploads = history.setdefault(slugify(device), [])
+    uploads.append([transferred, duration])
+    del uploads[:-HISTORY_SIZE]
+    path = _history_file()
+    with NamedTemporaryFile("w", dir=path.parent, delete=False) as out_f:
+        json.dump(history, out_f)
+    Path(out_f.name).replace(path)
+
+
+def get_throughput(device: str | None = None) -> float | None:
+    """Return the measured throughput of the device in bytes per second, over its most recent uploads.
+
+    If no `device` is given, the throughput over the recent uploads of all devices is returned. Returns None if no
+    uploads have been recorded.
+    """
+    history = load_history()
+    if device is None:
+        uploads = [upload for device_uploads in history.values() for upload in device_uploads]
+    else:
+        uploads = history.get(slugify(device), [])
+    duration = sum(upload[1] for upload in uploads)
+    if duration <= 0:
+        return None
+    return sum(upload[0] for upload in uploads) / duration
@@ -306,6 +306,38 @@ class AsyncBytesIO:
         pass
 
 
+class BodyStream:
+    """A stream that reads a request body of known length from the
+    connection, without reading past its end, so that the connection can be
+    reused for the next request."""
+
+    def __init__(self, stream, length):
+        self.stream = stream
+        #: The number of bytes of the body that have not been read yet.
+        self.remaining = length
+
+    async def read(self, n=-1):
+        if n < 0 or n > self.remaining:
+            n = self.remaining
+        if n == 0:
+            return b""
+        data = await self.stream.read(n)
+        self.remaining -= len(data)
+        return data
+
+    async def readline(self):
+        if self.remaining == 0:
+            return b""
+        line = await self.stream.readline()
+        self.remaining -= len(line)
+        return line
+
+    async def readexactly(self, n):
+        data = await self.stream.readexactly(min(n, self.remaining))
+        self.remaining -= len(data)
+        return data
+
+
 class Request:
     """An HTTP request."""
 
@@ -368,6 +400,9 @@ class Request:
         #: A general purpose container for applications to store data during
         #: the life of the request.
         self.g = Request.G()
+        #: Whether the client asked for the connection to be kept open for
+        #: further requests.
+        self.keep_alive = False
 
         self.http_version = http_version
         if "?" in self.path:
@@ -382,6 +417,15 @@ class Request:
             for cookie in self.headers["Cookie"].split(";"):
                 name, value = cookie.strip().split("=", 1)
                 self.cookies[name] = value
+        connection = self.headers.get("Connection", "").lower()
+        if "Transfer-Encoding" in self.headers:
+            # the end of the body cannot be found, so the connection cannot
+            # be reused
+            self.keep_alive = False
+        elif http_version == "1.0":
+            self.keep_alive = connection == "keep-alive"
+        else:
+            self.keep_alive = connection != "close"
 
         self._body = body
         self.body_used = False
@@ -430,9 +474,12 @@ class Request:
         if content_length and content_length <= Request.max_body_length:
             body = await client_reader.readexactly(content_length)
             stream = None
-        else:
-            body = b""
+        elif content_length:
+            stream = BodyStream(client_reader, content_length)
+        elif "Transfer-Encoding" in headers:
             stream = client_reader
+        else:
+            stream = None
 
         return Request(
             app,
@@ -469,6 +516,12 @@ class Request:
             self._stream = AsyncBytesIO(self._body)
         return self._stream
 
+    @property
+    def body_consumed(self):
+        """Whether the body of the request has been read completely from the
+        connection."""
+        return not isinstance(self._stream, BodyStream) or self._stream.remaining == 0
+
     @property
     def json(self):
         """The parsed JSON body, or ``None`` if the request does not have a
@@ -647,6 +700,8 @@ class Response:
     def complete(self):
         if isinstance(self.body, bytes) and "Content-Length" not in self.headers:
             self.headers["Content-Length"] = str(len(self.body))
+        elif self.body is None and self.status_code not in (204, 304) and "Content-Length" not in self.headers:
+            self.headers["Content-Length"] = "0"
         if "Content-Type" not in self.headers:
             self.headers["Content-Type"] = self.default_content_type
             if "charset=" not in self.headers["Content-Type"]:
@@ -658,7 +713,7 @@ class Response:
         try:
             # status code
             reason = self.reason if self.reason is not None else ("OK" if self.status_code == 200 else "N/A")
-            await stream.awrite(f"HTTP/1.0 {self.status_code} {reason}\r\n".encode())
+            await stream.awrite(f"HTTP/1.1 {self.status_code} {reason}\r\n".encode())
 
             # headers
             for header, value in self.headers.items():
@@ -689,6 +744,14 @@ class Response:
             else:
                 raise
 
+    @property
+    def keep_alive(self):
+        """Whether the connection can be reused after this response, which
+        requires the length of the body to be known."""
+        if self.headers.get("Connection", "").lower() == "close":
+            return False
+        return self.is_head or self.body is None or isinstance(self.body, bytes) or "Content-Length" in self.headers
+
     def body_iter(self):
         if hasattr(self.body, "__anext__"):
             # response body is an async generator
@@ -893,6 +956,23 @@ class Microdot:
         app = Microdot()
     """
 
+    #: The number of seconds that an idle persistent connection is kept open,
+    #: waiting for the next request.
+    #:
+    #: Example::
+    #:
+    #:    Microdot.keep_alive_timeout = 10  # keep idle connections for 10s
+    keep_alive_timeout = 5
+
+    #: The maximum number of requests that are handled on a single persistent
+    #: connection before it is closed. Set to 1 to close every connection
+    #: after a single request.
+    #:
+    #: Example::
+    #:
+    #:    Microdot.max_keep_alive_requests = 1  # disable persistent connections
+    max_keep_alive_requests = 100
+
     def __init__(self):
         self.url_map = []
         self.before_request_handlers = []
@@ -1272,6 +1352,7 @@ class Microdot:
                 request.app.shutdown()
                 return 'The server is shutting down...'
         """
+        self.shutdown_requested = True
         self.server.close()
 
     def find_route(self, req):
@@ -1302,15 +1383,44 @@ class Microdot:
         return {"Allow": ", ".join(allow)}
 
     async def handle_request(self, reader, writer):
-        req = None
-        try:
-            req = await Request.create(self, reader, writer, writer.get_extra_info("peername"))
-        except Exception as exc:  # pragma: no cover
-            print_exception(exc)
-
-        res = await self.dispatch_request(req)
-        if res != Response.already_handled:  # pragma: no branch
-            await res.write(writer)
+        count = 0
+        keep_alive = True
+        while keep_alive:
+            req = None
+            try:
+                req = await asyncio.wait_for(
+                    Request.create(self, reader, writer, writer.get_extra_info("peername")), self.keep_alive_timeout
+                )
+            except asyncio.TimeoutError:
+                break
+            except Exception as exc:  # pragma: no cover
+                print_exception(exc)
+                keep_alive = False
+            else:
+                if req is None and count > 0:
+                    # the client closed the persistent connection
+                    break
+            count += 1
+
+            res = await self.dispatch_request(req)
+            # the connection can only be reused if the next request starts
+            # where this request's body ended
+            keep_alive = (
+                keep_alive
+                and req is not None
+                and req.keep_alive
+                and req.body_consumed
+                and res.keep_alive
+                and count < self.max_keep_alive_requests
+                and not self.shutdown_requested
+            )
+            if res != Response.already_handled:  # pragma: no branch
+                res.headers["Connection"] = "keep-alive" if keep_alive else "close"
+                await res.write(writer)
+            else:  # pragma: no cover
+                keep_alive = False
+            if self.debug and req:  # pragma: no cover
+                print(f"{req.method} {req.path} {res.status_code}")
         try:
             await writer.aclose()
         except OSError as exc:  # pragma: no cover
@@ -1318,8 +1428,6 @@ class Microdot:
                 pass
             else:
                 raise
-        if self.debug and req:  # pragma: no cover
-            print(f"{req.method} {req.path} {res.status_code}")
 
     async def dispatch_request(self, req):
         after_request_handled = False
@@ -34,7 +34,12 @@ class EnviroDevice(Device):
                     await asyncio.sleep(5)
             if connected:
                 await self.discover()
+                # Take a single measurement, as the device powers down until the next alarm afterwards
+                for entity in self._entitites:
+                    if entity.interval is not None:
+                        await entity.measure()
         finally:
+            self._state_store.flush()
             self._client.close()
             status_led.shutdown()
 
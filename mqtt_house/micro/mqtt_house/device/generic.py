@@ -4,8 +4,14 @@ import network
 import sys
 
 from mqtt_as import MQTTClient, config
+from ota_server import boot_id, reset_hooks, stats_hooks
 from status_led import status_led
 
+from mqtt_house.__about__ import __version__
+from mqtt_house.queue import PriorityMsgQueue
+from mqtt_house.scheduler import Scheduler
+from mqtt_house.state import StateStore
+from mqtt_house.topics import TopicIndex
 from mqtt_house.util import slugify
 
 
@@ -28,18 +34,27 @@ class Device:
         config["ssid"] = settings["wifi"]["ssid"]
         config["wifi_pw"] = settings["wifi"]["password"]
         network.hostname(slugify(settings["device"]["name"]))
-        config["queue_len"] = 1
+        config["queue_len"] = (
+            settings["device"]["queue_len"] if "queue_len" in settings["device"] else 8
+        )
         MQTTClient.DEBUG = True
         self._client = MQTTClient(config)
+        # Replace the client's queue, so that commands are handled first and are not overwritten by other messages
+        self._client.queue = PriorityMsgQueue(config["queue_len"])
+        self._client._cb = self._client.queue.put
+        stats_hooks["queue"] = self._client.queue.stats
 
         self.name = settings["device"]["name"]
         self.identifier = slugify(self.name)
 
-        try:
-            with open("state.json") as in_f:
-                self.state = json.load(in_f)
-        except Exception:
-            self.state = {}
+        self._state_store = StateStore(
+            flush_interval=settings["device"]["state_flush_interval"]
+            if "state_flush_interval" in settings["device"]
+            else 30
+        )
+        self.state = self._state_store.state
+        # Always write the latest states before the device is reset for an update
+        reset_hooks.append(self._state_store.flush)
 
         self._entitites = []
         for entity in entities:
@@ -59,55 +74,140 @@ class Device:
                         ),
                     )
                 )
+                if not self._entitites[-1].persist_state:
+                    self._state_store.exclude(entity["name"])
             except Exception as e:
                 print(e)
 
         self._server = server
-
-    async def subscribe(self, topic):
-        """Subscribe to the given MQTT topic."""
+        self._scheduler = Scheduler()
+        self._scheduled = False
+        self._discovery_task = None
+        self._boot_announced = False
+        self._rediscover = False
+        self._status_topic = f"{settings['mqtt']['prefix']}/status".encode()
+        self._topics = TopicIndex()
+
+    async def subscribe(self, topic, handler=None):
+        """Subscribe to the given MQTT topic.
+
+        The `handler` is called with the topic and the decoded JSON message for every message received on the topic.
+        The topic may contain a single "+" wildcard, which matches one level of the topic.
+        """
+        if handler is not None:
+            self._topics.add(topic, handler)
         status_led.start_activity()
         await self._client.subscribe(topic)
         status_led.stop_activity()
 
-    async def publish(self, topic, message):
+    def find_handler(self, topic):
+        """Find the handler for the topic, returning the handler and the topic as a string, or None if there is none."""
+        return self._topics.find(topic)
+
+    async def publish(self, topic, message, retain=False):
         """Publish an MQTT message."""
         status_led.start_activity()
-        await self._client.publish(topic, message)
+        await self._client.publish(topic, message, retain)
         status_led.stop_activity()
 
-    async def update_state(self, name, state):
-        """Update the global state with the state of an entity."""
-        self.state[name] = state
-        with open("state.json", "w") as out_f:
-            json.dump(self.state, out_f)
+    async def announce_boot(self):
+        """Publish the retained boot announcement, which tells the host that the device is up after a reset."""
+        await self._client.publish(
+            f"mqtt-house/{self.identifier}/booted",
+            json.dumps(
+                {
+                    "version": __version__,
+                    "boot_id": boot_id,
+                    "ip": network.WLAN(network.STA_IF).ifconfig()[0],
+                }
+            ).encode(),
+            retain=True,
+            qos=1,
+        )
+
+    async def update_state(self, name, state, persist=True):
+        """Update the global state with the state of an entity.
+
+        If persist is set, the state is written to the flash in the background, so that it survives a reset.
+        """
+        self._state_store.set(name, state, persist)
 
     async def discover(self):
-        """Run the discovery process for all entities and then publish their states."""
-        for entity in self._entitites:
-            await entity.discover()
-        await asyncio.sleep(5)
+        """Run the discovery process for all entities and then publish their states.
+
+        The entities are discovered concurrently, so that their subscriptions and configuration messages are
+        pipelined. The states are only published once all configurations have been sent. As states are retained,
+        Home Assistant receives them as soon as it has processed the configurations.
+        """
+        await asyncio.gather(*[entity.discover() for entity in self._entitites])
+        await self.clear_retained_states()
         for entity in self._entitites:
             await entity.publish_state()
 
+    async def clear_retained_states(self, filename="retained.json"):
+        """Clear the retained states of the entities that have been removed from the device.
+
+        The state topics of the entities are recorded in the filename. The retained state of every recorded topic that
+        no longer belongs to an entity is cleared by publishing an empty retained message, so that stale states do not
+        stay on the broker.
+        """
+        topics = [entity.state_topic for entity in self._entitites if entity.state_topic is not None]
+        try:
+            with open(filename) as in_f:
+                recorded = json.load(in_f)
+        except Exception:
+            recorded = []
+        for topic in recorded:
+            if topic not in topics:
+                await self.publish(topic, b"", retain=True)
+        if recorded != topics:
+            with open(filename, "w") as out_f:
+                json.dump(topics, out_f)
+
+    def start_discovery(self):
+        """Run the discovery in the background, so that incoming messages continue to be handled.
+
+        If a discovery is already running, the discovery is run again once it has completed.
+        """
+        if self._discovery_task is None:
+            self._discovery_task = asyncio.create_task(self._discovery())
+        else:
+            self._rediscover = True
+
+    async def _discovery(self):
+        """Run the discovery until no further discovery has been requested.
+
+        After the first discovery, the measurements of all entities that have an interval are scheduled.
+        """
+        try:
+            while True:
+                self._rediscover = False
+                try:
+                    await self.discover()
+                except Exception as e:
+                    print(e)
+                if not self._scheduled:
+                    for entity in self._entitites:
+                        if entity.interval is not None:
+                            self._scheduler.add(entity.interval, entity.measure)
+                    self._scheduled = True
+                if not self._rediscover:
+                    break
+        finally:
+            self._discovery_task = None
+
     async def messages(self):
         """Handle incoming MQTT messages."""
         async for topic, message, retained in self._client.queue:
             try:
-                status_led.start_activity()
-                topic = topic.decode()
-                status_led.stop_activity()
-                if topic == f"{self.settings['mqtt']['prefix']}/status":
-                    if message.decode() == "online":
-                        await self.discover()
+                if topic == self._status_topic:
+                    if message == b"online":
+                        self.start_discovery()
                 else:
-                    found = False
-                    for entity in self._entitites:
-                        if entity.mqtt_topic("set") == topic:
-                            await entity.message(topic, json.loads(message))
-                            found = True
-                            break
-                    if not found:
+                    handler = self.find_handler(topic)
+                    if handler is not None:
+                        await handler[0](handler[1], json.loads(message))
+                    else:
                         print(topic)
             except Exception as e:
                 print(e)
@@ -118,11 +218,16 @@ class Device:
             await self._client.up.wait()
             self._client.up.clear()
             status_led.stop_indeterminate()
+            if not self._boot_announced:
+                # Only announce the boot once, so that reconnecting is not mistaken for a reset
+                await self.announce_boot()
+                self._boot_announced = True
             await self.subscribe(f"{self.settings['mqtt']['prefix']}/status")
-            await self.discover()
+            self.start_discovery()
 
     async def start(self):
         """Start the controller."""
+        asyncio.create_task(self._state_store.run())
         try:
             while True:
                 try:
@@ -136,5 +241,6 @@ class Device:
                     print(e)
                     await asyncio.sleep(5)
         finally:
+            self._state_store.flush()
             self._client.close()
             status_led.shutdown()
@@ -7,21 +7,48 @@ from mqtt_house.util import slugify
 
 
 class Entity:
-    """Represents a single Entity."""
+    """Represents a single Entity.
+
+    If persist_state is set, the entity's state is persisted, so that it can be restored after a reset. If the
+    entity has a default_interval, its measure method is run every default_interval seconds, which can be changed
+    with the interval option.
+    """
+
+    persist_state = True
+    default_interval = None
 
     def __init__(self, device, entity, initial_state):
         """Initialise the entity with the device and entity settings."""
         self._device = device
         self._entity = entity
         self._state = initial_state
+        self._topic_base = None
+        self.interval = (
+            entity["options"]["interval"]
+            if "options" in entity and "interval" in entity["options"]
+            else self.default_interval
+        )
 
     def mqtt_topic(self, topic):
-        """Return the correct MQTT topic for this entity."""
-        return f"{self._device.settings['mqtt']['prefix']}/{self._entity['device_class']}/{self._device.identifier}-{slugify(self._entity['name'])}/{topic}"
+        """Return the correct MQTT topic for this entity.
+
+        The common part of the entity's topics is only built on first use, as subclasses set the device class after
+        the entity has been initialised.
+        """
+        if self._topic_base is None:
+            self._topic_base = f"{self._device.settings['mqtt']['prefix']}/{self._entity['device_class']}/{self._device.identifier}-{slugify(self._entity['name'])}"
+        return f"{self._topic_base}/{topic}"
+
+    @property
+    def state_topic(self):
+        """The MQTT topic of the entity's state, or None if the entity has no state."""
+        if "device_class" in self._entity:
+            return self.mqtt_topic("state")
+        return None
 
     async def subscribe(self, topic):
-        """Subscribe to an MQTT topic."""
-        await self._device.subscribe(topic)
+        """Subscribe to an MQTT topic, with the messages received on it handled by :meth:`message`."""
+        await self._device.subscribe(topic, self.message)
 
     async def discover(self):
         """Unused."""
@@ -46,14 +73,23 @@ class Entity:
         )
 
     async def publish_state(self):
-        """Publish the Entity's current state."""
-        if "device_class" in self._entity:
-            await self._device.update_state(self._entity["name"], self._state)
+        """Publish the Entity's current state, if it has one.
+
+        The state is retained, so that Home Assistant receives it whenever it subscribes to the state topic. The
+        device clears the retained state once the entity has been removed.
+        """
+        if "device_class" in self._entity and self._state is not None:
+            await self._device.update_state(self._entity["name"], self._state, self.persist_state)
             await self._device.publish(
                 self.mqtt_topic("state"),
                 json.dumps(self._state).encode(),
+                retain=True,
             )
 
+    async def measure(self):
+        """Unused."""
+        pass
+
     async def message(self, topic, message):
         """Unused."""
         pass
@@ -9,6 +9,8 @@ from mqtt_house.entity.base import Entity
 class SinglePinBinarySensor(Entity):
     """A simple BinarySensor Entity using a single pin."""
 
+    persist_state = False
+
     def __init__(self, device, entity, initial_state):
         """Initialise the BinarySensor, setting up the control pin."""
         super().__init__(device, entity, initial_state)
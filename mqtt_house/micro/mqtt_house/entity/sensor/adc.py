@@ -1,5 +1,4 @@
 """An ADC sensor."""
-import asyncio
 import math
 from machine import ADC, Pin
 
@@ -9,6 +8,9 @@ from mqtt_house.entity.base import Entity
 class ADCSensor(Entity):
     """A sensor connected to one of the ADC pins."""
 
+    persist_state = False
+    default_interval = 0.1
+
     def __init__(self, device, entity, initial_state):
         """Initialise the Entity, setting up the ADC device."""
 
@@ -18,7 +20,6 @@ class ADCSensor(Entity):
 
         self._adc = ADC(Pin(entity["options"]["adc"]["pin"]))
         self._state={"value":0}
-        self._measure_task = None
 
     async def discover(self):
         """Discover this ADC Entity by publishing it to the MQTT server."""
@@ -30,8 +31,6 @@ class ADCSensor(Entity):
                 "suggested_display_precision": 0,
             }
         )
-        if self._measure_task is None:
-            self._measure_task = asyncio.create_task(self.measure_task())
 
     async def _measure_state(self):
         adc_value = self._adc.read_u16() >> (16 - self._entity["options"]["adc"]["bits"])
@@ -42,9 +41,7 @@ class ADCSensor(Entity):
             return True
         return False
 
-    async def measure_task(self):
-        """Background measurement task."""
-        while True:
-            if await self._measure_state():
-                await self.publish_state()
-            await asyncio.sleep(0.1)
+    async def measure(self):
+        """Measure the value, publishing it if it has changed."""
+        if await self._measure_state():
+            await self.publish_state()
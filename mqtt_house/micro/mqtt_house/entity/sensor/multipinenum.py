@@ -1,5 +1,4 @@
 """A sensor that maps multiple pins onto an enumeration of values."""
-import asyncio
 from machine import Pin
 
 from mqtt_house.entity.base import Entity
@@ -8,6 +7,9 @@ from mqtt_house.entity.base import Entity
 class Sensor(Entity):
     """A sensor that maps multiple pins onto an enumeration of values."""
 
+    persist_state = False
+    default_interval = 0.1
+
     def __init__(self, device, entity, initial_state):
         """Initialise the Entity, setting up the individual pins."""
 
@@ -16,7 +18,6 @@ class Sensor(Entity):
         entity["device_class"] = "sensor"
 
         self._state={"value": None}
-        self._measure_task = None
         self._values = []
         for conf in self._entity["options"]["values"]:
             self._values.append({"pin": Pin(conf["pin"], Pin.IN, Pin.PULL_UP), "value": conf["value"]})
@@ -32,18 +33,14 @@ class Sensor(Entity):
                 "options": ["forward", "stop", "reverse"]
             }
         )
-        if self._measure_task is None:
-            self._measure_task = asyncio.create_task(self.measure_task())
-
-    async def measure_task(self):
-        """Background measurement task."""
-        while True:
-            new_state = self._entity["options"]["default"]
-            for value in self._values:
-                if value["pin"].value() == 0:
-                    new_state = value["value"]
-                    break
-            if new_state != self._state["value"]:
-                self._state["value"] = new_state
-                await self.publish_state()
-            await asyncio.sleep(0.1)
+
+    async def measure(self):
+        """Read the pins, publishing the value if it has changed."""
+        new_state = self._entity["options"]["default"]
+        for value in self._values:
+            if value["pin"].value() == 0:
+                new_state = value["value"]
+                break
+        if new_state != self._state["value"]:
+            self._state["value"] = new_state
+            await self.publish_state()
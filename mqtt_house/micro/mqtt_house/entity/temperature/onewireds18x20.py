@@ -11,13 +11,16 @@ from mqtt_house.entity.base import Entity
 class Temperature(Entity):
     """A temperature Entity measuring using one or more DS18x20 onewire sensors."""
 
+    persist_state = False
+    default_interval = 30
+
     def __init__(self, device, entity, initial_state):
         """Initialise the Entity, setting up the control hub."""
         super().__init__(device, entity, initial_state)
 
         entity["device_class"] = "sensor"
         self._sensor_hub = ds18x20.DS18X20(onewire.OneWire(Pin(entity["options"]["pin"])))
-        self._measure_task = None
+        self._sensors = None
 
     async def discover(self):
         """Discover this temperature Entity by publishing it to the MQTT server."""
@@ -31,20 +34,23 @@ class Temperature(Entity):
                 "unit_of_measurement": "°C",
             }
         )
-        if self._measure_task is None:
-            self._measure_task = asyncio.create_task(self.measure_task())
 
-    async def measure_task(self):
-        """Background measurement task."""
-        sensors = self._sensor_hub.scan()
-        while True:
+    async def measure(self):
+        """Publish the temperature and start the next conversion.
+
+        The sensors need up to 750ms to convert the temperature. So that the scheduler is not held up, each
+        measurement reads the conversion started by the previous one. Only the first measurement waits for its
+        conversion.
+        """
+        if self._sensors is None:
+            self._sensors = self._sensor_hub.scan()
             self._sensor_hub.convert_temp()
-            await asyncio.sleep(1)
-            measurements = [self._sensor_hub.read_temp(sensor) for sensor in sensors]
-            if len(measurements) > 0:
-                temperature = sum(measurements) / len(measurements)
-            else:
-                temperature = -56
-            self._state = {"temperature": temperature}
-            await self.publish_state()
-            await asyncio.sleep(29)
+            await asyncio.sleep_ms(750)
+        measurements = [self._sensor_hub.read_temp(sensor) for sensor in self._sensors]
+        if len(measurements) > 0:
+            temperature = sum(measurements) / len(measurements)
+        else:
+            temperature = -56
+        self._state = {"temperature": temperature}
+        self._sensor_hub.convert_temp()
+        await self.publish_state()
@@ -0,0 +1,68 @@
+"""Inbound MQTT messages."""
+import asyncio
+
+
+class PriorityMsgQueue:
+    """Queues the received messages with commands to the entities ahead of all other messages.
+
+    Messages on topics that end in "/set" are commands and go into the priority lane, all other messages, such as the
+    Home Assistant status, into the normal lane. Both lanes share the size. When the queue is full, the oldest normal
+    message is discarded to make room, so that a command is only ever discarded by another command. The numbers of
+    discarded messages and the largest number of messages that were queued at once are kept, so that the size can be
+    chosen from the actual traffic.
+
+    Replaces the `mqtt_as.MsgQueue` and is used in the same way.
+    """
+
+    def __init__(self, size):
+        """Initialise an empty queue that holds up to size messages."""
+        self._size = max(size, 1)
+        self._priority = []
+        self._normal = []
+        self._evt = asyncio.Event()
+        self.discards = 0
+        self.priority_discards = 0
+        self.high_water = 0
+
+    def put(self, *v):
+        """Add the message, discarding the oldest message if the queue is full."""
+        if v[0].endswith(b"/set"):
+            if len(self._priority) + len(self._normal) >= self._size:
+                if self._normal:
+                    self._normal.pop(0)
+                else:
+                    self._priority.pop(0)
+                    self.priority_discards += 1
+                self.discards += 1
+            self._priority.append(v)
+        else:
+            if len(self._priority) + len(self._normal) >= self._size:
+                self.discards += 1
+                if not self._normal:
+                    # Never discard a command for a normal message
+                    return
+                self._normal.pop(0)
+            self._normal.append(v)
+        self.high_water = max(self.high_water, len(self._priority) + len(self._normal))
+        self._evt.set()
+
+    def stats(self):
+        """Return the size, the current length, the high-water mark, and the discard counts."""
+        return {
+            "size": self._size,
+            "length": len(self._priority) + len(self._normal),
+            "high_water": self.high_water,
+            "discards": self.discards,
+            "priority_discards": self.priority_discards,
+        }
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self._priority and not self._normal:
+            self._evt.clear()
+            await self._evt.wait()
+        if self._priority:
+            return self._priority.pop(0)
+        return self._normal.pop(0)
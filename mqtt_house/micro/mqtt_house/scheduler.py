@@ -0,0 +1,63 @@
+"""Periodic jobs."""
+import asyncio
+from time import ticks_add, ticks_diff, ticks_ms
+
+# The resolution of the scheduler in milliseconds. Intervals are rounded to multiples of it and all jobs run on the
+# same grid of slots, so that jobs that are due in the same slot run in a single wake-up.
+SLOT_MS = 100
+
+
+class Scheduler:
+    """Runs periodic jobs from a single task, on a drift-free grid of time slots."""
+
+    def __init__(self):
+        """Initialise the scheduler without any jobs."""
+        self._jobs = []
+        self._added = asyncio.Event()
+        self._task = None
+
+    def add(self, interval, callback):
+        """Run the async callback every interval seconds, starting in the current slot.
+
+        The job's due times are kept on the grid of the existing jobs. The scheduler starts with the first job.
+        """
+        interval = max(round(interval * 1000 / SLOT_MS), 1) * SLOT_MS
+        now = ticks_ms()
+        if self._jobs:
+            due = self._jobs[0][0]
+            due = ticks_add(due, ticks_diff(now, due) // SLOT_MS * SLOT_MS)
+        else:
+            due = now
+        self._jobs.append([due, interval, callback])
+        self._added.set()
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def run(self):
+        """Run the jobs whenever they are due, sleeping until the next slot with a due job."""
+        while True:
+            now = ticks_ms()
+            delay = None
+            for job in self._jobs:
+                job_delay = ticks_diff(job[0], now)
+                if delay is None or job_delay < delay:
+                    delay = job_delay
+            if delay > 0:
+                self._added.clear()
+                try:
+                    await asyncio.wait_for_ms(self._added.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            for job in self._jobs:
+                if ticks_diff(job[0], now) <= 0:
+                    try:
+                        await job[2]()
+                    except Exception as e:
+                        print(e)
+                    # Advance from the due time rather than the current time, so that the job does not drift, and
+                    # skip the slots that were missed while the jobs ran
+                    job[0] = ticks_add(job[0], job[1])
+                    late = ticks_diff(ticks_ms(), job[0])
+                    if late >= 0:
+                        job[0] = ticks_add(job[0], (late // job[1] + 1) * job[1])
@@ -0,0 +1,61 @@
+"""Persistent entity state."""
+import asyncio
+import json
+import os
+
+
+class StateStore:
+    """Holds the state of all entities and writes the persisted states to the filename in the background.
+
+    Changes are only marked as dirty and written at most once every flush_interval seconds, so that frequent state
+    updates neither block the event loop on flash writes nor wear out the flash. The file is written to a temporary
+    file first and then renamed, so that a reset during the write never leaves a corrupt state file.
+    """
+
+    def __init__(self, filename="state.json", flush_interval=30):
+        """Load the persisted states."""
+        self._filename = filename
+        self._flush_interval = flush_interval
+        self._dirty = False
+        self._written = None
+        try:
+            with open(filename) as in_f:
+                self.state = json.load(in_f)
+        except Exception:
+            self.state = {}
+        self._persisted = set(self.state)
+
+    def set(self, name, state, persist=True):
+        """Set the state of the named entity, marking it for writing if it is persisted."""
+        self.state[name] = state
+        if persist:
+            self._persisted.add(name)
+            self._dirty = True
+
+    def exclude(self, name):
+        """Stop persisting the state of the named entity."""
+        if name in self._persisted:
+            self._persisted.discard(name)
+            self._dirty = True
+
+    def flush(self):
+        """Write the persisted states, if any of them has changed since the last write."""
+        if not self._dirty:
+            return
+        self._dirty = False
+        data = json.dumps(dict([(name, self.state[name]) for name in self._persisted if name in self.state]))
+        if data == self._written:
+            return
+        with open(f"{self._filename}.tmp", "w") as out_f:
+            out_f.write(data)
+        os.rename(f"{self._filename}.tmp", self._filename)
+        self._written = data
+
+    async def run(self):
+        """Flush the states every flush_interval seconds."""
+        while True:
+            await asyncio.sleep(self._flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(e)
@@ -0,0 +1,43 @@
+"""Handlers of subscribed MQTT topics."""
+
+
+class TopicIndex:
+    """Finds the handler of a received topic without scanning all subscriptions.
+
+    Topics without wildcards are looked up by the topic as received, so that finding their handlers does not allocate
+    any memory. Topics may contain a single "+" wildcard, which matches one level of the topic.
+    """
+
+    def __init__(self):
+        """Initialise an empty index."""
+        # The handlers of the topics without wildcards, keyed by the topic as received, with the topic as a string
+        self._handlers = {}
+        # The handlers of the topics with a single-level wildcard, as (prefix, suffix, handler) tuples
+        self._wildcard_handlers = []
+
+    def add(self, topic, handler):
+        """Add the handler for the topic, replacing any handler that the topic already has."""
+        if "+" in topic:
+            prefix, suffix = topic.split("+", 1)
+            prefix = prefix.encode()
+            suffix = suffix.encode()
+            self._wildcard_handlers = [item for item in self._wildcard_handlers if item[:2] != (prefix, suffix)]
+            self._wildcard_handlers.append((prefix, suffix, handler))
+        else:
+            self._handlers[topic.encode()] = (handler, topic)
+
+    def find(self, topic):
+        """Find the handler for the received topic, returning the handler and the topic as a string, or None."""
+        handler = self._handlers.get(topic)
+        if handler is not None:
+            return handler
+        for prefix, suffix, wildcard_handler in self._wildcard_handlers:
+            end = len(topic) - len(suffix)
+            if (
+                end >= len(prefix)
+                and topic.startswith(prefix)
+                and topic.endswith(suffix)
+                and topic.find(b"/", len(prefix), end) < 0
+            ):
+                return wildcard_handler, topic.decode()
+        return None
@@ -1,7 +1,9 @@
 import asyncio
 import binascii
+import io
 import json
 import os
+import sys
 
 from hashlib import sha256
 from machine import reset
@@ -10,9 +12,43 @@ from status_led import status_led
 
 from mqtt_house.__about__ import __version__
 
+try:
+    import deflate
+except ImportError:
+    deflate = None
+
+features = ["bundle", "resume"]
+if deflate is not None:
+    features.append("deflate")
+
+try:
+    mpy_version = f"{sys.implementation._mpy & 0xFF}.{sys.implementation._mpy >> 8 & 3}"
+except AttributeError:
+    mpy_version = None
+
+# A random id that changes on every boot, so that the host can tell when the device has reset
+boot_id = binascii.hexlify(os.urandom(4)).decode()
+
 Request.max_content_length = 1024 * 1024
+# Stream all but the smallest bodies from the connection in chunks, rather than reading them into memory before the
+# handler runs, so that concurrent uploads only hold a chunk each
+Request.max_body_length = 1024
 server = Microdot()
 
+# The number of seconds to wait for more data, before an interrupted upload is stopped and kept for resuming
+UPLOAD_TIMEOUT = 10
+
+# The verified hashes of the completed uploads
+received_hashes = {}
+# The size and running hash of the partial uploads
+partial_hashes = {}
+# The fileids of the uploads that are currently being received
+active_uploads = set()
+# The functions that are called before the device resets, for example to write any unsaved state
+reset_hooks = []
+# The functions that return the runtime statistics of the application, keyed by the name of the statistics
+stats_hooks = {}
+
 
 def file_exists(filename):
     """Check if the given filename exists."""
@@ -69,6 +105,51 @@ def listdirs(dirpath):
     return dirnames, filenames
 
 
+def walk(dirpath=""):
+    """Yield the paths of all files underneath dirpath."""
+    for name in os.listdir(dirpath) if dirpath else os.listdir():
+        fullpath = f"{dirpath}/{name}" if dirpath else name
+        if is_dir(fullpath):
+            yield from walk(fullpath)
+        else:
+            yield fullpath
+
+
+async def file_hash(filename):
+    """Calculate the sha256 hash of the given file.
+
+    Yields to the other tasks after every chunk, so that hashing large files does not block MQTT and the entities.
+    """
+    sha256_hash = sha256()
+    buffer = memoryview(bytearray(1024))
+    with open(filename, "rb") as in_f:
+        while True:
+            size = in_f.readinto(buffer)
+            if not size:
+                break
+            sha256_hash.update(buffer[:size])
+            await asyncio.sleep(0)
+    return binascii.hexlify(sha256_hash.digest()).decode()
+
+
+def file_size(filename):
+    """Return the size of the given file or 0 if it does not exist."""
+    try:
+        return os.stat(filename)[6]
+    except OSError:
+        return 0
+
+
+def upload_filename(fileid):
+    """Return the filename that the upload with the given fileid is stored in."""
+    return "uploads/inventory.json" if fileid == "-1" else f"uploads/{fileid}"
+
+
+def partial_filename(fileid, encoding, filehash):
+    """Return the filename that the partial upload with the given fileid, encoding, and hash is stored in."""
+    return f"uploads/{fileid}.{encoding}.{filehash}.part"
+
+
 def rmtree(dirpath):
     """Remove the tree of files at dirpath."""
     dirnames, filenames = listdirs(dirpath)
@@ -78,10 +159,59 @@ def rmtree(dirpath):
         os.remove(dirname)
 
 
+def read_fingerprint():
+    """Return the fingerprint of the installed build or None if it is not known."""
+    if file_exists("fingerprint.txt"):
+        with open("fingerprint.txt") as in_f:
+            return in_f.read().strip()
+    return None
+
+
 @server.get("/ota/about")
 def about(request):
     """Return information about this device."""
-    return {"version": __version__}
+    return {
+        "version": __version__,
+        "features": features,
+        "mpy": mpy_version,
+        "boot_id": boot_id,
+        "fingerprint": read_fingerprint(),
+    }
+
+
+@server.get("/ota/stats")
+def stats(request):
+    """Return the runtime statistics of the application."""
+    result = {}
+    for name, hook in stats_hooks.items():
+        try:
+            result[name] = hook()
+        except Exception as e:
+            print(e)
+    return result
+
+
+@server.get("/ota/manifest")
+async def manifest(request):
+    """Return the sha256 hashes of all installed files."""
+    status_led.start_activity()
+    hashes = {}
+    try:
+        for filename in walk():
+            if not filename.startswith("uploads/"):
+                hashes[filename] = await file_hash(filename)
+    finally:
+        status_led.stop_activity()
+    return hashes
+
+
+def run_reset_hooks():
+    """Run the functions that need to be called before the device resets."""
+    for hook in reset_hooks:
+        try:
+            hook()
+        except Exception as e:
+            print(e)
 
 
 @server.post("/ota/reset")
@@ -89,62 +219,332 @@ def handle_reset(request):
     """Request that the device reset itself."""
 
     async def reset_task():
-        """Wait one second and then reset."""
+        """Wait one second, run the reset hooks, and then reset."""
         await asyncio.sleep(1)
+        run_reset_hooks()
         reset()
 
     status_led.start_indeterminate()
     asyncio.create_task(reset_task())
-    return None, 202
+    # Close the connection, so that the client does not try to reuse it after the reset
+    return None, 202, {"Connection": "close"}
 
 
-@server.put("/ota/inventory")
-async def update_inventory(request):
-    """Upload the OTA inventory."""
-    status_led.start_activity()
-    size = int(request.headers["Content-Length"])
-    upload_hash = request.headers["X-Filehash"]
-    hash = sha256()
+# The number of compressed bytes that are read ahead before each block of decompressed data is produced. A block of
+# DECOMPRESS_BLOCK_SIZE bytes needs at most two bytes of input per byte plus one block header, so the decompressor
+# never runs out of input in the middle of a block.
+DECOMPRESS_READ_AHEAD = 1024
+DECOMPRESS_BLOCK_SIZE = 256
+
+
+class ReadAheadBuffer(io.IOBase):
+    """Provides the data read ahead from an asynchronous stream to the synchronous decompressor."""
+
+    def __init__(self, stream, size):
+        """Initialise the buffer for size bytes of the stream."""
+        self._stream = stream
+        self._remaining = size
+        self._data = b""
+        self._offset = 0
+
+    async def fill(self, minimum):
+        """Read ahead until minimum bytes are buffered or the data has been read, returning False if it ended early."""
+        if self._offset > 0:
+            self._data = self._data[self._offset :]
+            self._offset = 0
+        while len(self._data) < minimum and self._remaining > 0:
+            chunk = await self._stream.read(min(self._remaining, 1024))
+            if not chunk:
+                return False
+            self._data += chunk
+            self._remaining -= len(chunk)
+        return True
+
+    async def skip(self):
+        """Read and discard the rest of the data, returning False if it ended early."""
+        self._data = b""
+        self._offset = 0
+        while self._remaining > 0:
+            chunk = await self._stream.read(min(self._remaining, 1024))
+            if not chunk:
+                return False
+            self._remaining -= len(chunk)
+        return True
+
+    def readinto(self, buf):
+        """Copy the buffered data into buf."""
+        size = min(len(buf), len(self._data) - self._offset)
+        buf[:size] = self._data[self._offset : self._offset + size]
+        self._offset += size
+        return size
+
+
+async def receive_stream(stream, size, filename, compressed):
+    """Receive size bytes from the stream into filename, returning the sha256 hash of the received file.
+
+    Compressed data is decompressed while it is received, so that only the decompressed file is written to the flash
+    and the full file is never held in memory. Returns None if the data could not be received.
+    """
     if not is_dir("uploads"):
         os.mkdir("uploads")
-    with open("uploads/inventory.json", "wb") as out_f:
+    sha256_hash = sha256()
+    complete = True
+    with open(filename, "wb") as out_f:
+        if compressed:
+            source = ReadAheadBuffer(stream, size)
+            decompressor = deflate.DeflateIO(source, deflate.ZLIB)
+            buffer = memoryview(bytearray(DECOMPRESS_BLOCK_SIZE))
+            try:
+                while True:
+                    if not await source.fill(DECOMPRESS_READ_AHEAD):
+                        complete = False
+                        break
+                    length = decompressor.readinto(buffer)
+                    if not length:
+                        break
+                    sha256_hash.update(buffer[:length])
+                    out_f.write(buffer[:length])
+            except OSError:
+                # The data is corrupt
+                complete = False
+            complete = complete and await source.skip()
+        else:
+            while size > 0:
+                chunk = await stream.read(min(size, 1024))
+                if not chunk:
+                    break
+                sha256_hash.update(chunk)
+                out_f.write(chunk)
+                size -= len(chunk)
+            complete = size == 0
+    if not complete:
+        os.remove(filename)
+        return None
+    return binascii.hexlify(sha256_hash.digest()).decode()
+
+
+async def decompress_file(source, filename):
+    """Decompress the source file into filename in chunks, returning the sha256 hash of the decompressed file.
+
+    The source file is removed afterwards.
+    """
+    sha256_hash = sha256()
+    buffer = memoryview(bytearray(1024))
+    with open(source, "rb") as in_f:
+        with open(filename, "wb") as out_f:
+            stream = deflate.DeflateIO(in_f, deflate.ZLIB)
+            while True:
+                size = stream.readinto(buffer)
+                if not size:
+                    break
+                sha256_hash.update(buffer[:size])
+                out_f.write(buffer[:size])
+                await asyncio.sleep(0)
+    os.remove(source)
+    return binascii.hexlify(sha256_hash.digest()).decode()
+
+
+async def receive_partial(request, fileid, filehash, encoding):
+    """Receive a range of an upload, as given by the Content-Range header, returning the response.
+
+    The data is appended to the partial upload file, which is kept if the connection is interrupted, so that the
+    upload can be resumed from where it stopped. When the last range has been received, the upload is verified and
+    moved to its upload filename.
+    """
+    unit, content_range = request.headers["Content-Range"].split(" ", 1)
+    content_range, total = content_range.split("/")
+    start, end = content_range.split("-")
+    start, end, total = int(start), int(end), int(total)
+    if unit != "bytes" or end < start or end >= total:
+        return "Invalid Content-Range", 400
+    filename = upload_filename(fileid)
+    part = partial_filename(fileid, encoding, filehash)
+    if start == 0:
+        # Remove any earlier uploads with this fileid
+        prefix = f"{fileid}."
+        for name in os.listdir("uploads"):
+            if name.startswith(prefix) and name.endswith(".part"):
+                os.remove(f"uploads/{name}")
+        if file_exists(filename):
+            os.remove(filename)
+        received_hashes.pop(filename, None)
+    offset = file_size(part)
+    if start != offset:
+        return f"The upload continues at {offset}", 416
+    if part in partial_hashes and partial_hashes[part][0] == offset:
+        sha256_hash = partial_hashes[part][1]
+    else:
+        # The running hash was lost, for example through a reset, and needs to be recalculated
+        sha256_hash = sha256()
+        if encoding == "identity" and offset > 0:
+            with open(part, "rb") as in_f:
+                buffer = memoryview(bytearray(1024))
+                while True:
+                    size = in_f.readinto(buffer)
+                    if not size:
+                        break
+                    sha256_hash.update(buffer[:size])
+                    await asyncio.sleep(0)
+    size = end - start + 1
+    with open(part, "ab") as out_f:
         while size > 0:
-            chunk = await request.stream.read(min(size, 1024))
-            hash.update(chunk)
+            try:
+                chunk = await asyncio.wait_for(request.stream.read(min(size, 1024)), UPLOAD_TIMEOUT)
+            except asyncio.TimeoutError:
+                break
+            if not chunk:
+                break
+            if encoding == "identity":
+                sha256_hash.update(chunk)
             out_f.write(chunk)
+            offset += len(chunk)
             size -= len(chunk)
-    status_led.stop_activity()
-    if binascii.hexlify(hash.digest()).decode() == upload_hash:
+    if size > 0:
+        partial_hashes[part] = (offset, sha256_hash)
+        return "Upload interrupted", 400
+    if offset < total:
+        partial_hashes[part] = (offset, sha256_hash)
         return None, 204
+    partial_hashes.pop(part, None)
+    if encoding == "deflate":
+        upload_hash = await decompress_file(part, filename)
     else:
-        os.remove("uploads/inventory.json")
+        os.rename(part, filename)
+        upload_hash = binascii.hexlify(sha256_hash.digest()).decode()
+    if upload_hash != filehash:
+        os.remove(filename)
+        return "File hash does not match", 400
+    received_hashes[filename] = filehash
+    return None, 204
+
+
+async def receive_file(request, filename):
+    """Receive the request body into filename, returning the sha256 hash of the received file."""
+    return await receive_stream(
+        request.stream,
+        int(request.headers["Content-Length"]),
+        filename,
+        request.headers.get("Content-Encoding") == "deflate",
+    )
+
+
+def check_encoding(request):
+    """Check that the Content-Encoding of the request is supported."""
+    encoding = request.headers.get("Content-Encoding")
+    return encoding is None or (encoding == "deflate" and deflate is not None)
+
+
+@server.put("/ota/inventory")
+async def update_inventory(request):
+    """Upload the OTA inventory."""
+    if not check_encoding(request):
+        return "Unsupported Content-Encoding", 415
+    status_led.start_activity()
+    try:
+        upload_hash = await receive_file(request, "uploads/inventory.json")
+    finally:
+        status_led.stop_activity()
+    if upload_hash == request.headers["X-Filehash"]:
+        received_hashes["uploads/inventory.json"] = upload_hash
+        return None, 204
+    else:
+        if file_exists("uploads/inventory.json"):
+            os.remove("uploads/inventory.json")
         return "Inventory hash does not match", 400
 
 
+@server.get("/ota/uploads")
+async def list_uploads(request):
+    """Return the size and hash of all uploads received so far, so that interrupted uploads can be resumed.
+
+    Partial uploads also report their encoding and completed uploads are marked as complete.
+    """
+    uploads = {}
+    if is_dir("uploads"):
+        for name in os.listdir("uploads"):
+            filename = f"uploads/{name}"
+            if name.endswith(".part"):
+                fileid, encoding, filehash = name[:-5].split(".")
+                uploads[fileid] = {"size": file_size(filename), "hash": filehash, "encoding": encoding}
+            elif not name.endswith(".z"):
+                if filename not in received_hashes:
+                    received_hashes[filename] = await file_hash(filename)
+                fileid = "-1" if name == "inventory.json" else name
+                uploads[fileid] = {"size": file_size(filename), "hash": received_hashes[filename], "complete": True}
+    return uploads
+
+
 @server.put("/ota/file")
 async def update_file(request):
-    """Update a file on the device."""
+    """Update a file on the device.
+
+    If the request has a Content-Range header, only that range of the file is received and the upload can be resumed
+    after an interruption.
+    """
+    if not check_encoding(request):
+        return "Unsupported Content-Encoding", 415
+    fileid = request.headers["X-Fileid"]
+    if fileid in active_uploads:
+        return "The file is already being uploaded", 409
+    active_uploads.add(fileid)
     status_led.start_activity()
-    size = int(request.headers["Content-Length"])
-    upload_hash = request.headers["X-Filehash"]
-    filename = request.headers["X-Fileid"]
-    if not is_dir("uploads"):
-        os.mkdir("uploads")
-    sha256_hash = sha256()
-    with open(f"uploads/{filename}", "wb") as out_f:
-        while size > 0:
-            chunk = await request.stream.read(min(size, 1024))
-            sha256_hash.update(chunk)
-            out_f.write(chunk)
-            size -= len(chunk)
-    status_led.stop_activity()
-    if binascii.hexlify(sha256_hash.digest()).decode() == upload_hash:
+    filename = upload_filename(fileid)
+    try:
+        if "Content-Range" in request.headers:
+            if not is_dir("uploads"):
+                os.mkdir("uploads")
+            return await receive_partial(
+                request,
+                fileid,
+                request.headers["X-Filehash"],
+                request.headers.get("Content-Encoding", "identity"),
+            )
+        upload_hash = await receive_file(request, filename)
+    finally:
+        active_uploads.discard(fileid)
+        status_led.stop_activity()
+    if upload_hash == request.headers["X-Filehash"]:
+        received_hashes[filename] = upload_hash
         return None, 204
     else:
-        os.remove(f"uploads/{filename}")
+        if file_exists(filename):
+            os.remove(filename)
         return "File hash does not match", 400
 
 
+@server.put("/ota/bundle")
+async def update_bundle(request):
+    """Upload the OTA inventory and all files as a single bundle.
+
+    The bundle consists of one member per file. Each member starts with a header line containing the fileid, size,
+    sha256 hash, and encoding of the member, separated by spaces, followed by the member's data. The member with
+    the fileid -1 is the inventory.
+    """
+    size = int(request.headers["Content-Length"])
+    status_led.start_activity()
+    try:
+        while size > 0:
+            header = await request.stream.readline()
+            size -= len(header)
+            fileid, member_size, member_hash, encoding = header.decode().split()
+            member_size = int(member_size)
+            if encoding not in ("identity", "deflate") or (encoding == "deflate" and deflate is None):
+                return "Unsupported encoding", 415
+            filename = "uploads/inventory.json" if fileid == "-1" else f"uploads/{fileid}"
+            upload_hash = await receive_stream(request.stream, member_size, filename, encoding == "deflate")
+            size -= member_size
+            if upload_hash != member_hash:
+                if file_exists(filename):
+                    os.remove(filename)
+                return f"File hash does not match for {fileid}", 400
+            received_hashes[filename] = upload_hash
+    except ValueError:
+        return "Invalid bundle", 400
+    finally:
+        status_led.stop_activity()
+    return None, 204
+
+
 @server.post("/ota/commit")
 async def commit_update(request):
     """Commit the update specified by the uploads/inventory.json."""
@@ -156,6 +556,15 @@ async def commit_update(request):
                 status_led.start_activity()
                 if file_exists(entry["filename"]):
                     os.remove(entry["filename"])
+                # Remove the other variant of a module, as source files take precedence over .mpy files on import
+                if entry["filename"].endswith(".mpy"):
+                    variant = f"{entry['filename'][:-4]}.py"
+                elif entry["filename"].endswith(".py"):
+                    variant = f"{entry['filename'][:-3]}.mpy"
+                else:
+                    variant = None
+                if variant is not None and file_exists(variant):
+                    os.remove(variant)
                 makedirs(entry["filename"].split("/")[:-1])
                 os.rename(f"uploads/{entry['fileid']}", entry["filename"])
             except Exception as e:
@@ -163,6 +572,8 @@ async def commit_update(request):
             finally:
                 status_led.stop_activity()
         rmtree("uploads")
+        received_hashes.clear()
+        partial_hashes.clear()
         return None, 204
     else:
         return None, 404
@@ -173,4 +584,6 @@ def rollback_update(request):
     """Rollback any existing, partial OTA update."""
     if is_dir("uploads"):
         rmtree("uploads")
+    received_hashes.clear()
+    partial_hashes.clear()
     return None, 204
@@ -2,13 +2,15 @@
 
 from typing import Literal
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class DeviceModel(BaseModel):
     type: Literal["generic"] | Literal["enviro"] = "generic"
     name: str
     domain: str
+    state_flush_interval: int = Field(30, ge=1)
+    queue_len: int = Field(8, ge=1)
 
 
 class MQTTModel(BaseModel):
@@ -1,8 +1,17 @@
 """Utility functions."""
 
+import os
 import re
+from pathlib import Path
 
 
 def slugify(name: str) -> str:
     """Turn the name into a valid slug"""
     return re.sub("[^a-z0-9]", "-", name.lower())
+
+
+def get_cache_dir() -> Path:
+    """Return the directory used to cache build artifacts, creating it if needed."""
+    cache_dir = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "mqtt-house"
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return cache_dir
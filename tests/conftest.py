@@ -0,0 +1,16 @@
+"""Shared test fixtures."""
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """Use a temporary directory for all cached build artifacts."""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    return tmp_path / "cache"
+
+
+@pytest.fixture(autouse=True)
+def no_mqtt(monkeypatch):
+    """Never connect to an MQTT broker, so that devices are always polled after a reset."""
+    monkeypatch.setattr("mqtt_house.lib.announce.aiomqtt", None)
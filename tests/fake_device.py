@@ -0,0 +1,187 @@
+"""A fake device that emulates the OTA server running on the microcontroller."""
+
+import asyncio
+import json
+import zlib
+from hashlib import sha256
+
+from httpx import AsyncClient, ConnectError, MockTransport, ReadError, Request, Response
+
+from mqtt_house.__about__ import __version__
+
+
+class FakeDevice:
+    """Emulates the OTA endpoints of a single device, storing files in memory.
+
+    The values in `interruptions` apply to the ranged uploads in turn. A number interrupts the upload after receiving
+    that many bytes, while None lets the upload complete. After a reset, the device keeps reporting its previous
+    boot id for `boot_delay` requests. Each request takes `latency` seconds, during which the device keeps serving
+    other requests, and the highest number of requests served at the same time is tracked in `max_in_flight`.
+    Connecting fails for the requests to the paths in `unreachable`.
+    """
+
+    def __init__(
+        self,
+        version: str = __version__,
+        *,
+        manifest: bool = True,
+        deflate: bool = True,
+        bundle: bool = True,
+        resume: bool = True,
+        interruptions: list[int | None] | None = None,
+        boot_delay: int = 0,
+        latency: float = 0,
+        unreachable: tuple[str, ...] = (),
+    ) -> None:
+        self.version = version
+        self.manifest = manifest
+        self.deflate = deflate
+        self.bundle = bundle
+        self.resume = resume
+        self.interruptions = list(interruptions or [])
+        self.boot_delay = boot_delay
+        self.latency = latency
+        self.unreachable = unreachable
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.boot_id = 0
+        self.booting = 0
+        self.files = {}
+        self.uploads = {}
+        self.partial_uploads = {}
+        self.received = []
+        self.requests = []
+        self.stats = {}
+
+    def receive(self, fileid: str, data: bytes) -> None:
+        """Store a completely received upload."""
+        self.uploads[fileid] = data
+        self.received.append(fileid)
+
+    def handle_partial(self, request: Request) -> Response:
+        """Handle the upload of a byte range of a file."""
+        fileid = request.headers["X-Fileid"]
+        filehash = request.headers["X-Filehash"]
+        encoding = request.headers.get("Content-Encoding", "identity")
+        content_range, total = request.headers["Content-Range"].removeprefix("bytes ").split("/")
+        start = int(content_range.split("-")[0])
+        if start == 0:
+            self.uploads.pop(fileid, None)
+            self.partial_uploads[fileid] = (filehash, encoding, b"")
+        elif self.partial_uploads.get(fileid, (None, None, b""))[:2] != (filehash, encoding):
+            return Response(416)
+        data = self.partial_uploads[fileid][2]
+        if start != len(data):
+            return Response(416)
+        content = request.read()
+        interruption = self.interruptions.pop(0) if self.interruptions else None
+        if interruption is not None:
+            content = content[:interruption]
+            self.partial_uploads[fileid] = (filehash, encoding, data + content)
+            msg = "Connection lost"
+            raise ReadError(msg)
+        data = data + content
+        if len(data) < int(total):
+            self.partial_uploads[fileid] = (filehash, encoding, data)
+            return Response(204)
+        del self.partial_uploads[fileid]
+        if encoding == "deflate":
+            data = zlib.decompress(data)
+        if sha256(data).hexdigest() != filehash:
+            return Response(400)
+        self.receive(fileid, data)
+        return Response(204)
+
+    def handle(self, request: Request) -> Response:
+        """Handle a single request to the device."""
+        self.requests.append((request.method, request.url.path))
+        if request.method == "GET" and request.url.path == "/ota/about":
+            features = [feature for feature in ("bundle", "deflate", "resume") if getattr(self, feature)]
+            if self.booting > 0:
+                self.booting -= 1
+                boot_id = self.boot_id - 1
+            else:
+                boot_id = self.boot_id
+            fingerprint = self.files["fingerprint.txt"].decode() if "fingerprint.txt" in self.files else None
+            return Response(
+                200,
+                json={
+                    "version": self.version,
+                    "features": features,
+                    "boot_id": str(boot_id),
+                    "fingerprint": fingerprint,
+                },
+            )
+        elif request.method == "GET" and request.url.path == "/ota/uploads" and self.resume:
+            uploads = {
+                fileid: {"size": len(data), "hash": sha256(data).hexdigest(), "complete": True}
+                for fileid, data in self.uploads.items()
+            }
+            for fileid, (filehash, encoding, data) in self.partial_uploads.items():
+                uploads[fileid] = {"size": len(data), "hash": filehash, "encoding": encoding}
+            return Response(200, json=uploads)
+        elif request.method == "PUT" and request.url.path == "/ota/file" and "Content-Range" in request.headers:
+            return self.handle_partial(request)
+        elif request.method == "GET" and request.url.path == "/ota/stats":
+            return Response(200, json=self.stats)
+        elif request.method == "GET" and request.url.path == "/ota/manifest" and self.manifest:
+            return Response(200, json={filename: sha256(data).hexdigest() for filename, data in self.files.items()})
+        elif request.method == "POST" and request.url.path == "/ota/rollback":
+            self.uploads = {}
+            return Response(204)
+        elif request.method == "PUT" and request.url.path in ("/ota/inventory", "/ota/file"):
+            data = request.read()
+            if request.headers.get("Content-Encoding") == "deflate":
+                if not self.deflate:
+                    return Response(415)
+                data = zlib.decompress(data)
+            if sha256(data).hexdigest() != request.headers["X-Filehash"]:
+                return Response(400)
+            self.receive("-1" if request.url.path == "/ota/inventory" else request.headers["X-Fileid"], data)
+            return Response(204)
+        elif request.method == "PUT" and request.url.path == "/ota/bundle" and self.bundle:
+            data = request.read()
+            while data:
+                header, data = data.split(b"\n", 1)
+                fileid, size, filehash, encoding = header.decode().split()
+                member, data = data[: int(size)], data[int(size) :]
+                if encoding == "deflate":
+                    member = zlib.decompress(member)
+                if sha256(member).hexdigest() != filehash:
+                    return Response(400)
+                self.receive(fileid, member)
+            return Response(204)
+        elif request.method == "POST" and request.url.path == "/ota/commit":
+            if "-1" not in self.uploads:
+                return Response(404)
+            for entry in json.loads(self.uploads["-1"]):
+                self.files[entry["filename"]] = self.uploads[entry["fileid"]]
+            self.uploads = {}
+            return Response(204)
+        elif request.method == "POST" and request.url.path == "/ota/reset":
+            self.boot_id += 1
+            self.booting = self.boot_delay
+            return Response(202)
+        return Response(404)
+
+
+def fake_client(devices: dict[str, FakeDevice]) -> AsyncClient:
+    """Create a client that routes requests to the fake devices by hostname."""
+
+    async def handler(request: Request) -> Response:
+        if request.url.host not in devices:
+            return Response(404)
+        device = devices[request.url.host]
+        if request.url.path in device.unreachable:
+            msg = "Connection refused"
+            raise ConnectError(msg, request=request)
+        await request.aread()
+        device.in_flight += 1
+        device.max_in_flight = max(device.max_in_flight, device.in_flight)
+        try:
+            await asyncio.sleep(device.latency)
+            return device.handle(request)
+        finally:
+            device.in_flight -= 1
+
+    return AsyncClient(transport=MockTransport(handler))
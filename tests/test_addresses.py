@@ -0,0 +1,93 @@
+"""Test the address book of the devices."""
+
+import asyncio
+
+import pytest
+from httpx import AsyncClient, ConnectError, MockTransport, Request, Response
+
+from mqtt_house.lib import addresses
+from mqtt_house.lib.addresses import AddressBook, AddressBookTransport, get_address_book
+from mqtt_house.lib.announce import BootWatcher
+from mqtt_house.settings import MQTTModel
+
+
+@pytest.fixture
+def resolved(monkeypatch):
+    """Resolve every host name to 10.0.0.1, recording the names that were resolved."""
+    names = []
+
+    async def resolve_address(host: str, port: int) -> str:  # noqa: ARG001
+        names.append(host)
+        return "10.0.0.1"
+
+    monkeypatch.setattr(addresses, "resolve_address", resolve_address)
+    return names
+
+
+def test_address_book_expires(tmp_path, monkeypatch):
+    """Test that addresses are persisted, only apply to their own host name, and expire."""
+    monkeypatch.setattr(addresses, "time", lambda: 1000)
+    book = AddressBook(tmp_path / "addresses.json", ttl=60)
+    book.put("device.local", "10.0.0.1")
+    book.put("www", "10.0.0.2")
+    book = AddressBook(tmp_path / "addresses.json", ttl=60)
+    assert book.get("device.local") == "10.0.0.1"
+    assert book.get("www.example.com") is None
+    assert book.get("unknown.local") is None
+    monkeypatch.setattr(addresses, "time", lambda: 1061)
+    assert book.get("device.local") is None
+
+
+def test_transport_uses_address_book(resolved):
+    """Test that host names are resolved once, requests keep their Host header, and stale addresses are retried."""
+    requests = []
+    failures = []
+
+    def handler(request: Request) -> Response:
+        requests.append((request.url.host, request.headers["Host"]))
+        if failures:
+            failures.pop()
+            msg = "Connection refused"
+            raise ConnectError(msg)
+        return Response(200)
+
+    async def run():
+        async with AsyncClient(transport=AddressBookTransport(MockTransport(handler))) as client:
+            await client.get("http://device.local/ota/about")
+            # The stored address fails, so the name is resolved again and the request retried
+            failures.append(True)
+            await client.get("http://device.local/ota/about")
+            # The freshly resolved address fails as well
+            failures.extend([True, True])
+            with pytest.raises(ConnectError):
+                await client.get("http://device.local/ota/about")
+            await client.get("http://127.0.0.1/ota/about")
+
+    asyncio.run(run())
+    assert requests == [("10.0.0.1", "device.local")] * 5 + [("127.0.0.1", "127.0.0.1")]
+    assert resolved == ["device.local"] * 3
+    assert get_address_book().get("device.local") is None
+
+
+def test_announced_address(resolved):
+    """Test that the address in a device's boot announcement is used without resolving its name."""
+    watcher = BootWatcher(MQTTModel(server="mqtt.local", user="user", password="password"), ["local"])
+    watcher.handle("mqtt-house/device/booted", b'{"version": "1.0.0", "boot_id": "abc", "ip": "10.0.0.7"}')
+    assert get_address_book().get("device.local") == "10.0.0.7"
+
+    async def run():
+        transport = AddressBookTransport(MockTransport(lambda request: Response(200, text=request.url.host)))
+        async with AsyncClient(transport=transport) as client:
+            return (await client.get("http://device.local/ota/about")).text
+
+    assert asyncio.run(run()) == "10.0.0.7"
+    assert resolved == []
+
+
+def test_retained_announcement_address_is_ignored():
+    """Test that the address in a retained, possibly outdated, boot announcement is not stored."""
+    watcher = BootWatcher(MQTTModel(server="mqtt.local", user="user", password="password"), ["local"])
+    watcher.handle(
+        "mqtt-house/device/booted", b'{"version": "1.0.0", "boot_id": "abc", "ip": "10.0.0.7"}', retained=True
+    )
+    assert get_address_book().get("device.local") is None
@@ -0,0 +1,61 @@
+"""Test watching the boot announcements of devices."""
+
+import asyncio
+import json
+
+from mqtt_house.lib.announce import BootWatcher
+
+from .test_fleet import make_config
+
+
+def test_wait_for_new_boot():
+    """Test that waiting ignores the announcement of the previous boot and returns that of the new boot."""
+
+    async def run():
+        async with BootWatcher(make_config("Device").mqtt) as watcher:
+            assert not watcher.available
+            watcher.handle("mqtt-house/device/booted", json.dumps({"version": "1.0.0", "boot_id": "old"}).encode())
+            waiting = asyncio.create_task(watcher.wait("device", "old", timeout=5))
+            await asyncio.sleep(0)
+            assert not waiting.done()
+            watcher.handle("mqtt-house/other/booted", json.dumps({"version": "1.0.0", "boot_id": "new"}).encode())
+            watcher.handle("mqtt-house/device/booted", json.dumps({"version": "1.0.1", "boot_id": "new"}).encode())
+            return await waiting
+
+    assert asyncio.run(run()) == {"version": "1.0.1", "boot_id": "new"}
+
+
+def test_wait_timeout():
+    """Test that waiting returns None if the device does not announce a new boot."""
+
+    async def run():
+        watcher = BootWatcher(make_config("Device").mqtt)
+        watcher.handle("mqtt-house/device/booted", json.dumps({"version": "1.0.0", "boot_id": "old"}).encode())
+        return await watcher.wait("device", "old", timeout=0.01)
+
+    assert asyncio.run(run()) is None
+
+
+def test_ignore_invalid_announcements():
+    """Test that announcements that are not JSON objects are ignored."""
+
+    async def run():
+        watcher = BootWatcher(make_config("Device").mqtt)
+        watcher.handle("mqtt-house/device/booted", b"not json")
+        watcher.handle("mqtt-house/device/booted", b'["version", "1.0.0"]')
+        return await watcher.wait("device", "old", timeout=0.01)
+
+    assert asyncio.run(run()) is None
+
+
+def test_ignore_retained_announcements():
+    """Test that a replayed retained announcement of an earlier boot is not taken as the device's new boot."""
+
+    async def run():
+        watcher = BootWatcher(make_config("Device").mqtt)
+        watcher.handle(
+            "mqtt-house/device/booted", json.dumps({"version": "1.0.0", "boot_id": "older"}).encode(), retained=True
+        )
+        return await watcher.wait("device", "current", timeout=0.01)
+
+    assert asyncio.run(run()) is None
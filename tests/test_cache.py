@@ -0,0 +1,48 @@
+"""Test the build cache."""
+
+import os
+
+from mqtt_house.lib.cache import BuildCache, get_build_cache
+
+
+def test_get_or_build_builds_once(tmp_path):
+    """Test that artifacts are only built once, also across cache instances."""
+    builds = []
+
+    def build():
+        builds.append(1)
+        return b"artifact"
+
+    key = BuildCache.key("test", b"source")
+    assert BuildCache(tmp_path).get_or_build(key, build) == b"artifact"
+    assert BuildCache(tmp_path).get_or_build(key, build) == b"artifact"
+    assert len(builds) == 1
+
+
+def test_failed_builds_are_not_cached(tmp_path):
+    """Test that a build returning None is not stored."""
+    cache = BuildCache(tmp_path)
+    key = BuildCache.key("test")
+    assert cache.get_or_build(key, lambda: None) is None
+    assert cache.get_or_build(key, lambda: b"artifact") == b"artifact"
+
+
+def test_evicts_least_recently_used(tmp_path):
+    """Test that the least recently used artifacts are evicted once the cache is full."""
+    cache = BuildCache(tmp_path, max_size=20)
+    keys = [BuildCache.key(str(idx)) for idx in range(3)]
+    cache.put(keys[0], b"0" * 8)
+    cache.put(keys[1], b"1" * 8)
+    os.utime(tmp_path / keys[0][:2] / keys[0], (0, 0))
+    os.utime(tmp_path / keys[1][:2] / keys[1], (1, 1))
+    cache.put(keys[2], b"2" * 8)
+    assert BuildCache(tmp_path).get(keys[0]) is None
+    assert BuildCache(tmp_path).get(keys[1]) == b"1" * 8
+    assert BuildCache(tmp_path).get(keys[2]) == b"2" * 8
+
+
+def test_shared_cache_location(cache_dir):
+    """Test that the shared cache is stored in the user's cache directory."""
+    assert get_build_cache() is get_build_cache()
+    get_build_cache().put(BuildCache.key("test"), b"artifact")
+    assert len(list((cache_dir / "mqtt-house" / "build").glob("*/*"))) == 1
@@ -4,6 +4,10 @@ from typer.testing import CliRunner
 
 from mqtt_house.__about__ import __version__
 from mqtt_house.cli import app
+from mqtt_house.cli import device as device_cli
+from mqtt_house.lib.ota import TransferStats
+
+from .test_fleet import make_config
 
 runner = CliRunner()
 
@@ -19,3 +23,18 @@ def test_version():
     result = runner.invoke(app, ["version"])
     assert result.exit_code == 0
     assert __version__ in result.stdout
+
+
+def test_ota_update_already_up_to_date(tmp_path, monkeypatch):
+    """Test that updating a device that already runs the build only reports that it is up to date."""
+
+    async def update_device(*args: object, **kwargs: object) -> TransferStats:  # noqa: ARG001
+        return TransferStats(up_to_date=True)
+
+    monkeypatch.setattr(device_cli, "update_device", update_device)
+    config_file = tmp_path / "device.yaml"
+    config_file.write_text(make_config("Device").model_dump_json())
+    result = runner.invoke(app, ["device", "ota-update", str(config_file)])
+    assert result.exit_code == 0
+    assert "already up to date" in result.stdout
+    assert "has been updated" not in result.stdout
@@ -0,0 +1,95 @@
+"""Test the fleet OTA functionality."""
+
+import asyncio
+from time import monotonic
+
+from rich.progress import Progress
+
+from mqtt_house.lib.fleet import load_configs, reset_fleet, update_fleet
+from mqtt_house.settings import ConfigModel
+
+from .fake_device import FakeDevice, fake_client
+
+
+def make_config(name: str) -> ConfigModel:
+    """Create a minimal configuration for the given device name."""
+    return ConfigModel(
+        device={"name": name, "domain": "local"},
+        mqtt={"server": "mqtt.local", "user": "user", "password": "password"},
+        wifi={"ssid": "ssid", "password": "password"},
+        entities=[],
+    )
+
+
+def test_update_fleet_concurrently():
+    """Test that all devices are updated and that the resets overlap."""
+    devices = {f"device-{idx}.local": FakeDevice() for idx in range(4)}
+    configs = [make_config(f"Device {idx}") for idx in range(4)]
+
+    async def run():
+        async with fake_client(devices) as client:
+            with Progress(disable=True) as progress:
+                return await update_fleet(configs, client, progress, concurrency=4)
+
+    start = monotonic()
+    failures = asyncio.run(run())
+    assert failures == {}
+    assert monotonic() - start < 3
+    for device in devices.values():
+        assert "main.py" in device.files
+        assert "config.json" in device.files
+
+
+def test_update_fleet_reports_failures():
+    """Test that a failing device does not stop the other devices from being updated."""
+    devices = {"device-0.local": FakeDevice(), "device-1.local": FakeDevice(version="1.0.0")}
+    configs = [make_config("Device 0"), make_config("Device 1")]
+
+    async def run():
+        async with fake_client(devices) as client:
+            with Progress(disable=True) as progress:
+                return await update_fleet(configs, client, progress, concurrency=1)
+
+    failures = asyncio.run(run())
+    assert list(failures.keys()) == ["Device 1"]
+    assert "main.py" in devices["device-0.local"].files
+
+
+def test_update_fleet_survives_transport_errors():
+    """Test that a device that cannot be reached during its reset is reported without stopping the fleet."""
+    devices = {"device-0.local": FakeDevice(unreachable=("/ota/reset",)), "device-1.local": FakeDevice()}
+    configs = [make_config("Device 0"), make_config("Device 1")]
+
+    async def run():
+        async with fake_client(devices) as client:
+            with Progress(disable=True) as progress:
+                return await update_fleet(configs, client, progress)
+
+    failures = asyncio.run(run())
+    assert list(failures.keys()) == ["Device 0"]
+    assert "could not be reached" in failures["Device 0"]
+    assert "main.py" in devices["device-1.local"].files
+
+
+def test_reset_fleet():
+    """Test that all devices are reset and that each device is done once it reports a new boot."""
+    devices = {"device-0.local": FakeDevice(), "device-1.local": FakeDevice(boot_delay=1)}
+    configs = [make_config("Device 0"), make_config("Device 1")]
+
+    async def run():
+        async with fake_client(devices) as client:
+            with Progress(disable=True) as progress:
+                return await reset_fleet(configs, client, progress)
+
+    assert asyncio.run(run()) == {}
+    assert devices["device-0.local"].requests.count(("GET", "/ota/about")) == 2
+    assert devices["device-1.local"].requests.count(("GET", "/ota/about")) == 3
+
+
+def test_load_configs_from_directory(tmp_path):
+    """Test that configuration directories are expanded."""
+    for idx in range(2):
+        (tmp_path / f"device-{idx}.yaml").write_text(make_config(f"Device {idx}").model_dump_json())
+    (tmp_path / "README.md").write_text("Not a config")
+    configs = load_configs([tmp_path])
+    assert [config.device.name for config in configs] == ["Device 0", "Device 1"]
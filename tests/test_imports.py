@@ -0,0 +1,54 @@
+"""Test the resolution of the modules that the device code imports."""
+
+import sys
+
+from mqtt_house.lib.imports import resolve_imports
+
+
+def test_entity_closure():
+    """Test that entities only get the modules that they actually use."""
+    ltr559 = resolve_imports("mqtt_house.micro", {"mqtt_house.entity.luminosity.ltr559": {"Illuminance"}})
+    assert "mqtt_house/sensors.py" in ltr559
+    assert "bme280_float.py" not in ltr559
+    bme280 = resolve_imports("mqtt_house.micro", {"mqtt_house.entity.temperature.bme280": {"Temperature"}})
+    assert "bme280_float.py" in bme280
+    assert "mqtt_house/entity/__init__.py" in bme280
+    assert "mqtt_house/entity/temperature/__init__.py" in bme280
+
+
+def test_import_rules(tmp_path, monkeypatch):
+    """Test which imports are followed."""
+    package = tmp_path / "closure_test"
+    (package / "sub").mkdir(parents=True)
+    (package / "__init__.py").write_text("")
+    (package / "sub" / "__init__.py").write_text("")
+    (package / "main.py").write_text(
+        "import firmware\n"
+        "from sub.used import helper\n"
+        "try:\n"
+        "    import sub.optional\n"
+        "except ImportError:\n"
+        "    pass\n"
+        "if firmware.flag:\n"
+        "    import sub.conditional\n"
+        "def run():\n"
+        "    from sub import unused\n"
+        "    from sub import lazy\n"
+        "    return helper(lazy)\n"
+    )
+    (package / "sub" / "used.py").write_text(
+        "def helper(value):\n    return value\n\ndef other():\n    from sub.expensive import value\n    return value\n"
+    )
+    for name in ("optional", "conditional", "unused", "lazy", "expensive"):
+        (package / "sub" / f"{name}.py").write_text("")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    try:
+        assert resolve_imports("closure_test", {"main": None}) == [
+            "main.py",
+            "sub/__init__.py",
+            "sub/lazy.py",
+            "sub/optional.py",
+            "sub/used.py",
+        ]
+    finally:
+        sys.modules.pop("closure_test", None)
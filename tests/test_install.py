@@ -0,0 +1,136 @@
+"""Test installing to a board via its raw REPL."""
+
+from contextlib import ExitStack
+from time import monotonic, sleep
+from types import SimpleNamespace
+
+import pytest
+from rich.progress import Progress
+
+from mqtt_house.lib import install as install_module
+from mqtt_house.lib.fake_board import FakeBoard
+from mqtt_house.lib.install import get_board_name, get_boards, install, install_boards
+from mqtt_house.lib.ota import prepare_update
+from mqtt_house.lib.repl import RawREPL, RawREPLError
+
+from .test_fleet import make_config
+
+
+@pytest.fixture
+def root(tmp_path):
+    """Return an empty directory for the board's filesystem, separate from the build cache."""
+    (tmp_path / "board").mkdir()
+    return tmp_path / "board"
+
+
+@pytest.mark.parametrize("raw_paste", [True, False])
+def test_exec(root, raw_paste):
+    """Test that code runs on the board with and without raw-paste support."""
+    with FakeBoard(root, raw_paste=raw_paste, window_size=16) as board, RawREPL(board.port, timeout=2) as repl:
+        assert repl.exec("print('a' * 100)").strip() == b"a" * 100
+        assert repl.eval("1 + 1") == "2"
+        with pytest.raises(RawREPLError, match="ZeroDivisionError"):
+            repl.exec("1 / 0")
+
+
+def test_write_file(root):
+    """Test that large files are written in several executions, and directories are created."""
+    data = bytes(range(256)) * 40
+    with FakeBoard(root) as board, RawREPL(board.port, timeout=2) as repl:
+        repl.write_file("a/b/c.bin", data)
+        repl.write_file("a/d.bin", b"")
+        assert board.executions > 1
+    assert board.files() == {"a/b/c.bin": data, "a/d.bin": b""}
+
+
+@pytest.mark.parametrize("full", [True, False])
+def test_install(root, full):
+    """Test that installing removes old files and writes all files in a single session."""
+    (root / "old").mkdir()
+    (root / "old" / "file.py").write_text("old")
+    (root / "main.py").write_text("old")
+    (root / "lib").write_text("a file in place of a directory")
+    config = make_config("Device")
+    with FakeBoard(root) as board, Progress(disable=True) as progress:
+        install(config, progress, board.port, full=full)
+    _, files = prepare_update(config)
+    assert board.files() == {file["filename"]: file["data"] for file in files}
+    assert not (root / "old").exists()
+
+
+def test_install_changed_files(root):
+    """Test that only stale files are removed and only changed files are written."""
+    _, files = prepare_update(make_config("Device"))
+    with FakeBoard(root) as board, Progress(disable=True) as progress:
+        install(make_config("Device"), progress, board.port)
+        (root / "stale.py").write_text("stale")
+        (root / "main.py").write_text("changed")
+        board.executions = 0
+        install(make_config("Device"), progress, board.port)
+        # One execution to fetch the hashes, one to remove the stale file, and one to write the changed file
+        assert board.executions == 3
+        board.executions = 0
+        install(make_config("Device"), progress, board.port)
+        assert board.executions == 1
+    assert board.files() == {file["filename"]: file["data"] for file in files}
+
+
+def test_install_boards(tmp_path, monkeypatch):
+    """Test that boards are installed concurrently and that each configuration is only prepared once."""
+    builds = []
+
+    def counting_prepare_update(config, **kwargs):
+        builds.append(config.device.name)
+        return prepare_update(config, **kwargs)
+
+    monkeypatch.setattr(install_module, "prepare_update", counting_prepare_update)
+    configs = [make_config("Device 1"), make_config("Device 1"), make_config("Device 1"), make_config("Device 2")]
+    with ExitStack() as stack:
+        boards = []
+        for idx in range(len(configs)):
+            (tmp_path / str(idx)).mkdir()
+            boards.append(stack.enter_context(FakeBoard(tmp_path / str(idx), latency=0.05)))
+        progress = stack.enter_context(Progress(disable=True))
+        start = monotonic()
+        failures = install_boards(
+            [*zip(configs, [board.port for board in boards]), (configs[0], str(tmp_path / "missing"))], progress
+        )
+        duration = monotonic() - start
+    assert list(failures) == [str(tmp_path / "missing")]
+    assert builds == ["Device 1", "Device 2"]
+    # The boards are installed concurrently, so together they take about as long as a single board
+    assert duration < boards[0].executions * 0.05 * 2
+    for config, board in zip(configs, boards):
+        _, files = prepare_update(config)
+        assert board.files() == {file["filename"]: file["data"] for file in files}
+
+
+def test_get_boards(monkeypatch):
+    """Test that only serial ports with the MicroPython USB ids are listed."""
+    ports = [
+        SimpleNamespace(device="/dev/ttyACM1", vid=0x2E8A, pid=0x0005),
+        SimpleNamespace(device="/dev/ttyUSB0", vid=0x10C4, pid=0xEA60),
+        SimpleNamespace(device="/dev/ttyS0", vid=None, pid=None),
+        SimpleNamespace(device="/dev/ttyACM0", vid=0x2E8A, pid=0x0005),
+    ]
+    monkeypatch.setattr(install_module, "comports", lambda: ports)
+    assert get_boards() == ["/dev/ttyACM0", "/dev/ttyACM1"]
+
+
+def test_get_board_name(root, monkeypatch):
+    """Test that the board name is probed once, and that the board is soft reset afterwards."""
+    monkeypatch.setattr(install_module, "_board_names", {})
+    with FakeBoard(root) as board:
+        assert get_board_name(board.port) == "Fake board with RP2040"
+        deadline = monotonic() + 1
+        while board.soft_resets == 0 and monotonic() < deadline:
+            sleep(0.01)
+        assert board.soft_resets == 1
+        with Progress(disable=True) as progress:
+            install(make_config("Device"), progress, board.port)
+        monkeypatch.setattr(install_module, "_board_names", {})
+        assert get_board_name(board.port) == "Device"
+        executions = board.executions
+        assert get_board_name(board.port) == "Device"
+        assert board.executions == executions
+    assert get_board_name(str(root / "missing")) is None
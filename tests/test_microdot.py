@@ -0,0 +1,123 @@
+"""Test the persistent connection handling of the vendored microdot server."""
+
+import asyncio
+from collections.abc import Awaitable, Callable
+
+from httpx import AsyncClient
+
+from mqtt_house.lib.ota import ConnectionCounter, create_client
+from mqtt_house.micro.microdot import Microdot, Request
+
+
+def create_app() -> Microdot:
+    """Create a microdot application with a few test routes."""
+    app = Microdot()
+
+    @app.get("/hello")
+    async def hello(_request):
+        return "Hello"
+
+    @app.post("/close")
+    async def close(_request):
+        return None, 202, {"Connection": "close"}
+
+    @app.put("/read")
+    async def read(request):
+        size = 0
+        chunk = await request.stream.read(1024)
+        while chunk:
+            size += len(chunk)
+            chunk = await request.stream.read(1024)
+        return {"size": size}
+
+    @app.put("/ignore")
+    async def ignore(_request):
+        return None, 204
+
+    return app
+
+
+def count_connections(app: Microdot, run: Callable[[AsyncClient, str], Awaitable[None]]) -> int:
+    """Run the requests against the application and return the number of connections the client opened."""
+
+    async def main():
+        server = asyncio.create_task(app.start_server(host="127.0.0.1", port=0))
+        while app.server is None:
+            await asyncio.sleep(0.01)
+        host = f"http://127.0.0.1:{app.server.sockets[0].getsockname()[1]}"
+        try:
+            async with create_client() as client:
+                with ConnectionCounter(client, host) as connections:
+                    await run(client, host)
+        finally:
+            app.shutdown()
+            await server
+        return connections.count
+
+    return asyncio.run(main())
+
+
+def test_keep_alive():
+    """Test that consecutive requests reuse a single connection."""
+
+    async def run(client, host):
+        for _ in range(5):
+            response = await client.get(f"{host}/hello")
+            assert response.text == "Hello"
+            assert response.http_version == "HTTP/1.1"
+            assert response.headers["Connection"] == "keep-alive"
+
+    assert count_connections(create_app(), run) == 1
+
+
+def test_max_keep_alive_requests():
+    """Test that connections are closed after the maximum number of requests."""
+    app = create_app()
+    app.max_keep_alive_requests = 2
+
+    async def run(client, host):
+        for _ in range(5):
+            assert (await client.get(f"{host}/hello")).status_code == 200
+
+    assert count_connections(app, run) == 3
+
+
+def test_keep_alive_timeout():
+    """Test that idle connections are closed by the server."""
+    app = create_app()
+    app.keep_alive_timeout = 0.1
+
+    async def run(client, host):
+        assert (await client.get(f"{host}/hello")).status_code == 200
+        await asyncio.sleep(0.3)
+        assert (await client.get(f"{host}/hello")).status_code == 200
+
+    assert count_connections(app, run) == 2
+
+
+def test_connection_close_response():
+    """Test that the connection is closed if the response asks for it."""
+
+    async def run(client, host):
+        response = await client.post(f"{host}/close")
+        assert response.status_code == 202
+        assert response.headers["Connection"] == "close"
+        assert (await client.get(f"{host}/hello")).status_code == 200
+
+    assert count_connections(create_app(), run) == 2
+
+
+def test_streamed_body(monkeypatch):
+    """Test that a connection is only reused if a streamed request body has been read completely."""
+    monkeypatch.setattr(Request, "max_content_length", 64 * 1024)
+    data = b"x" * (Request.max_body_length + 1)
+
+    async def run(client, host):
+        response = await client.put(f"{host}/read", content=data)
+        assert response.json() == {"size": len(data)}
+        assert (await client.get(f"{host}/hello")).status_code == 200
+        response = await client.put(f"{host}/ignore", content=data)
+        assert response.headers["Connection"] == "close"
+        assert (await client.get(f"{host}/hello")).status_code == 200
+
+    assert count_connections(create_app(), run) == 2
@@ -0,0 +1,58 @@
+"""Test the source minimiser."""
+
+import ast
+from importlib import resources
+
+import pytest
+
+from mqtt_house.lib.minimise import minimise_file
+
+
+class StripStringStatements(ast.NodeTransformer):
+    """Removes string literal statements, such as docstrings, as the minimiser does."""
+
+    def generic_visit(self, node):
+        node = super().generic_visit(node)
+        for field in ("body", "orelse", "finalbody"):
+            body = getattr(node, field, None)
+            if isinstance(body, list) and body and isinstance(body[0], ast.stmt):
+                stripped = [
+                    stmt
+                    for stmt in body
+                    if not (
+                        isinstance(stmt, ast.Expr)
+                        and isinstance(stmt.value, ast.Constant)
+                        and isinstance(stmt.value.value, str)
+                    )
+                ]
+                setattr(node, field, stripped or ([ast.Pass()] if not isinstance(node, ast.Module) else []))
+        return node
+
+
+def micro_files() -> list[str]:
+    """Return the paths of all Python files shipped to the microcontroller."""
+    base_path = resources.files("mqtt_house.micro")
+    return sorted(str(path.relative_to(base_path)) for path in base_path.rglob("*.py"))
+
+
+@pytest.mark.parametrize("filename", micro_files())
+def test_minimised_files_are_equivalent(filename):
+    """Test that minimising the micro files does not change their syntax tree, apart from removed docstrings."""
+    source = (resources.files("mqtt_house.micro") / filename).read_bytes()
+    minimised = minimise_file(source)
+    assert len(minimised) < len(source) or len(source) == 0
+    assert ast.dump(StripStringStatements().visit(ast.parse(source))) == ast.dump(ast.parse(minimised))
+
+
+def test_minimise_strips_comments_and_docstrings():
+    """Test that trailing comments and docstrings that do not start a line are removed."""
+    source = b'''"""Module."""
+def test(a, b):  # A trailing comment
+    x = "a # string"  # Comment
+    """A docstring that does not start the body."""
+    return (a +
+            b)
+class Empty:
+    """Only a docstring."""
+'''
+    assert minimise_file(source) == b'def test(a,b):\n x="a # string"\n return(a+b)\nclass Empty:\n pass\n'
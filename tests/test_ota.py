@@ -0,0 +1,315 @@
+"""Test the OTA update functionality."""
+
+import asyncio
+from shutil import which
+
+import pytest
+from rich.progress import Progress
+
+from mqtt_house.lib import mpy, ota
+from mqtt_house.lib.ota import OTAError, TransferStats, prepare_update, update_device
+from mqtt_house.settings import EntityModel
+
+from .fake_device import FakeDevice, fake_client
+from .test_fleet import make_config
+
+
+def run_update(device: FakeDevice, **kwargs) -> TransferStats:
+    """Run a single OTA update against the fake device."""
+
+    async def run():
+        async with fake_client({"device.local": device}) as client:
+            with Progress(disable=True) as progress:
+                return await update_device(make_config("Device"), client, progress, **kwargs)
+
+    return asyncio.run(run())
+
+
+def uploaded_files(device: FakeDevice) -> list[str]:
+    """Return the fileids of all files uploaded to the device, excluding the inventory."""
+    return [fileid for fileid in device.received if fileid != "-1"]
+
+
+def test_bundle_update():
+    """Test that the bundle upload results in the same files as individual uploads."""
+    bundle_device = FakeDevice()
+    run_update(bundle_device)
+    assert [path for method, path in bundle_device.requests if method == "PUT"] == ["/ota/bundle"]
+    file_device = FakeDevice(bundle=False)
+    run_update(file_device)
+    assert bundle_device.files == file_device.files
+
+
+def test_concurrent_file_uploads():
+    """Test that the files are uploaded over several streams, after the inventory, with the same result."""
+    device = FakeDevice(bundle=False, latency=0.01)
+    run_update(device, streams=3)
+    assert device.max_in_flight == 3
+    assert device.received[0] == "-1"
+    reference = FakeDevice(bundle=False)
+    run_update(reference)
+    assert reference.max_in_flight == 1
+    assert device.files == reference.files
+
+
+def test_delta_update_uploads_only_changed_files():
+    """Test that a second update only uploads files that differ from those on the device."""
+    device = FakeDevice(bundle=False)
+    run_update(device)
+    assert len(uploaded_files(device)) > 0
+    device.files["main.py"] = b"outdated"
+    device.files["fingerprint.txt"] = b"outdated"
+    device.received = []
+    run_update(device)
+    # The changed file and the new fingerprint
+    assert len(uploaded_files(device)) == 2
+    assert device.files["main.py"] != b"outdated"
+
+
+def test_full_update_without_manifest():
+    """Test that all files are uploaded if the device cannot report its installed files."""
+    device = FakeDevice(manifest=False, bundle=False)
+    run_update(device)
+    count = len(uploaded_files(device))
+    device.files["fingerprint.txt"] = b"outdated"
+    device.received = []
+    run_update(device)
+    assert len(uploaded_files(device)) == count
+
+
+def test_forced_full_update():
+    """Test that all files are uploaded when a full update is requested."""
+    device = FakeDevice(bundle=False)
+    run_update(device)
+    count = len(uploaded_files(device))
+    device.received = []
+    run_update(device, full=True)
+    assert len(uploaded_files(device)) == count
+
+
+def test_up_to_date_device_is_skipped():
+    """Test that nothing is uploaded and the device is not reset if it already runs the build."""
+    device = FakeDevice()
+    run_update(device)
+    _, files = prepare_update(make_config("Device"))
+    assert device.files["fingerprint.txt"] == files[-1]["data"]
+    device.requests = []
+    stats = run_update(device)
+    assert stats.up_to_date
+    assert stats.summary().startswith("Already up to date")
+    assert device.requests == [("GET", "/ota/about")]
+
+
+def test_prepare_update_entity_modules():
+    """Test that each module is shipped once, with a fileid that does not depend on the other files."""
+    config = make_config("Device")
+    inventory, files = prepare_update(config)
+    fileids = {item["filename"]: item["fileid"] for item in inventory}
+    config.entities = [
+        EntityModel(name=name, cls=cls, options={})
+        for name, cls in (
+            ("Temperature", "mqtt_house.entity.temperature.bme280.Temperature"),
+            ("Humidity", "mqtt_house.entity.humidity.BME280Humidity"),
+            ("Illuminance", "mqtt_house.entity.luminosity.ltr559.Illuminance"),
+        )
+    ]
+    inventory, files = prepare_update(config)
+    filenames = [item["filename"] for item in files]
+    assert len(filenames) == len(set(filenames))
+    assert len({item["fileid"] for item in inventory}) == len(inventory)
+    assert filenames.count("bme280_float.py") == 1
+    assert "mqtt_house/entity/luminosity/ltr559.py" in filenames
+    assert filenames[-1] == "fingerprint.txt"
+    assert all(item["fileid"] == fileids[item["filename"]] for item in inventory if item["filename"] in fileids)
+
+
+def test_compressed_update():
+    """Test that compressed uploads transfer fewer bytes and are stored uncompressed."""
+    compressed_device = FakeDevice(bundle=False)
+    compressed = run_update(compressed_device)
+    plain_device = FakeDevice(deflate=False, bundle=False)
+    plain = run_update(plain_device)
+    assert compressed.size == plain.size
+    assert compressed.transferred < plain.transferred
+    assert plain.saved == 0
+    assert compressed_device.files == plain_device.files
+
+
+@pytest.mark.skipif(which("mpy-cross") is None, reason="mpy-cross is not installed")
+def test_prepare_update_with_mpy():
+    """Test that modules are compiled to .mpy files, except for main.py."""
+    _, files = prepare_update(make_config("Device"), mpy_version="6.3")
+    filenames = [item["filename"] for item in files]
+    assert "main.py" in filenames
+    assert "microdot.mpy" in filenames
+    assert "microdot.py" not in filenames
+    assert all(item["data"].startswith(b"M") for item in files if item["filename"].endswith(".mpy"))
+
+
+def test_prepare_update_mpy_fallback(monkeypatch):
+    """Test that source files are shipped if mpy-cross is not available."""
+    monkeypatch.setattr(mpy, "which", lambda _: None)
+    _, files = prepare_update(make_config("Device"), mpy_version="6.3")
+    assert not any(item["filename"].endswith(".mpy") for item in files)
+
+
+def test_mpy_cache_depends_on_mpy_cross_version(monkeypatch):
+    """Test that compiled modules are only reused for the same mpy-cross and bytecode versions."""
+    compiled = []
+    version = "MicroPython v1.22.0; mpy-cross emitting mpy v6.2"
+
+    def run_mpy_cross(mpy_cross: str, filename: str, data: bytes, bytecode_version: str) -> bytes:  # noqa: ARG001
+        compiled.append(bytecode_version)
+        return b"M" + data
+
+    monkeypatch.setattr(mpy, "which", lambda _: "/usr/bin/mpy-cross")
+    monkeypatch.setattr(mpy, "mpy_cross_version", lambda _: version)
+    monkeypatch.setattr(mpy, "_run_mpy_cross", run_mpy_cross)
+    mpy.compile_module("module.py", b"x = 1", "6.2")
+    mpy.compile_module("module.py", b"x = 1", "6.2")
+    mpy.compile_module("module.py", b"x = 1", "6.3")
+    assert compiled == ["6.2", "6.3"]
+    version = "MicroPython v1.23.0; mpy-cross emitting mpy v6.3"
+    mpy.compile_module("module.py", b"x = 1", "6.2")
+    assert compiled == ["6.2", "6.3", "6.2"]
+
+
+def test_transfer_summary_connections():
+    """Test that the number of connections is included in the transfer summary, if it is known."""
+    assert "connection" not in TransferStats(size=100, transferred=50, duration=1).summary()
+    assert TransferStats(connections=1).summary() == "No files needed uploading using 1 connection"
+    assert TransferStats(size=100, transferred=50, duration=1, connections=3).summary().endswith("using 3 connections")
+
+
+def test_interrupted_upload_resumes(monkeypatch):
+    """Test that interrupted uploads are resumed from where the device's data ends."""
+    monkeypatch.setattr(ota, "UPLOAD_BACKOFF", 0)
+    reference = FakeDevice(bundle=False)
+    run_update(reference)
+    device = FakeDevice(bundle=False, interruptions=[100, 50])
+    run_update(device)
+    assert device.files == reference.files
+    assert ("POST", "/ota/rollback") not in device.requests
+    assert device.partial_uploads == {}
+
+
+def test_update_resumes_after_failure(monkeypatch):
+    """Test that running the update again after too many interruptions keeps the uploads already received."""
+    monkeypatch.setattr(ota, "UPLOAD_BACKOFF", 0)
+    device = FakeDevice(bundle=False, interruptions=[None, None, *[10] * (ota.UPLOAD_RETRIES + 1)])
+    with pytest.raises(OTAError):
+        run_update(device)
+    received = set(device.received)
+    assert len(received) == 2
+    assert len(device.partial_uploads) == 1
+    device.received = []
+    run_update(device)
+    assert received.isdisjoint(device.received)
+    reference = FakeDevice(bundle=False)
+    run_update(reference)
+    assert device.files == reference.files
+
+
+def test_reset_waits_for_new_boot(monkeypatch):
+    """Test that polling only ends once the device reports a new boot id."""
+    monkeypatch.setattr(ota, "RESET_POLL_DELAY", 0.01)
+    device = FakeDevice(boot_delay=3)
+
+    async def run():
+        async with fake_client({"device.local": device}) as client:
+            with Progress(disable=True) as progress:
+                await ota.reset(make_config("Device"), client, progress)
+
+    asyncio.run(run())
+    reset_index = device.requests.index(("POST", "/ota/reset"))
+    assert device.requests[reset_index + 1 :] == [("GET", "/ota/about")] * 4
+
+
+def test_reset_uses_boot_announcement():
+    """Test that the device is not polled if its boot announcement can be watched."""
+    device = FakeDevice()
+
+    class Watcher:
+        available = True
+
+        async def wait(self, identifier: str, previous_boot_id: str, timeout: float) -> dict | None:  # noqa: ARG002
+            assert identifier == "device"
+            assert previous_boot_id == "0"
+            return {"version": device.version, "boot_id": "1"}
+
+    async def run():
+        async with fake_client({"device.local": device}) as client:
+            with Progress(disable=True) as progress:
+                await ota.reset(make_config("Device"), client, progress, watcher=Watcher())
+
+    asyncio.run(run())
+    assert device.requests[-1] == ("POST", "/ota/reset")
+
+
+def test_reset_polls_if_not_announced(monkeypatch):
+    """Test that the device is also polled if it does not announce its new boot on MQTT."""
+    monkeypatch.setattr(ota, "RESET_WATCH_TIMEOUT", 0.05)
+    monkeypatch.setattr(ota, "RESET_POLL_DELAY", 0.01)
+    device = FakeDevice()
+
+    class Watcher:
+        available = True
+
+        async def wait(self, identifier: str, previous_boot_id: str, timeout: float) -> dict | None:  # noqa: ARG002
+            await asyncio.sleep(min(timeout, 0.01))
+            return None
+
+    async def run():
+        async with fake_client({"device.local": device}) as client:
+            with Progress(disable=True) as progress:
+                await ota.reset(make_config("Device"), client, progress, watcher=Watcher())
+
+    asyncio.run(run())
+    assert device.requests[-1] == ("GET", "/ota/about")
+
+
+def test_reset_does_not_wait_for_broker(monkeypatch):
+    """Test that the reset is requested while the boot watcher is still connecting to the broker."""
+    monkeypatch.setattr(ota, "RESET_POLL_DELAY", 0.01)
+    device = FakeDevice()
+    events = []
+
+    class Watcher:
+        available = False
+
+        def __init__(self, *args: object) -> None:
+            pass
+
+        async def __aenter__(self) -> "Watcher":
+            await asyncio.sleep(0.2)
+            events.append("connected after reset" if ("POST", "/ota/reset") in device.requests else "connected")
+            return self
+
+        async def __aexit__(self, *args: object) -> None:
+            events.append("closed")
+
+    async def run():
+        async with fake_client({"device.local": device}) as client:
+            with Progress(disable=True) as progress:
+                await ota.reset(make_config("Device"), client, progress)
+                events.append("reset")
+
+    monkeypatch.setattr(ota, "BootWatcher", Watcher)
+    asyncio.run(run())
+    assert events == ["connected after reset", "closed", "reset"]
+    # The device was polled while the watcher was connecting
+    assert device.requests[-1] == ("GET", "/ota/about")
+
+
+def test_get_device_stats():
+    """Test that the device's runtime statistics are retrieved and that unreachable devices raise an error."""
+    device = FakeDevice()
+    device.stats = {"queue": {"size": 8, "length": 0, "high_water": 3, "discards": 1, "priority_discards": 0}}
+
+    async def run(devices: dict[str, FakeDevice]) -> dict:
+        async with fake_client(devices) as client:
+            return await ota.get_device_stats(make_config("Device"), client)
+
+    assert asyncio.run(run({"device.local": device})) == device.stats
+    with pytest.raises(OTAError):
+        asyncio.run(run({}))
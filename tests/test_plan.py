@@ -0,0 +1,79 @@
+"""Test planning OTA updates."""
+
+import asyncio
+
+from rich.progress import Progress
+
+from mqtt_house.lib import plan
+from mqtt_house.lib.ota import update_device
+from mqtt_house.lib.plan import UpdatePlan, plan_device
+from mqtt_house.lib.throughput import HISTORY_SIZE, get_throughput, load_history, record_throughput
+
+from .fake_device import FakeDevice, fake_client
+from .test_fleet import make_config
+
+
+def run_plan(devices: dict[str, FakeDevice], **kwargs) -> UpdatePlan:
+    """Plan the update of the device called "Device"."""
+
+    async def run():
+        async with fake_client(devices) as client:
+            return await plan_device(make_config("Device"), client, **kwargs)
+
+    return asyncio.run(run())
+
+
+def test_record_throughput():
+    """Test that only the most recent uploads with data are kept for each device."""
+    assert get_throughput("Device") is None
+    record_throughput("Device", 0, 1)
+    assert get_throughput("Device") is None
+    for _ in range(HISTORY_SIZE + 2):
+        record_throughput("Device", 1000, 2)
+    record_throughput("Other device", 3000, 1)
+    assert len(load_history()["device"]) == HISTORY_SIZE
+    assert get_throughput("Device") == 500
+    assert get_throughput() == (HISTORY_SIZE * 1000 + 3000) / (HISTORY_SIZE * 2 + 1)
+
+
+def test_plan_unreachable_device():
+    """Test that a full update is planned for a device that cannot be reached."""
+    result = run_plan({})
+    assert not result.reachable
+    assert result.files > 0
+    assert 0 < result.transferred < result.size
+    assert result.duration is None
+    assert result.heap > 0
+    assert result.flash > 0
+    assert result.warnings == []
+
+
+def test_plan_uses_measured_throughput():
+    """Test that the update records the throughput and that the plan only includes the changed files."""
+    device = FakeDevice(bundle=False)
+
+    async def run():
+        async with fake_client({"device.local": device}) as client:
+            with Progress(disable=True) as progress:
+                await update_device(make_config("Device"), client, progress)
+
+    asyncio.run(run())
+    assert get_throughput("Device") is not None
+    result = run_plan({"device.local": device})
+    assert result.up_to_date
+    assert result.files == 0
+    device.files["main.py"] = b"outdated"
+    device.files["fingerprint.txt"] = b"outdated"
+    result = run_plan({"device.local": device})
+    assert not result.up_to_date
+    assert result.files == 2
+    assert result.measured
+    assert result.duration == result.transferred / get_throughput("Device")
+
+
+def test_plan_warns_about_memory(monkeypatch):
+    """Test that the plan warns if the device is expected to run out of flash or heap."""
+    monkeypatch.setattr(plan, "FLASH_SIZE", 8192)
+    monkeypatch.setattr(plan, "HEAP_SIZE", 1024)
+    result = run_plan({})
+    assert len(result.warnings) == 2
@@ -0,0 +1,124 @@
+"""Test pruning the vendored libraries."""
+
+import asyncio
+import sys
+from shutil import which
+from types import ModuleType
+
+import pytest
+from httpx import AsyncClient
+
+from mqtt_house.lib.ota import module_sources, prepare_update
+from mqtt_house.lib.prune import prune_module, prune_modules, prune_report
+
+from .test_fleet import make_config
+
+
+def test_target_constants():
+    """Test that the branches for other platforms and MQTT versions are removed."""
+    source = (
+        b"ESP32 = platform == 'esp32'\n"
+        b"RP2 = platform == 'rp2'\n"
+        b"if ESP32:\n"
+        b"    ERRORS = [1]\n"
+        b"elif RP2:\n"
+        b"    ERRORS = [2]\n"
+        b"else:\n"
+        b"    ERRORS = [3]\n"
+        b"def run(mqttv5, size):\n"
+        b"    if mqttv5:\n"
+        b"        return None\n"
+        b"    if not mqttv5 and size != 2:\n"
+        b"        return 5 if mqttv5 else 4\n"
+        b"    return ERRORS\n"
+    )
+    pruned = prune_module("mqtt_as.py", source, {"run"}).decode()
+    assert "ESP32" not in pruned
+    assert "mqttv5:" not in pruned
+    assert "ERRORS = [2]" in pruned
+    assert "if size != 2:" in pruned
+    assert "return 4" in pruned
+
+
+def test_unused_code():
+    """Test that only the code that is used by the module or the other modules is kept."""
+    source = (
+        b"import os\n"
+        b"LIMIT = 10\n"
+        b"UNUSED = 20\n"
+        b"def helper():\n"
+        b"    return LIMIT\n"
+        b"def first():\n"
+        b"    return second()\n"
+        b"def second():\n"
+        b"    return first()\n"
+        b"class Base:\n"
+        b"    def __init__(self):\n"
+        b"        self.value = helper()\n"
+        b"class Server(Base):\n"
+        b"    def route(self):\n"
+        b"        return self._match()\n"
+        b"    def _match(self):\n"
+        b"        return 'has_' + 'attr'\n"
+        b"    def redirect(self):\n"
+        b"        return None\n"
+        b"    @property\n"
+        b"    def cookies(self):\n"
+        b"        return {}\n"
+        b"class Unused:\n"
+        b"    pass\n"
+        b"@register\n"
+        b"def decorated():\n"
+        b"    pass\n"
+    )
+    pruned = prune_module("microdot.py", source, {"Server", "route"}).decode()
+    for kept in ("import os", "LIMIT", "def helper", "class Base", "class Server", "def _match", "def decorated"):
+        assert kept in pruned
+    for removed in ("UNUSED", "def first", "def second", "def redirect", "def cookies", "class Unused"):
+        assert removed not in pruned
+
+
+def test_pruned_microdot_serves_requests():
+    """Test that the pruned microdot still runs the routes that the device uses."""
+    sources = prune_modules(module_sources(make_config("Device")))
+    assert len(sources["microdot.py"]) < len(module_sources(make_config("Device"))["microdot.py"])
+    microdot = ModuleType("pruned_microdot")
+    exec(compile(sources["microdot.py"], "microdot.py", "exec"), microdot.__dict__)  # noqa: S102
+    app = microdot.Microdot()
+
+    @app.get("/ota/about")
+    async def about(_request):
+        return {"version": "1"}
+
+    @app.put("/ota/file")
+    async def upload(request):
+        return {"size": len(await request.stream.read(1024))}
+
+    async def main():
+        server = asyncio.create_task(app.start_server(host="127.0.0.1", port=0))
+        while app.server is None:
+            await asyncio.sleep(0.01)
+        host = f"http://127.0.0.1:{app.server.sockets[0].getsockname()[1]}"
+        try:
+            async with AsyncClient() as client:
+                assert (await client.get(f"{host}/ota/about")).json() == {"version": "1"}
+                assert (await client.put(f"{host}/ota/file", content=b"x" * 100)).json() == {"size": 100}
+                assert (await client.get(f"{host}/missing")).status_code == 404
+        finally:
+            app.shutdown()
+            await server
+
+    asyncio.run(main())
+    sys.modules.pop("pruned_microdot", None)
+
+
+@pytest.mark.skipif(which("mpy-cross") is None, reason="mpy-cross is not installed")
+def test_prune_report():
+    """Test that the pruned modules compile, and that pruning shrinks the shipped and compiled modules."""
+    _, files = prepare_update(make_config("Device"), mpy_version="6.3", prune=True)
+    assert {"microdot.mpy", "mqtt_as.mpy"} <= {item["filename"] for item in files}
+    report = prune_report(module_sources(make_config("Device")), mpy_version="6.3")
+    assert [stats.filename for stats in report] == ["microdot.py", "mqtt_as.py"]
+    for stats in report:
+        assert stats.removed > 0
+        assert stats.ram_saved > 0
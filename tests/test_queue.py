@@ -0,0 +1,76 @@
+"""Test the prioritised queue of inbound MQTT messages on the device."""
+
+import asyncio
+
+from mqtt_house.micro.mqtt_house.queue import PriorityMsgQueue
+
+
+def drain(queue: PriorityMsgQueue, count: int) -> list[bytes]:
+    """Take `count` messages from the queue, returning their topics."""
+
+    async def run():
+        return [(await queue.__anext__())[0] for _ in range(count)]
+
+    return asyncio.run(run())
+
+
+def test_commands_are_handled_first():
+    """Test that commands are taken ahead of other messages, and that each lane keeps its order."""
+    queue = PriorityMsgQueue(8)
+    queue.put(b"homeassistant/status", b"online", False)
+    queue.put(b"device/light/set", b"{}", False)
+    queue.put(b"device/other/state", b"{}", False)
+    queue.put(b"device/switch/set", b"{}", False)
+    assert drain(queue, 4) == [
+        b"device/light/set",
+        b"device/switch/set",
+        b"homeassistant/status",
+        b"device/other/state",
+    ]
+    assert queue.stats()["length"] == 0
+
+
+def test_commands_replace_other_messages():
+    """Test that a command discards the oldest other message, rather than another command, when the queue is full."""
+    queue = PriorityMsgQueue(3)
+    queue.put(b"homeassistant/status", b"online", False)
+    queue.put(b"device/light/set", b"{}", False)
+    queue.put(b"device/other/state", b"{}", False)
+    queue.put(b"device/switch/set", b"{}", False)
+    assert queue.stats() == {"size": 3, "length": 3, "high_water": 3, "discards": 1, "priority_discards": 0}
+    assert drain(queue, 3) == [b"device/light/set", b"device/switch/set", b"device/other/state"]
+
+
+def test_other_messages_never_replace_commands():
+    """Test that other messages are dropped when the queue is full of commands."""
+    queue = PriorityMsgQueue(2)
+    queue.put(b"device/light/set", b"{}", False)
+    queue.put(b"homeassistant/status", b"online", False)
+    # Replaces the status message
+    queue.put(b"device/switch/set", b"{}", False)
+    # Dropped, as the queue only holds commands
+    queue.put(b"homeassistant/status", b"online", False)
+    assert queue.stats()["discards"] == 2
+    assert queue.stats()["priority_discards"] == 0
+    assert drain(queue, 2) == [b"device/light/set", b"device/switch/set"]
+
+
+def test_commands_replace_the_oldest_command():
+    """Test that a command only discards the oldest command if the queue holds nothing else."""
+    queue = PriorityMsgQueue(2)
+    for name in (b"first", b"second", b"third"):
+        queue.put(b"device/" + name + b"/set", b"{}", False)
+    assert queue.stats() == {"size": 2, "length": 2, "high_water": 2, "discards": 1, "priority_discards": 1}
+    assert drain(queue, 2) == [b"device/second/set", b"device/third/set"]
+
+
+def test_high_water_mark():
+    """Test that the high-water mark keeps the largest number of queued messages."""
+    queue = PriorityMsgQueue(8)
+    for _ in range(3):
+        queue.put(b"device/light/set", b"{}", False)
+    drain(queue, 3)
+    queue.put(b"homeassistant/status", b"online", False)
+    assert queue.stats()["length"] == 1
+    assert queue.stats()["high_water"] == 3
+    assert queue.stats()["discards"] == 0
@@ -0,0 +1,127 @@
+"""Test the scheduler that runs the periodic measurements on the device."""
+
+import asyncio
+import importlib
+import time
+
+import pytest
+
+#: The period of MicroPython's tick counter on the Raspberry Pi Pico.
+TICKS_PERIOD = 2**30
+
+
+class Clock:
+    """A millisecond tick counter that wraps around like MicroPython's and only advances when it is told to."""
+
+    def __init__(self, start: int) -> None:
+        self.now = start
+        self.wakeups = []
+        self.until = None
+
+    def ticks_ms(self) -> int:
+        return self.now
+
+    def ticks_add(self, ticks: int, delta: int) -> int:
+        return (ticks + delta) % TICKS_PERIOD
+
+    def ticks_diff(self, end: int, start: int) -> int:
+        return (end - start + TICKS_PERIOD // 2) % TICKS_PERIOD - TICKS_PERIOD // 2
+
+    def advance(self, delta: int) -> None:
+        self.now = self.ticks_add(self.now, delta)
+
+    async def wait_for_ms(self, awaitable, timeout: int) -> None:
+        """Sleep for the timeout, stopping the scheduler once the clock has reached `until`."""
+        awaitable.close()
+        self.advance(timeout)
+        if self.ticks_diff(self.now, self.until) > 0:
+            raise asyncio.CancelledError
+        self.wakeups.append(self.now)
+        raise asyncio.TimeoutError
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replace the tick functions with a clock that starts shortly before the tick counter wraps around."""
+    clock = Clock(TICKS_PERIOD - 1500)
+    for name in ("ticks_ms", "ticks_add", "ticks_diff"):
+        monkeypatch.setattr(time, name, getattr(clock, name), raising=False)
+    monkeypatch.setattr(asyncio, "wait_for_ms", clock.wait_for_ms, raising=False)
+    scheduler = importlib.import_module("mqtt_house.micro.mqtt_house.scheduler")
+    for name in ("ticks_ms", "ticks_add", "ticks_diff"):
+        monkeypatch.setattr(scheduler, name, getattr(clock, name))
+    return clock
+
+
+def run_jobs(clock: Clock, duration: int, jobs: list[tuple[float, int]]) -> list[list[int]]:
+    """Run the jobs for `duration` milliseconds, returning the times since the start at which each job ran.
+
+    Each job is given as its interval, the time each run takes, and optionally a job that its first run adds after
+    the given delay.
+    """
+    scheduler = importlib.import_module("mqtt_house.micro.mqtt_house.scheduler").Scheduler()
+    start = clock.now
+    clock.until = clock.ticks_add(start, duration)
+    calls = []
+
+    def add(interval: float, cost: int, then: tuple[int, float, int] | None = None) -> None:
+        calls.append([])
+        idx = len(calls) - 1
+
+        async def job():
+            calls[idx].append(clock.ticks_diff(clock.now, start))
+            clock.advance(cost)
+            if then is not None and len(calls[idx]) == 1:
+                clock.advance(then[0])
+                add(*then[1:])
+
+        scheduler.add(interval, job)
+
+    async def run():
+        for job in jobs:
+            add(*job)
+        with pytest.raises(asyncio.CancelledError):
+            await scheduler._task
+
+    asyncio.run(run())
+    return calls
+
+
+def test_jobs_share_slots(clock):
+    """Test that jobs that are due at the same time run in a single wake-up, on the grid of the first job."""
+    calls = run_jobs(clock, 1200, [(0.2, 0), (0.3, 0, (130, 0.4, 0))])
+    assert calls[0] == [0, 200, 400, 600, 800, 1000, 1200]
+    assert calls[1] == [0, 300, 600, 900, 1200]
+    # Added between two slots, so it starts at once and then stays on the grid of the other jobs
+    assert calls[2] == [130, 500, 900]
+    # One wake-up per distinct time, apart from the start and the job that was added while the jobs ran
+    assert len(clock.wakeups) == len({call for job in calls for call in job}) - 2
+
+
+def test_jobs_do_not_drift(clock):
+    """Test that the time a job takes to run does not delay its later runs, across the tick counter wrapping."""
+    calls = run_jobs(clock, 5000, [(1, 30)])
+    assert calls[0] == [0, 1000, 2000, 3000, 4000, 5000]
+    assert clock.now < 5100
+
+
+def test_missed_slots_are_skipped(clock):
+    """Test that a job that overruns its interval skips the missed slots, rather than running repeatedly to catch up."""
+    costs = iter([0, 2500, 0, 0])
+    scheduler_module = importlib.import_module("mqtt_house.micro.mqtt_house.scheduler")
+    scheduler = scheduler_module.Scheduler()
+    start = clock.now
+    clock.until = clock.ticks_add(start, 5000)
+    calls = []
+
+    async def job():
+        calls.append(clock.ticks_diff(clock.now, start))
+        clock.advance(next(costs))
+
+    async def run():
+        scheduler.add(1, job)
+        with pytest.raises(asyncio.CancelledError):
+            await scheduler._task
+
+    asyncio.run(run())
+    assert calls == [0, 1000, 4000, 5000]
@@ -0,0 +1,14 @@
+"""Test the configuration file models."""
+
+import pytest
+from pydantic import ValidationError
+
+from mqtt_house.settings import DeviceModel
+
+
+@pytest.mark.parametrize("option", ["queue_len", "state_flush_interval"])
+def test_device_options_must_be_positive(option):
+    """Test that the inbound queue length and the state flush interval must be at least one."""
+    assert getattr(DeviceModel(name="Device", domain="local", **{option: 1}), option) == 1
+    with pytest.raises(ValidationError):
+        DeviceModel(name="Device", domain="local", **{option: 0})
@@ -0,0 +1,101 @@
+"""Test the persistent entity state on the device."""
+
+import asyncio
+import json
+import os
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from mqtt_house.micro.mqtt_house.state import StateStore
+
+
+@pytest.fixture
+def renames(monkeypatch):
+    """Record the files that are renamed."""
+    calls = []
+    rename = os.rename
+
+    def record(source: str, target: str) -> None:
+        calls.append((Path(source).name, Path(target).name))
+        rename(source, target)
+
+    monkeypatch.setattr(os, "rename", record)
+    return calls
+
+
+@pytest.fixture
+def ota_server(monkeypatch):
+    """Import the OTA server with the firmware's machine module replaced, returning the module."""
+
+    class Pin:
+        OUT = 1
+
+        def __init__(self, *args: object) -> None:
+            pass
+
+        def value(self, *args: object) -> None:
+            pass
+
+    monkeypatch.setitem(sys.modules, "machine", SimpleNamespace(Pin=Pin, reset=lambda: None))
+    monkeypatch.syspath_prepend(str(Path(__file__).parent.parent / "mqtt_house" / "micro"))
+    try:
+        import ota_server  # noqa: PLC0415
+
+        yield ota_server
+    finally:
+        for name in ("ota_server", "microdot", "status_led"):
+            sys.modules.pop(name, None)
+
+
+def test_flush_writes_persisted_states(tmp_path, renames):
+    """Test that only the persisted states are written, via a temporary file, and only when they have changed."""
+    filename = tmp_path / "state.json"
+    filename.write_text(json.dumps({"light": {"state": "ON"}, "temperature": 21}))
+    store = StateStore(str(filename))
+    assert store.state == {"light": {"state": "ON"}, "temperature": 21}
+    # Not dirty, so nothing is written
+    store.flush()
+    assert renames == []
+    store.exclude("temperature")
+    store.set("humidity", 50, persist=False)
+    store.set("switch", {"state": "OFF"})
+    store.flush()
+    assert renames == [("state.json.tmp", "state.json")]
+    assert json.loads(filename.read_text()) == {"light": {"state": "ON"}, "switch": {"state": "OFF"}}
+    assert store.state["humidity"] == 50
+    # Changing a state that is not persisted does not mark the store dirty
+    store.set("humidity", 55, persist=False)
+    store.flush()
+    # Setting a persisted state to the same value does not write the unchanged content
+    store.set("switch", {"state": "OFF"})
+    store.flush()
+    assert len(renames) == 1
+    assert not (tmp_path / "state.json.tmp").exists()
+
+
+def test_run_flushes_periodically(tmp_path):
+    """Test that the background task writes the changed states."""
+    filename = tmp_path / "state.json"
+    store = StateStore(str(filename), flush_interval=0.01)
+
+    async def run():
+        task = asyncio.create_task(store.run())
+        store.set("light", {"state": "ON"})
+        await asyncio.sleep(0.05)
+        task.cancel()
+
+    asyncio.run(run())
+    assert json.loads(filename.read_text()) == {"light": {"state": "ON"}}
+
+
+def test_reset_hook_flushes(tmp_path, ota_server, monkeypatch):
+    """Test that the flush registered as a reset hook writes the states before the device resets."""
+    filename = tmp_path / "state.json"
+    store = StateStore(str(filename))
+    monkeypatch.setattr(ota_server, "reset_hooks", [lambda: 1 / 0, store.flush])
+    store.set("light", {"state": "ON"})
+    ota_server.run_reset_hooks()
+    assert json.loads(filename.read_text()) == {"light": {"state": "ON"}}
@@ -0,0 +1,57 @@
+"""Test finding the handlers of the MQTT topics that the device subscribes to."""
+
+from mqtt_house.micro.mqtt_house.topics import TopicIndex
+
+
+def light(topic: str, message: dict) -> None:
+    """Handle a message to the light."""
+
+
+def switch(topic: str, message: dict) -> None:
+    """Handle a message to any switch."""
+
+
+def test_exact_topic():
+    """Test that a topic without wildcards is found by the topic as received."""
+    index = TopicIndex()
+    index.add("homeassistant/light/device/light/set", light)
+    assert index.find(b"homeassistant/light/device/light/set") == (light, "homeassistant/light/device/light/set")
+
+
+def test_wildcard_topic():
+    """Test that a single-level wildcard matches exactly one level of the topic."""
+    index = TopicIndex()
+    index.add("homeassistant/switch/device/+/set", switch)
+    assert index.find(b"homeassistant/switch/device/relay/set") == (switch, "homeassistant/switch/device/relay/set")
+    assert index.find(b"homeassistant/switch/device//set") == (switch, "homeassistant/switch/device//set")
+    assert index.find(b"homeassistant/switch/device/relay/other/set") is None
+    assert index.find(b"homeassistant/switch/device/set") is None
+
+
+def test_unknown_topic():
+    """Test that topics without a handler are not found."""
+    index = TopicIndex()
+    index.add("homeassistant/light/device/light/set", light)
+    index.add("homeassistant/switch/device/+/set", switch)
+    assert index.find(b"homeassistant/light/device/light/state") is None
+    assert index.find(b"homeassistant/light/other/light/set") is None
+
+
+def test_topic_added_again():
+    """Test that adding a topic again on re-discovery replaces its handler, rather than adding a second one."""
+    index = TopicIndex()
+    index.add("homeassistant/light/device/light/set", switch)
+    index.add("homeassistant/light/device/light/set", light)
+    index.add("homeassistant/switch/device/+/set", light)
+    index.add("homeassistant/switch/device/+/set", switch)
+    assert index.find(b"homeassistant/light/device/light/set")[0] is light
+    assert index.find(b"homeassistant/switch/device/relay/set")[0] is switch
+    assert len(index._wildcard_handlers) == 1
+
+
+def test_status_topic():
+    """Test that the status topic, which the device subscribes to without a handler, matches no entity's handler."""
+    index = TopicIndex()
+    index.add("homeassistant/light/device/light/set", light)
+    index.add("homeassistant/+/set", switch)
+    assert index.find(b"homeassistant/status") is None